@@ -1,4 +1,6 @@
+import os
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from flask_login import LoginManager
 from app.database import init_db, mongo
 from app.models.usuario import Usuario
@@ -21,6 +23,15 @@ def create_app(config):
     app.config.from_object(config)
     init_db(app)
 
+    # Plantillas ya compiladas: los workers nuevos no vuelven a compilarlas
+    directorio_bytecode = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if directorio_bytecode:
+        try:
+            os.makedirs(directorio_bytecode, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directorio_bytecode, 'veloce-%s.cache')
+        except OSError as e:
+            app.logger.warning(f"No se pudo usar la caché de bytecode de Jinja en {directorio_bytecode}: {e}")
+
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
@@ -47,11 +58,30 @@ def create_app(config):
     from app.utils.date_util import to_local
     app.jinja_env.filters['local_datetime'] = to_local
 
+    from app.utils.pagination_util import cursor_url
+    app.jinja_env.globals['cursor_url'] = cursor_url
+
+    from app.cli import veloce_cli
+    app.cli.add_command(veloce_cli)
+
+    # Índices declarados en app/database/indexes.py (idempotente)
+    if app.config.get('MONGO_ENSURE_INDEXES'):
+        from app.database.indexes import ensure_indexes
+        with app.app_context():
+            try:
+                _, errores = ensure_indexes()
+                for coleccion, nombre, mensaje in errores:
+                    app.logger.warning(f"No se pudo aplicar el índice {coleccion}.{nombre}: {mensaje}")
+            except Exception as e:
+                app.logger.error(f"Error al aplicar los índices: {e}")
+
     return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    data = mongo.db.usuarios.find_one({"_id": ObjectId(user_id)})
+    # Caché de identidad: sin consulta a MongoDB en los requests siguientes
+    from app.services.identity_services import get_usuario_data
+    data = get_usuario_data(user_id)
     if data:
         user = Usuario(
             id=data['_id'],
@@ -0,0 +1,287 @@
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from bson import ObjectId
+from flask import current_app
+from flask.cli import AppGroup
+from app.database import mongo
+from app.database.indexes import ensure_indexes, get_index_drift
+from app.services.secuencia_services import siguiente_numero
+from app.services.search_services import NGRAM_FIELDS, SEARCH_FIELDS, backfill_search_keys, benchmark_busqueda, rebuild_ngrams
+from app.services.cliente_services import benchmark_busqueda_clientes, reconstruir_resumen_clientes
+from app.services.rollup_services import reconstruir_rollups
+from app.services.dgii_services import FORMATOS_DGII, generar_formatos_lote
+from app.services.ecf_services import generar_ecf_cierre, benchmark_ecf
+from app.services.cobranza_services import ejecutar_cobranza
+from app.services.job_services import TAREAS, ErrorPermanente, run_worker, reintentar_fallidos, resumen_jobs
+from app.services.importacion_services import TIPOS_IMPORTACION, importar_archivo, benchmark_importacion_productos
+from app.services.catalogo_services import benchmark_catalogo
+
+# Comandos de mantenimiento: `flask veloce <comando>`
+veloce_cli = AppGroup('veloce', help='Comandos de mantenimiento de Veloce.')
+
+
+def _imprimir_drift(drift):
+    if not drift:
+        click.echo('Los índices coinciden con el registro declarado.')
+        return
+    for coleccion, detalle in drift.items():
+        click.echo(f'[{coleccion}]')
+        for nombre in detalle['faltantes']:
+            click.echo(f'  - faltante:  {nombre}')
+        for nombre in detalle['diferentes']:
+            click.echo(f'  ~ diferente: {nombre}')
+        for nombre in detalle['extra']:
+            click.echo(f'  + extra:     {nombre}')
+
+
+@veloce_cli.command('ensure-indexes')
+@click.option('--check', is_flag=True, help='Solo reporta las diferencias, no crea índices.')
+def ensure_indexes_command(check):
+    """Aplica los índices declarados y reporta diferencias con la base de datos."""
+    if check:
+        drift = get_index_drift()
+        _imprimir_drift(drift)
+        if drift:
+            raise SystemExit(1)
+        return
+
+    aplicados, errores = ensure_indexes()
+    for nombre in aplicados:
+        click.echo(f'OK  {nombre}')
+    for coleccion, nombre, mensaje in errores:
+        click.echo(f'ERR {coleccion}.{nombre}: {mensaje}', err=True)
+
+    _imprimir_drift(get_index_drift())
+    if errores:
+        raise SystemExit(1)
+
+
+@veloce_cli.command('check-sequence')
+@click.option('--threads', default=16, show_default=True, help='Hilos concurrentes.')
+@click.option('--count', default=500, show_default=True, help='Números a pedir por hilo.')
+@click.option('--block', default=1, show_default=True, help='Tamaño de bloque por proceso.')
+def check_sequence_command(threads, count, block):
+    """Verifica que la secuencia atómica entregue números únicos y sin huecos bajo concurrencia."""
+    app = current_app._get_current_object()
+    org_id = ObjectId()  # Organización temporal, no toca contadores reales
+    nombre = 'verificacion'
+
+    def trabajador(_):
+        with app.app_context():
+            return [siguiente_numero(org_id, nombre, bloque=block) for _ in range(count)]
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            numeros = [n for lote in pool.map(trabajador, range(threads)) for n in lote]
+    finally:
+        mongo.db.secuencias.delete_one({'_id': f"{org_id}:{nombre}"})
+
+    esperado = threads * count
+    unicos = len(set(numeros))
+    sin_huecos = sorted(numeros) == list(range(1, esperado + 1))
+    click.echo(f'Pedidos: {esperado}  Únicos: {unicos}  Sin huecos: {"sí" if sin_huecos else "no"}')
+    if unicos != esperado or not sin_huecos:
+        raise SystemExit(1)
+
+
+@veloce_cli.command('backfill-search')
+@click.option('--coleccion', type=click.Choice(sorted(SEARCH_FIELDS)), multiple=True, help='Colecciones a procesar (por defecto todas).')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--todos', is_flag=True, help='Recalcula también los documentos que ya tienen search_keys.')
+def backfill_search_command(coleccion, batch_size, todos):
+    """Calcula search_keys para los documentos existentes."""
+    for nombre in coleccion or sorted(SEARCH_FIELDS):
+        actualizados = backfill_search_keys(nombre, batch_size=batch_size, solo_faltantes=not todos)
+        click.echo(f'{nombre}: {actualizados} documentos actualizados')
+
+
+@veloce_cli.command('search-bench')
+@click.argument('organizacion_id')
+@click.argument('termino')
+@click.option('--coleccion', type=click.Choice(sorted(SEARCH_FIELDS)), default='clientes', show_default=True)
+@click.option('--repeticiones', default=20, show_default=True)
+def search_bench_command(organizacion_id, termino, coleccion, repeticiones):
+    """Compara la latencia de la búsqueda indexada contra el $regex anterior."""
+    resultado = benchmark_busqueda(coleccion, organizacion_id, termino, repeticiones=repeticiones)
+    for nombre, datos in resultado.items():
+        click.echo(f"{nombre:12} promedio {datos['promedio_ms']:.2f} ms  max {datos['max_ms']:.2f} ms  ({datos['resultados']} resultados)")
+
+
+@veloce_cli.command('rebuild-ngrams')
+@click.option('--coleccion', type=click.Choice(sorted(NGRAM_FIELDS)), default='clientes', show_default=True)
+@click.option('--org', 'organizacion_id', default=None, help='Solo esta organización (por defecto todas).')
+@click.option('--batch-size', default=1000, show_default=True)
+def rebuild_ngrams_command(coleccion, organizacion_id, batch_size):
+    """Regenera el índice de trigramas de la búsqueda difusa."""
+    procesados = rebuild_ngrams(coleccion, organizacion_id, batch_size=batch_size)
+    click.echo(f'{coleccion}: {procesados} documentos indexados')
+
+
+@veloce_cli.command('fuzzy-bench')
+@click.argument('terminos', nargs=-1, required=True)
+@click.option('--clientes', default=200000, show_default=True, help='Clientes sintéticos a cargar antes de medir.')
+@click.option('--repeticiones', default=10, show_default=True)
+@click.option('--conservar', is_flag=True, help='No elimina la organización temporal ni sus clientes al terminar.')
+def fuzzy_bench_command(terminos, clientes, repeticiones, conservar):
+    """Latencia de la búsqueda de clientes por trigramas contra la de prefijos (en una organización temporal)."""
+    resultado = benchmark_busqueda_clientes(terminos, clientes, repeticiones, conservar)
+    if conservar:
+        click.echo(f"Organización temporal: {resultado['organizacion_id']}")
+    click.echo(f"{resultado['clientes']} clientes en la organización")
+    for termino, modos in resultado['busquedas'].items():
+        for modo, datos in modos.items():
+            click.echo(f"{termino:20} {modo:10} {datos['ms']:.2f} ms  {', '.join(datos['resultados'])}")
+
+
+@veloce_cli.command('catalog-bench')
+@click.argument('organizacion_id')
+@click.argument('terminos', nargs=-1, required=True)
+@click.option('--repeticiones', default=200, show_default=True)
+def catalog_bench_command(organizacion_id, terminos, repeticiones):
+    """Carga del índice en memoria del catálogo y latencia del typeahead."""
+    resultado = benchmark_catalogo(organizacion_id, terminos, repeticiones=repeticiones)
+    click.echo(f"{resultado['productos']} productos cargados en {resultado['carga_segundos']:.2f}s")
+    for termino, datos in resultado['busquedas'].items():
+        click.echo(f"{termino:20} {datos['ms']:.3f} ms  ({datos['resultados']} resultados)")
+
+
+@veloce_cli.command('rebuild-rollups')
+@click.option('--org', 'organizaciones', multiple=True, help='Organización a reconstruir (por defecto todas).')
+@click.option('--workers', default=4, show_default=True, help='Organizaciones procesadas en paralelo.')
+def rebuild_rollups_command(organizaciones, workers):
+    """Recalcula los rollups diarios desde facturas y gastos."""
+    resultados = reconstruir_rollups(list(organizaciones), workers=workers)
+    for organizacion_id, dias in resultados.items():
+        click.echo(f'{organizacion_id}: {dias} días')
+    click.echo(f'Organizaciones procesadas: {len(resultados)}')
+
+
+@veloce_cli.command('rebuild-client-stats')
+@click.option('--org', 'organizaciones', multiple=True, help='Organización a reconstruir (por defecto todas).')
+def rebuild_client_stats_command(organizaciones):
+    """Recalcula el resumen de facturación de cada cliente desde sus facturas."""
+    organizaciones = organizaciones or [org for org in mongo.db.clientes.distinct('organizacion_id') if org]
+    for organizacion_id in organizaciones:
+        click.echo(f'{organizacion_id}: {reconstruir_resumen_clientes(organizacion_id)} clientes con facturas')
+    click.echo(f'Organizaciones procesadas: {len(organizaciones)}')
+
+
+@veloce_cli.command('dgii-export')
+@click.option('--formato', type=click.Choice(FORMATOS_DGII), required=True)
+@click.option('--anio', type=int, required=True, help='Año a generar (12 periodos).')
+@click.option('--salida', default='dgii', show_default=True, help='Directorio de salida.')
+@click.option('--org', 'organizaciones', multiple=True, help='Organización (por defecto todas).')
+def dgii_export_command(formato, anio, salida, organizaciones):
+    """Genera los formatos 606/607 de un año para todas las organizaciones."""
+    resultados = generar_formatos_lote(formato, anio, salida, list(organizaciones) or None)
+    for organizacion_id, periodo, ruta, cantidad, errores in resultados:
+        aviso = f'  ({errores} rechazados)' if errores else ''
+        click.echo(f'{organizacion_id} {periodo}: {cantidad} registros -> {ruta}{aviso}')
+
+
+@veloce_cli.command('ecf-cierre')
+@click.option('--org', 'organizacion_id', required=True, help='Organización emisora.')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), required=True)
+@click.option('--hasta', type=click.DateTime(formats=['%Y-%m-%d']), required=True, help='Último día incluido.')
+@click.option('--salida', default='ecf', show_default=True, help='Directorio de salida.')
+@click.option('--procesos', default=0, help='Procesos del pool (0 = ECF_PROCESOS / uno por CPU).')
+def ecf_cierre_command(organizacion_id, desde, hasta, salida, procesos):
+    """Asigna eNCF y genera los XML e-CF de las facturas del rango."""
+    try:
+        resultado = generar_ecf_cierre(organizacion_id, desde, hasta + timedelta(days=1), salida, procesos=procesos or None)
+    except ValueError as e:
+        click.echo(str(e), err=True)
+        raise SystemExit(1)
+    click.echo(f"{resultado['documentos']} e-CF en {resultado['segundos']:.2f} s "
+               f"({resultado['por_segundo']:.0f} documentos/s) -> {resultado['directorio']}")
+
+
+@veloce_cli.command('ecf-bench')
+@click.option('--documentos', default=5000, show_default=True)
+@click.option('--procesos', default=0, help='Procesos del pool (0 = ECF_PROCESOS / uno por CPU).')
+def ecf_bench_command(documentos, procesos):
+    """Mide documentos/s del generador e-CF y compara la salida con la muestra."""
+    resultado = benchmark_ecf(documentos, procesos=procesos or None)
+    click.echo(f"Pool ({resultado['procesos']} procesos): {resultado['documentos']} documentos en "
+               f"{resultado['segundos']:.2f} s = {resultado['por_segundo']:.0f} documentos/s")
+    click.echo(f"Un proceso, en memoria: {resultado['serie_por_segundo']:.0f} documentos/s")
+    if resultado['coincide_muestra']:
+        click.echo('Estructura idéntica a app/static/image/ecf.xml (sin firma).')
+        return
+    click.echo('La estructura difiere de la muestra:', err=True)
+    for linea in resultado['diferencias']:
+        click.echo(f'  {linea}', err=True)
+    raise SystemExit(1)
+
+
+@veloce_cli.command('worker')
+@click.option('--max-jobs', type=int, default=None, help='Termina después de N trabajos (por defecto no termina).')
+def worker_command(max_jobs):
+    """Ejecuta la cola de trabajos en este proceso (igual que `python worker.py`)."""
+    procesados = run_worker(current_app._get_current_object(), max_jobs=max_jobs)
+    click.echo(f'Trabajos procesados: {procesados}')
+
+
+@veloce_cli.command('jobs-status')
+def jobs_status_command():
+    """Cantidad de trabajos por tipo y estado."""
+    resumen = resumen_jobs()
+    if not resumen:
+        click.echo('No hay trabajos.')
+    for (tipo, estado), cantidad in sorted(resumen.items()):
+        click.echo(f'{tipo:20} {estado:12} {cantidad}')
+
+
+@veloce_cli.command('jobs-retry')
+@click.option('--id', 'job_id', default=None, help='Trabajo a reencolar.')
+@click.option('--tipo', type=click.Choice(sorted(TAREAS)), default=None)
+def jobs_retry_command(job_id, tipo):
+    """Reencola los trabajos fallidos (dead-letter)."""
+    click.echo(f'Trabajos reencolados: {reintentar_fallidos(job_id=job_id, tipo=tipo)}')
+
+
+@veloce_cli.command('cobranza')
+@click.option('--org', 'organizacion_id', required=True, help='Organización.')
+@click.option('--clave', default=None, help='Identificador de la corrida (por defecto la fecha de hoy).')
+@click.option('--workers', default=None, type=int, help='Hilos de envío (por defecto COBRANZA_WORKERS).')
+@click.option('--simular', is_flag=True, help='Renderiza los estados de cuenta sin enviarlos.')
+def cobranza_command(organizacion_id, clave, workers, simular):
+    """Envía los estados de cuenta a los clientes con facturas por cobrar."""
+    corrida = ejecutar_cobranza(organizacion_id, clave=clave, workers=workers, solo_simular=simular)
+    click.echo(f"Corrida {corrida['clave']}: {corrida['procesados']}/{corrida['total_clientes']} clientes  "
+               f"enviados {corrida['enviados']}  ya enviados {corrida['ya_enviados']}  "
+               f"sin correo {corrida['sin_correo']}  fallidos {corrida['fallidos']}")
+    if corrida['fallidos']:
+        raise SystemExit(1)
+
+
+@veloce_cli.command('importar')
+@click.option('--org', 'organizacion_id', required=True, help='Organización destino.')
+@click.option('--tipo', type=click.Choice(TIPOS_IMPORTACION), required=True)
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+def importar_command(organizacion_id, tipo, archivo):
+    """Importa un archivo CSV/XLSX en este proceso (sin pasar por la cola)."""
+    try:
+        importacion = importar_archivo(organizacion_id, tipo, archivo, usuario='cli')
+    except (ValueError, ErrorPermanente) as e:
+        click.echo(f'Error: {e}', err=True)
+        raise SystemExit(1)
+    segundos = max((importacion['finalizado_en'] - importacion['iniciado_en']).total_seconds(), 0.001)
+    click.echo(f"Importación {importacion['_id']}: {importacion['procesadas']} filas en {segundos:.1f}s "
+               f"({importacion['procesadas'] / segundos:,.0f} filas/s)  nuevas {importacion['insertadas']}  "
+               f"actualizadas {importacion['actualizadas']}  duplicadas {importacion['duplicadas']}  "
+               f"inválidas {importacion['invalidas']}  desactivadas {importacion.get('inactivas', 0)}")
+
+
+@veloce_cli.command('import-bench')
+@click.option('--filas', default=100000, show_default=True)
+@click.option('--conservar', is_flag=True, help='No elimina la organización temporal ni sus productos al terminar.')
+def import_bench_command(filas, conservar):
+    """Filas/s de la importación del catálogo (en una organización temporal): alta y actualización de precio/stock."""
+    organizacion_id, resultados = benchmark_importacion_productos(filas, conservar)
+    if conservar:
+        click.echo(f"Organización temporal: {organizacion_id}")
+    for pasada, r in resultados.items():
+        click.echo(f"{pasada:14} {r['filas']} filas en {r['segundos']}s ({r['filas_por_segundo']:,} filas/s)  "
+                   f"nuevas {r['insertadas']}  actualizadas {r['actualizadas']}  errores {r['errores']}")
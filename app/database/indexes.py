@@ -0,0 +1,155 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.database import mongo
+
+# ==========================================
+# REGISTRO DECLARATIVO DE ÍNDICES
+# ==========================================
+# Cada colección declara los índices que necesitan sus consultas.
+# Los nombres son explícitos para poder detectar diferencias (drift)
+# entre lo declarado aquí y lo que existe realmente en MongoDB.
+
+INDEXES = {
+    'facturas': [
+        # list_facturas_by_organizacion, listados y reportes por rango
+        {'name': 'org_fecha', 'keys': [('organizacion_id', ASCENDING), ('fecha_emision', DESCENDING)]},
+        # get_cuadre (cuadre de caja), KPIs y reportes que filtran por estado
+        {'name': 'org_estado_fecha', 'keys': [('organizacion_id', ASCENDING), ('estado', ASCENDING), ('fecha_emision', DESCENDING)]},
+        # list_facturas_by_cliente
+        {'name': 'cliente_fecha', 'keys': [('cliente_id', ASCENDING), ('fecha_emision', DESCENDING)]},
+        # buscar_facturas / list_facturas_by_criterio (search_services)
+        {'name': 'org_search_keys', 'keys': [('organizacion_id', ASCENDING), ('search_keys', ASCENDING)]},
+    ],
+    'productos': [
+        # list_productos_by_organizacion, búsqueda y get_producto_by_sku
+        {'name': 'org_activo_codigo', 'keys': [('organizacion_id', ASCENDING), ('activo', ASCENDING), ('codigo', ASCENDING)]},
+        # Paginación por cursor del catálogo (más recientes primero)
+        {'name': 'org_activo_id', 'keys': [('organizacion_id', ASCENDING), ('activo', ASCENDING), ('_id', DESCENDING)]},
+        # get_producto_by_sku y upserts de la importación del catálogo (sin filtrar por activo).
+        # Único: dos upserts simultáneos del mismo código no pueden crear dos productos
+        # (el segundo falla y se reporta como error de la fila). Parcial para que los
+        # productos antiguos sin código no choquen entre sí.
+        {'name': 'org_codigo_unique', 'keys': [('organizacion_id', ASCENDING), ('codigo', ASCENDING)], 'unique': True,
+         'partialFilterExpression': {'codigo': {'$type': 'string'}}},
+        # search_productos_by_nombre_codigo (search_services)
+        {'name': 'org_activo_search_keys', 'keys': [('organizacion_id', ASCENDING), ('activo', ASCENDING), ('search_keys', ASCENDING)]},
+    ],
+    'gastos': [
+        # list_gastos_by_organizacion y reportes de gastos
+        {'name': 'org_fecha', 'keys': [('organizacion_id', ASCENDING), ('fecha', DESCENDING)]},
+        {'name': 'org_search_keys', 'keys': [('organizacion_id', ASCENDING), ('search_keys', ASCENDING)]},
+    ],
+    'clientes': [
+        # list_clientes_by_organizacion
+        {'name': 'org_created_at', 'keys': [('organizacion_id', ASCENDING), ('created_at', DESCENDING)]},
+        # verify_exits (correo duplicado dentro de la organización)
+        {'name': 'org_correo', 'keys': [('organizacion_id', ASCENDING), ('correo', ASCENDING)]},
+        # search_clientes_by_name (search_services)
+        {'name': 'org_search_keys', 'keys': [('organizacion_id', ASCENDING), ('search_keys', ASCENDING)]},
+        # get_top_clientes (resumen de facturación del cliente)
+        {'name': 'org_resumen_pagado', 'keys': [('organizacion_id', ASCENDING), ('resumen.pagado', DESCENDING)]},
+    ],
+    'clientes_ngrams': [
+        # buscar_ngrams: $in de trigramas dentro de la organización (multikey)
+        {'name': 'org_ngrams', 'keys': [('organizacion_id', ASCENDING), ('ngrams', ASCENDING)]},
+    ],
+    'clientes_ngrams_frecuencias': [
+        # recalcular_frecuencias / organizaciones temporales (la búsqueda lee por _id)
+        {'name': 'organizacion_id', 'keys': [('organizacion_id', ASCENDING)]},
+    ],
+    'usuarios': [
+        {'name': 'correo_unique', 'keys': [('correo', ASCENDING)], 'unique': True},
+    ],
+    'rollups': [
+        # Dashboard y reportes por rango (rollup_services.get_rollups)
+        {'name': 'org_fecha', 'keys': [('organizacion_id', ASCENDING), ('fecha', ASCENDING)]},
+    ],
+    'pdf_cache': [
+        # invalidar_pdf_factura / invalidar_pdf_organizacion
+        {'name': 'factura_id', 'keys': [('factura_id', ASCENDING)]},
+        {'name': 'organizacion_id', 'keys': [('organizacion_id', ASCENDING)]},
+        # Los PDFs huérfanos (contenido viejo) se eliminan solos a los 30 días
+        {'name': 'created_at_ttl', 'keys': [('created_at', ASCENDING)], 'expireAfterSeconds': 30 * 24 * 3600},
+    ],
+    'jobs': [
+        # tomar_siguiente: pendientes disponibles y bloqueos vencidos
+        {'name': 'estado_disponible', 'keys': [('estado', ASCENDING), ('disponible_en', ASCENDING)]},
+        {'name': 'estado_bloqueado', 'keys': [('estado', ASCENDING), ('bloqueado_hasta', ASCENDING)]},
+        # Los completados se eliminan a los 7 días; los fallidos quedan para revisión
+        {'name': 'completados_ttl', 'keys': [('finalizado_en', ASCENDING)], 'expireAfterSeconds': 7 * 24 * 3600,
+         'partialFilterExpression': {'estado': 'completado'}},
+    ],
+    'cobranza_envios': [
+        # Progreso y fallidos de una corrida de cobranza
+        {'name': 'corrida_estado', 'keys': [('corrida_id', ASCENDING), ('estado', ASCENDING)]},
+    ],
+    'importaciones': [
+        # Últimas importaciones de la organización (list_importaciones)
+        {'name': 'org_tipo_creado', 'keys': [('organizacion_id', ASCENDING), ('tipo', ASCENDING), ('creado_en', DESCENDING)]},
+    ],
+    'importacion_errores': [
+        # Reporte de filas rechazadas (iter_errores_importacion)
+        {'name': 'importacion_fila', 'keys': [('importacion_id', ASCENDING), ('fila', ASCENDING)]},
+    ],
+    'invitaciones': [
+        {'name': 'token_unique', 'keys': [('token', ASCENDING)], 'unique': True},
+    ],
+}
+
+# Opciones que se comparan al detectar diferencias
+_OPCIONES_COMPARADAS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def _opciones(spec):
+    return {k: spec[k] for k in _OPCIONES_COMPARADAS if spec.get(k) not in (None, False)}
+
+
+def _keys_normalizadas(keys):
+    return [(campo, int(orden) if isinstance(orden, (int, float)) else orden) for campo, orden in keys]
+
+
+def get_index_drift(db=None):
+    """
+    Compara los índices declarados en INDEXES con los existentes en la base de datos.
+    Retorna un dict por colección con:
+    - faltantes: declarados que no existen.
+    - diferentes: existen con el mismo nombre pero distintas claves u opciones.
+    - extra: existen en MongoDB pero no están declarados (excepto _id_).
+    """
+    db = db if db is not None else mongo.db
+    drift = {}
+    for coleccion, declarados in INDEXES.items():
+        existentes = db[coleccion].index_information()
+        faltantes, diferentes = [], []
+        for spec in declarados:
+            actual = existentes.get(spec['name'])
+            if actual is None:
+                faltantes.append(spec['name'])
+                continue
+            if _keys_normalizadas(actual['key']) != _keys_normalizadas(spec['keys']) or _opciones(actual) != _opciones(spec):
+                diferentes.append(spec['name'])
+        nombres = {spec['name'] for spec in declarados}
+        extra = [nombre for nombre in existentes if nombre != '_id_' and nombre not in nombres]
+        if faltantes or diferentes or extra:
+            drift[coleccion] = {'faltantes': faltantes, 'diferentes': diferentes, 'extra': extra}
+    return drift
+
+
+def ensure_indexes(db=None):
+    """
+    Aplica de forma idempotente los índices declarados en INDEXES.
+    Los índices que ya existen con la misma definición no se tocan.
+    Retorna (aplicados, errores) donde errores es una lista de (coleccion, nombre, mensaje).
+    """
+    db = db if db is not None else mongo.db
+    aplicados, errores = [], []
+    for coleccion, declarados in INDEXES.items():
+        for spec in declarados:
+            opciones = {k: v for k, v in spec.items() if k not in ('keys', 'name')}
+            try:
+                # Un IndexModel por llamada para que un conflicto no bloquee al resto
+                db[coleccion].create_indexes([IndexModel(spec['keys'], name=spec['name'], **opciones)])
+                aplicados.append(f"{coleccion}.{spec['name']}")
+            except OperationFailure as e:
+                errores.append((coleccion, spec['name'], str(e)))
+    return aplicados, errores
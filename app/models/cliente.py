@@ -2,7 +2,7 @@ import datetime
 
 
 class Cliente:
-    def __init__(self, id, nombre, apellido ,correo, telefono, organizacion_id,created_at ,identificacion=None, ):
+    def __init__(self, id, nombre, apellido ,correo, telefono, organizacion_id,created_at ,identificacion=None, resumen=None):
         self.id = id if id else None
         self.organizacion_id = organizacion_id
         self.nombre = nombre
@@ -11,6 +11,8 @@ class Cliente:
         self.telefono = telefono
         self.created_at = created_at
         self.identificacion = identificacion
+        # Totales de facturación ya sumados (ver cliente_services.aplicar_factura_cliente)
+        self.resumen = resumen or {}
 
     def to_dict(self):
         return {
@@ -1,5 +1,49 @@
 # En app/models/factura.py
 
+def normalizar_cliente(cliente):
+    """
+    Retorna (cliente_id, cliente_dict) a partir de lo que venga guardado en la factura.
+    """
+    # --- LÓGICA DEFENSIVA MEJORADA ---
+
+    if not cliente:
+        # Caso 1: No se proporcionó cliente
+        return None, None
+
+    elif isinstance(cliente, dict):
+        # Caso 2: El cliente es un DICCI (cargado desde MongoDB)
+        # Esto es lo normal.
+        # Usamos .get() para evitar errores si falta la clave 'id'
+        return cliente.get('id'), cliente
+
+    elif hasattr(cliente, 'id'):
+        # Caso 3: El cliente es un OBJETO (al crear una nueva factura)
+        # (Ej. un objeto de la clase Cliente)
+        return cliente.id, {
+            'nombre': cliente.nombre,
+            'apellido': cliente.apellido,
+            'id': cliente.id,
+            'correo': cliente.correo,
+            'telefono': cliente.telefono,
+            'identificacion': cliente.identificacion
+        }
+
+    elif isinstance(cliente, str):
+        # Caso 4: DATO INCORRECTO (el 'cliente' es un string)
+        # ESTO ES LO QUE CAUSA TU ERROR.
+        # Lo manejamos elegantemente.
+        # No podemos saber el ID
+        return None, {
+            'nombre': cliente, # Guardamos el string como el nombre
+            'apellido': '(Dato antiguo)', # Indicamos que es dato antiguo
+            'id': None
+            # Rellenamos el resto para que la plantilla no falle
+        }
+
+    # Otro caso inesperado
+    return None, {'nombre': 'Error de datos'}
+
+
 class Factura:
     def __init__(self, id, organizacion_id, invoice_num, vendedor, cliente, fecha_emision, items, total, estado, forma_pago, ):
         self.id = id if id else None
@@ -11,47 +55,22 @@ class Factura:
         self.total = total
         self.estado = estado if estado else 'pendiente'
         self.forma_pago = forma_pago if forma_pago else 'efectivo'
+        self.cliente_id, self.cliente = normalizar_cliente(cliente)
+
 
-        # --- LÓGICA DEFENSIVA MEJORADA ---
-
-        if not cliente:
-            # Caso 1: No se proporcionó cliente
-            self.cliente_id = None
-            self.cliente = None
-
-        elif isinstance(cliente, dict):
-            # Caso 2: El cliente es un DICCI (cargado desde MongoDB)
-            # Esto es lo normal.
-            self.cliente = cliente
-            # Usamos .get() para evitar errores si falta la clave 'id'
-            self.cliente_id = cliente.get('id') 
-
-        elif hasattr(cliente, 'id'):
-            # Caso 3: El cliente es un OBJETO (al crear una nueva factura)
-            # (Ej. un objeto de la clase Cliente)
-            self.cliente_id = cliente.id
-            self.cliente = {
-                'nombre': cliente.nombre,
-                'apellido': cliente.apellido,
-                'id': cliente.id,
-                'correo': cliente.correo,
-                'telefono': cliente.telefono,
-                'identificacion': cliente.identificacion
-            }
-        
-        elif isinstance(cliente, str):
-            # Caso 4: DATO INCORRECTO (el 'cliente' es un string)
-            # ESTO ES LO QUE CAUSA TU ERROR. 
-            # Lo manejamos elegantemente.
-            self.cliente_id = None # No podemos saber el ID
-            self.cliente = {
-                'nombre': cliente, # Guardamos el string como el nombre
-                'apellido': '(Dato antiguo)', # Indicamos que es dato antiguo
-                'id': None
-                # Rellenamos el resto para que la plantilla no falle
-            }
-        
-        else:
-            # Otro caso inesperado
-            self.cliente_id = None
-            self.cliente = {'nombre': 'Error de datos'}
\ No newline at end of file
+class FacturaResumen:
+    """
+    Vista liviana de una factura para los listados: sin 'items' ni datos de
+    contacto del cliente. Los items solo se cargan con get_factura_by_id
+    (ver/editar factura).
+    """
+    def __init__(self, id, organizacion_id, invoice_num, vendedor, cliente, fecha_emision, total, estado, forma_pago=None):
+        self.id = id if id else None
+        self.organizacion_id = organizacion_id
+        self.invoice_num = invoice_num
+        self.vendedor = vendedor
+        self.fecha_emision = fecha_emision
+        self.total = total
+        self.estado = estado if estado else 'pendiente'
+        self.forma_pago = forma_pago if forma_pago else 'efectivo'
+        self.cliente_id, self.cliente = normalizar_cliente(cliente)
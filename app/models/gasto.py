@@ -1,7 +1,7 @@
 from datetime import datetime
 
 class Gasto:
-    def __init__(self, id, organizacion_id, descripcion, monto, categoria, fecha, proveedor=None, comprobante=None, registrado_por=None):
+    def __init__(self, id, organizacion_id, descripcion, monto, categoria, fecha, proveedor=None, comprobante=None, registrado_por=None, rnc_proveedor=None, ncf=None, itbis=None):
         self.id = id if id else None
         self.organizacion_id = organizacion_id
         
@@ -25,6 +25,11 @@ class Gasto:
         self.comprobante = comprobante  # URL o número de referencia
         self.registrado_por = registrado_por # Usuario que registró
 
+        # Datos fiscales del comprobante del proveedor (formato 606 de la DGII)
+        self.rnc_proveedor = rnc_proveedor
+        self.ncf = ncf
+        self.itbis = float(itbis) if itbis else 0.0
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -35,5 +40,8 @@ class Gasto:
             'fecha': self.fecha,
             'proveedor': self.proveedor,
             'comprobante': self.comprobante,
-            'registrado_por': self.registrado_por
+            'registrado_por': self.registrado_por,
+            'rnc_proveedor': self.rnc_proveedor,
+            'ncf': self.ncf,
+            'itbis': self.itbis
         }
\ No newline at end of file
@@ -9,10 +9,9 @@ from bson.objectid import ObjectId
 from app.database import mongo
 from app.models.usuario import Usuario
 from app.models.organizacion import Organizacion
-import cloudinary.uploader
+from app.services.upload_services import encolar_subida
 import logging
 from datetime import datetime, timedelta
-from app.services.email_services import send_invitation_email
 from app.services.auth_services import generate_password_hash
 
 
@@ -26,17 +25,16 @@ def register():
        telefono = request.form.get('telefono')
        email = request.form.get('email')
        rnc = request.form.get('rnc')
-       logo = request.form.get('logo')
+       logo = request.files.get('logo')
        org_id = register_organizacion(nombre_org, direccion, telefono, email, rnc, None)
        if org_id:
               logger.info(f'Organizacion registrada con ID: {org_id}')
-              if logo:
-                  upload = secure_filename(logo.filename)
-                  upload_result = cloudinary.uploader.upload(upload, folder=f"fotos_facturacion/logo_organizaciones/{org_id}", public_id=str(org_id))
-                  mongo.db.organizaciones.update_one(
-                      {'_id': ObjectId(org_id)},
-                      {'$set': {'logo': upload_result.get('secure_url')}}
-                  )
+              if logo and logo.filename:
+                  # Se sube en segundo plano (cola de trabajos)
+                  try:
+                      encolar_subida(logo, f"fotos_facturacion/logo_organizaciones/{org_id}", 'organizaciones', org_id, 'logo', public_id=str(org_id))
+                  except ValueError as e:
+                      flash(f'No se pudo subir el logo: {e}', 'warning')
               flash('Organización registrada exitosamente. Ahora registre al usuario.', 'success')
               return redirect(url_for('auth.register_user', org_id=org_id))
        if org_id is None:
@@ -52,17 +50,16 @@ def register_user(org_id):
         contraseña = request.form.get('contraseña')
         rol = request.form.get('rol', default='admin')
         departamento = request.form.get('departamento', default='general')
-        foto = request.form.get('foto', default='default.jpg')
-        user_id = user_register(org_id,nombre, correo, contraseña, rol, departamento, foto)
+        foto = request.files.get('foto')
+        user_id = user_register(org_id,nombre, correo, contraseña, rol, departamento, 'default.jpg')
         if user_id:
             logger.info(f'Usuario registrado con ID: {user_id}')
-            if foto and foto != 'default.jpg':
-                upload = secure_filename(foto.filename)
-                upload_result = cloudinary.uploader.upload(upload, folder=f"fotos_facturacion/fotos_usuarios/{org_id}", public_id=str(user_id))
-                mongo.db.usuarios.update_one(
-                    {'_id': ObjectId(user_id)},
-                    {'$set': {'foto': upload_result.get('secure_url')}}
-                )
+            if foto and foto.filename:
+                # Se sube en segundo plano (cola de trabajos)
+                try:
+                    encolar_subida(foto, f"fotos_facturacion/fotos_usuarios/{org_id}", 'usuarios', user_id, 'foto', public_id=str(user_id))
+                except ValueError as e:
+                    flash(f'No se pudo subir la foto: {e}', 'warning')
             flash('Usuario registrado exitosamente. Ahora puede iniciar sesión.', 'success')
             return redirect(url_for('auth.login'))
         else:
@@ -175,23 +172,21 @@ def perfil():
     if request.method == 'POST':
         nombre = request.form.get('nombre')
         correo = request.form.get('correo')
-        foto = request.files['foto']
+        foto = request.files.get('foto')
         org = get_organizacion_by_id(current_user.organizacion_id)
         org_name = org.nombre
         org_id = org.organizacion_id
 
-        foto_url = None
         if foto and foto.filename != '':
+            # Se sube en segundo plano (cola de trabajos); el worker guarda la URL
             try:
-                upload = secure_filename(foto.filename)
-                upload_result = cloudinary.uploader.upload(foto, folder=f"fotos_facturacion/fotos_usuarios/{org_name}{org_id}", public_id=str(current_user.id))
-                foto_url = upload_result.get('secure_url')
-            except Exception as e:
+                encolar_subida(foto, f"fotos_facturacion/fotos_usuarios/{org_name}{org_id}", 'usuarios', current_user.id, 'foto', public_id=str(current_user.id))
+                flash('La nueva foto se verá en unos segundos.', 'info')
+            except ValueError as e:
                 flash(f'Error al subir la imagen: {e}', 'danger')
-                current_app.logger.error(f'Error al subir la imagen: {e}')
                 return redirect(url_for('auth.perfil'))
 
-        if update_user_profile(current_user.id, nombre, correo, foto_url):
+        if update_user_profile(current_user.id, nombre, correo):
             flash('Perfil actualizado correctamente', 'success')
             # Actualizar datos de sesión si es necesario, pero flask-login lo hará en el próximo request
         else:
@@ -2,11 +2,16 @@ from flask import blueprints, render_template, redirect, url_for, request, flash
 from flask_login import login_required, current_user
 from ..services.cliente_services import create_cliente, delete_cliente, list_clientes_by_organizacion, get_cliente_by_id, search_clientes_by_name, update_cliente
 from ..services.factura_services import list_facturas_by_cliente as get_facturas_by_cliente_id
+from ..services.importacion_services import campos_importacion, crear_importacion, get_importacion, list_importaciones
+from ..services.export_services import exportar_errores_importacion
 from ..utils.cliente_util import admin_required
+from ..utils.export_util import export_response
+from ..services.cache_services import cached_fragment
 cliente_bp = blueprints.Blueprint('cliente',__name__)
 
 @cliente_bp.route('/', methods=['GET'])
 @login_required
+@cached_fragment('clients/_cliente_table.html', 'clientes')
 def listar_clientes():
     page = request.args.get('page', 1, type=int)
     cliente = request.args.get('cliente')
@@ -18,7 +23,9 @@ def listar_clientes():
         page=page,
         cliente=cliente,
         fecha_desde=fecha_desde,
-        fecha_hasta=fecha_hasta
+        fecha_hasta=fecha_hasta,
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
 
     # Renderiza todo si NO es HTMX
@@ -51,6 +58,55 @@ def create_client():
         return redirect(url_for('cliente.listar_clientes'))
     return render_template('clients/crear_cliente.html')
 
+@cliente_bp.route('/importar', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def importar():
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash('Selecciona un archivo CSV o Excel.', 'danger')
+            return redirect(url_for('cliente.importar'))
+        try:
+            importacion_id = crear_importacion(current_user.organizacion_id, 'clientes', archivo, usuario=current_user.nombre)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('cliente.importar'))
+        current_app.logger.info(f'Importación de clientes {importacion_id} encolada')
+        return redirect(url_for('cliente.progreso_importacion', importacion_id=importacion_id))
+    return render_template(
+        'importacion/importar.html',
+        titulo='Importar Clientes',
+        descripcion='Carga tu cartera de clientes desde un archivo CSV o Excel.',
+        nota='Son obligatorias todas las columnas menos identificacion. Los correos que ya existen en tu organización o que se repiten en el archivo no se importan.',
+        url_volver=url_for('cliente.listar_clientes'),
+        campos=campos_importacion('clientes'),
+        importaciones=list_importaciones(current_user.organizacion_id, 'clientes')
+    )
+
+@cliente_bp.route('/importar/<importacion_id>', methods=['GET'])
+@login_required
+@admin_required
+def progreso_importacion(importacion_id):
+    importacion = get_importacion(current_user.organizacion_id, importacion_id)
+    if not importacion:
+        flash('La importación no existe.', 'danger')
+        return redirect(url_for('cliente.importar'))
+    if request.headers.get('HX-Request'):
+        return render_template('importacion/_progreso.html', importacion=importacion)
+    return render_template('importacion/progreso.html', importacion=importacion, titulo='Importación de Clientes')
+
+@cliente_bp.route('/importar/<importacion_id>/errores', methods=['GET'])
+@login_required
+@admin_required
+def errores_importacion(importacion_id):
+    importacion = get_importacion(current_user.organizacion_id, importacion_id)
+    if not importacion:
+        flash('La importación no existe.', 'danger')
+        return redirect(url_for('cliente.importar'))
+    columnas, filas = exportar_errores_importacion(importacion['_id'], campos_importacion(importacion['tipo']))
+    return export_response(f'errores_importacion_{importacion_id}', columnas, filas, 'csv')
+
 @cliente_bp.route('/ver/<cliente_id>', methods=['GET'])
 @login_required
 def ver_cliente(cliente_id):
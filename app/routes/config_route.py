@@ -8,7 +8,7 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app.database import mongo
 from app.models.organizacion import Organizacion
-import cloudinary.uploader
+from ..services.upload_services import encolar_subida
 import logging
 
 config_bp = Blueprint('config', __name__)
@@ -29,18 +29,17 @@ def ajustes():
         if not all([nombre, direccion, telefono, email, rnc]):
             flash('Todos los campos son obligatorios.', 'danger')
             return redirect(url_for('config.ajustes'))
-        if 'logo' in request.files:
-            logo = request.files['logo']
-            if logo.filename != '':
-                try:
-                    upload_result = cloudinary.uploader.upload(logo, folder=f"fotos_facturacion/logo_organizaciones/", public_id=f'logo_{org_id}_{nombre}')
-                    logo_url = upload_result.get('secure_url')
-                except Exception as e:
-                    app.logger.error(f"Error uploading logo: {e}")
-                    flash('Error al subir el logo, pero se intentará guardar la organización.', 'warning')
 
         org = update_organizacion(org_id, nombre, direccion, telefono, email, rnc, logo_url)
         if org:
+            # El logo se sube en segundo plano (cola de trabajos)
+            logo = request.files.get('logo')
+            if logo and logo.filename != '':
+                try:
+                    encolar_subida(logo, "fotos_facturacion/logo_organizaciones/", 'organizaciones', org_id, 'logo', public_id=f'logo_{org_id}_{nombre}')
+                    flash('El nuevo logo se verá en unos segundos.', 'info')
+                except ValueError as e:
+                    flash(f'No se pudo subir el logo: {e}', 'warning')
             flash('Organización actualizada correctamente.', 'success')
             return redirect(url_for('config.ajustes'))
         else:
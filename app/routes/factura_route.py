@@ -1,14 +1,17 @@
 
 from math import ceil
 from datetime import datetime
-from flask import blueprints, render_template, redirect, url_for, request, flash, current_app
+from flask import blueprints, render_template, redirect, url_for, request, flash, current_app, make_response
 from flask_login import login_required, current_user
 from bson.objectid import ObjectId
 from app.database import mongo
-from ..services.factura_services import eliminar_fact, create_factura, get_factura_by_id, update_factura_estado, list_facturas_by_organizacion, buscar_facturas, modificar_factura, list_facturas_filtradas
+from ..services.factura_services import eliminar_fact, create_factura, get_factura_by_id, update_factura_estado, list_facturas_by_organizacion, buscar_facturas, modificar_factura, list_facturas_filtradas, generate_invoice_number
 from ..models.factura import Factura
 from ..services.cliente_services import get_cliente_by_id
 from ..services.auth_services import get_organizacion_by_id
+from ..services.producto_services import descontar_stock_lote
+from ..services.pdf_services import factura_pdf_hash, get_factura_pdf
+from ..services.cache_services import cached_fragment
 
 factura_bp = blueprints.Blueprint('factura', __name__)
 
@@ -29,6 +32,7 @@ def procesar_items(descripcion, cantidad, precio_unitario):
 
 @factura_bp.route('/', methods=['GET'])
 @login_required
+@cached_fragment('factura/_factura_table.html', 'facturas')
 def listar_facturas():
     page = request.args.get('page', 1, type=int)
     cliente = request.args.get('cliente')
@@ -40,7 +44,9 @@ def listar_facturas():
         page=page,
         cliente=cliente,
         fecha_desde=fecha_desde,
-        fecha_hasta=fecha_hasta
+        fecha_hasta=fecha_hasta,
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
     
     # Renderiza todo si NO es HTMX
@@ -56,7 +62,6 @@ def listar_facturas():
 def crear_factura_route():
     
     if request.method == 'POST':
-        invoice_num = generar_numero_factura_timestamp()
         cliente_id = request.form.get('cliente_id') 
         
         vendedor = current_user.nombre
@@ -95,38 +100,17 @@ def crear_factura_route():
             # Si falla, usamos la fecha de hoy por seguridad
             fecha_obj = datetime.now()
 
-        # --- VERIFICACIÓN DE STOCK (ADVERTENCIA) ---
-        from app.services.producto_services import check_stock_availability
-        warning_msg = []
-        for d, c, p_unit, item_list in zip(descripcion, cantidad, precio_unitario, items):
-             # items has processed dicts, but we need the raw product_id possibly from hidden inputs?
-             # Wait, `items` list created by `procesar_items` DOES NOT HAVE `producto_id`!!!!
-             # `procesar_items` only takes desc, qty, price. 
-             # We need to capture the product IDs from the form!!!
-             pass
-
-        # We need to fetch product_ids from the form first.
+        # Asociar cada línea con su producto del inventario (listas alineadas del formulario)
         producto_ids = request.form.getlist('producto_id[]')
-        
-        # Re-build items with product_id if available
-        # Modifying `procesar_items` would be cleaner but let's patch it here for now
-        # Actually `items` is a list of dicts. We can zip it with producto_ids if they align.
-        # Assuming frontend sends aligned lists (it should).
-        
         for i, item in enumerate(items):
             if i < len(producto_ids):
                 pid = producto_ids[i]
                 if pid and len(pid) == 24: # Valid ObjectId
                     item['producto_id'] = pid
-                    # Check Stock
-                    try:
-                        qty = float(item['cantidad'])
-                        ok, msg = check_stock_availability(pid, qty)
-                        if not ok:
-                            flash(f"ADVERTENCIA: {msg}", 'warning')
-                    except Exception:
-                        pass
         
+        # Numeración atómica por organización (se asigna solo si el formulario es válido)
+        invoice_num = generate_invoice_number(current_user.organizacion_id) or generar_numero_factura_timestamp()
+
         try:
             factura_id = create_factura(
                 current_user.organizacion_id, 
@@ -137,10 +121,15 @@ def crear_factura_route():
                 total, 
                 fecha_obj, 
                 estado,
-                forma_pago
+                forma_pago,
+                descontar_stock=False
             )
             
             if factura_id:
+                # --- STOCK: validación y descuento en lote (ADVERTENCIA si no alcanza) ---
+                for resultado in descontar_stock_lote(items):
+                    if resultado['mensaje']:
+                        flash(f"ADVERTENCIA: {resultado['mensaje']}", 'warning')
                 flash('Factura creada exitosamente.', 'success')
                 return redirect(url_for('factura.listar_facturas'))
             else:
@@ -163,6 +152,37 @@ def ver_factura(factura_id):
     return render_template('factura/factura_pdf.html', factura=factura, organizacion=organizacion)
 
 
+@factura_bp.route('/<factura_id>/pdf', methods=['GET'])
+@login_required
+def factura_pdf(factura_id):
+    factura = get_factura_by_id(factura_id)
+    if not factura or str(factura.organizacion_id) != str(current_user.organizacion_id):
+        flash('Factura no encontrada.', 'danger')
+        return redirect(url_for('factura.listar_facturas'))
+    organizacion = get_organizacion_by_id(current_user.organizacion_id)
+
+    # El ETag es el hash del contenido: si el navegador ya lo tiene no se renderiza nada
+    etag = factura_pdf_hash(factura, organizacion)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        pdf, etag = get_factura_pdf(factura, organizacion, etag)
+    except RuntimeError as e:
+        current_app.logger.error(str(e))
+        flash('No se pudo generar el PDF de la factura.', 'danger')
+        return redirect(url_for('factura.ver_factura', factura_id=factura_id))
+
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'inline; filename=factura_{factura.invoice_num}.pdf'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(etag)
+    return response
+
+
 @factura_bp.route('/marcar_pago/<factura_id>', methods=['POST'])
 @login_required
 def marcar_pago(factura_id):
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, redirect, render_template, url_for, flash
-import cloudinary.uploader
+from app.services.upload_services import encolar_subida
 from app.services.gasto_services import crear_gastos, eliminar_gasto, get_gastos_by_id, list_gastos_by_organizacion
+from app.utils.dgii_util import ncf_valido, validar_identificacion
 from app.services.auth_services import get_organizacion_by_id   
 from app.models.gasto import Gasto
 from flask_login import login_required, current_user
@@ -8,12 +9,14 @@ from datetime import datetime
 from bson.objectid import ObjectId
 from flask import current_app as app
 from ..utils.cliente_util import admin_required
+from app.services.cache_services import cached_fragment
 
 
 gastos_bp = Blueprint('gastos', __name__, url_prefix='/gastos')
 
 @gastos_bp.route('/', methods=['GET'])
 @login_required
+@cached_fragment('gastos/_gastos_table.html', 'gastos')
 def listar_gastos():
     page = request.args.get('page', 1, type=int)
     categoria = request.args.get('categoria')
@@ -27,7 +30,9 @@ def listar_gastos():
         categoria=categoria,
         fecha_desde=fecha_desde,
         fecha_hasta=fecha_hasta,
-        search=search
+        search=search,
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
 
     if request.headers.get('HX-Request'):
@@ -48,6 +53,10 @@ def crear_gastos_route():
         categoria = request.form.get('categoria')
         fecha_str = request.form.get('fecha') # Recibimos como string temporalmente
         proveedor = request.form.get('proveedor')
+        # Opcionales: comprobante fiscal del proveedor (606)
+        rnc_proveedor = (request.form.get('rnc_proveedor') or '').strip() or None
+        ncf = (request.form.get('ncf') or '').strip().upper() or None
+        itbis_str = request.form.get('itbis')
         
         # Validamos que los campos existan
         if not all([descripcion, monto_str, categoria, fecha_str]):
@@ -62,6 +71,19 @@ def crear_gastos_route():
             flash('El monto debe ser un número válido.', 'danger')
             return render_template('gastos/crear.html')
 
+        try:
+            itbis_final = float(itbis_str) if itbis_str else 0.0
+        except (ValueError, TypeError):
+            flash('El ITBIS debe ser un número válido.', 'danger')
+            return render_template('gastos/crear.html')
+
+        if ncf and not ncf_valido(ncf):
+            flash('El NCF no tiene un formato válido (ej. B0100000001).', 'danger')
+            return render_template('gastos/crear.html')
+        if rnc_proveedor and validar_identificacion(rnc_proveedor)[0] is None:
+            flash('El RNC/Cédula del proveedor no es válido.', 'danger')
+            return render_template('gastos/crear.html')
+
         # --- AJUSTE CRÍTICO 2: Convertir Fecha a Objeto Datetime ---
         # Vital para agrupar por mes/año en tus gráficos
         try:
@@ -71,18 +93,6 @@ def crear_gastos_route():
             # Si falla, usamos la fecha y hora actual como seguridad
             fecha_final = datetime.now()
 
-        # Lógica de subida de imagen (Cloudinary)...
-        comprobante_url = None
-        if 'comprobante' in request.files:
-            file = request.files['comprobante']
-            if file and file.filename != '':
-                try:
-                    upload_result = cloudinary.uploader.upload(file, folder=f"fotos_facturacion/comprobantes_gastos/{org.nombre}_{org.organizacion_id}")
-                    comprobante_url = upload_result.get('secure_url')
-                except Exception as e:
-                    app.logger.error(f"Error uploading comprobante: {e}")
-                    flash('Error al subir el comprobante, pero se intentará guardar el gasto.', 'warning')
-
         # Pasamos los datos YA CONVERTIDOS al servicio
         gasto_id = crear_gastos(
             current_user.organizacion_id,
@@ -91,11 +101,21 @@ def crear_gastos_route():
             categoria,
             fecha_final,  # <--- Pasamos el datetime object, no el string
             proveedor,
-            comprobante=comprobante_url,
-            registrado_por=current_user.nombre
+            comprobante=None,
+            registrado_por=current_user.nombre,
+            rnc_proveedor=rnc_proveedor,
+            ncf=ncf,
+            itbis=itbis_final
         )
         
         if gasto_id:
+            # El comprobante se sube en segundo plano (cola de trabajos)
+            file = request.files.get('comprobante')
+            if file and file.filename != '':
+                try:
+                    encolar_subida(file, f"fotos_facturacion/comprobantes_gastos/{org.nombre}_{org.organizacion_id}", 'gastos', gasto_id, 'comprobante')
+                except ValueError as e:
+                    flash(f'El gasto se guardó sin comprobante: {e}', 'warning')
             flash('Gasto registrado correctamente.', 'success')
             return redirect(url_for('gastos.listar_gastos'))
         else:
@@ -1,8 +1,8 @@
-from flask import blueprints, render_template, redirect, url_for, request, flash
+from flask import blueprints, render_template, redirect, url_for, request, flash, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from ..services.auth_services import authenticate_user, exists_organizacion_rnc, get_organizacion_by_id
 from ..services.factura_services import count_facturas_by_organizacion
-from ..services.report_services import get_kpis_mes_actual, get_comparativa_anual, get_gastos_por_categoria, get_top_clientes
+from ..services.dashboard_services import get_dashboard_data, server_timing_header
 import json
 
 main_bp = blueprints.Blueprint('main', __name__)
@@ -15,21 +15,19 @@ def dashboard():
         return redirect(url_for('auth.register'))
     
     org_id = current_user.organizacion_id
-    organizacion = get_organizacion_by_id(org_id)
-    
-    # Obtener datos para el dashboard
-    kpis = get_kpis_mes_actual(org_id)
-    comparativa = get_comparativa_anual(org_id)
-    gastos_cat = get_gastos_por_categoria(org_id)
-    top_clientes = get_top_clientes(org_id)
+
+    # Widgets del dashboard consultados en paralelo (ver dashboard_services)
+    datos, tiempos = get_dashboard_data(org_id)
     
     # Serializar datos para gráficos (Backend Rendering)
-    comparativa_json = json.dumps(comparativa)
-    gastos_cat_json = json.dumps(gastos_cat)
+    comparativa_json = json.dumps(datos['comparativa'])
+    gastos_cat_json = json.dumps(datos['gastos_cat'])
     
-    return render_template('main/dashboard.html', 
-                           organizacion=organizacion,
-                           kpis=kpis,
+    response = make_response(render_template('main/dashboard.html', 
+                           organizacion=datos['organizacion'],
+                           kpis=datos['kpis'],
                            comparativa_json=comparativa_json,
                            gastos_cat_json=gastos_cat_json,
-                           top_clientes=top_clientes)
\ No newline at end of file
+                           top_clientes=datos['top_clientes']))
+    response.headers['Server-Timing'] = server_timing_header(tiempos)
+    return response
\ No newline at end of file
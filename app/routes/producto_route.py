@@ -1,4 +1,4 @@
-from flask import Blueprint, request, render_template, redirect, url_for, flash, jsonify
+from flask import Blueprint, request, render_template, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from app.services.producto_services import (
     create_producto, 
@@ -8,12 +8,17 @@ from app.services.producto_services import (
     delete_producto,
     search_productos_by_nombre_codigo
 )
-# from app.utils.cliente_util import admin_required # Si se requiere permiso admin, descomentar e importar
+from app.services.importacion_services import campos_importacion, crear_importacion, get_importacion, list_importaciones
+from app.services.export_services import exportar_errores_importacion
+from app.utils.cliente_util import admin_required
+from app.utils.export_util import export_response
+from app.services.cache_services import cached_fragment
 
 producto_bp = Blueprint('producto', __name__)
 
 @producto_bp.route('/', methods=['GET'])
 @login_required
+@cached_fragment('productos/_producto_table.html', 'productos')
 def listar_productos():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search')
@@ -21,7 +26,9 @@ def listar_productos():
     productos, pagination = list_productos_by_organizacion(
         current_user.organizacion_id,
         page=page,
-        search=search
+        search=search,
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
     
     if request.headers.get('HX-Request'):
@@ -54,11 +61,10 @@ def crear_producto_route():
             stock
         )
         
+        # Si falla, create_producto ya avisó el motivo con flash
         if producto_id:
             flash('Producto creado exitosamente', 'success')
             return redirect(url_for('producto.listar_productos'))
-        else:
-            flash('Error al crear el producto', 'danger')
             
     return render_template('productos/crear.html')
 
@@ -80,11 +86,10 @@ def editar_producto(producto_id):
             'stock': request.form.get('stock')
         }
         
+        # Si falla, update_producto ya avisó el motivo con flash
         if update_producto(producto_id, data):
             flash('Producto actualizado correctamente', 'success')
             return redirect(url_for('producto.listar_productos'))
-        else:
-            flash('Error al actualizar el producto', 'danger')
             
     return render_template('productos/crear.html', producto=producto) # Reusamos el form de crear
 
@@ -104,6 +109,55 @@ def eliminar_producto_route(producto_id):
         
     return redirect(url_for('producto.listar_productos'))
 
+@producto_bp.route('/importar', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def importar():
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash('Selecciona un archivo CSV o Excel.', 'danger')
+            return redirect(url_for('producto.importar'))
+        try:
+            importacion_id = crear_importacion(current_user.organizacion_id, 'productos', archivo, usuario=current_user.nombre)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('producto.importar'))
+        current_app.logger.info(f'Importación de productos {importacion_id} encolada')
+        return redirect(url_for('producto.progreso_importacion', importacion_id=importacion_id))
+    return render_template(
+        'importacion/importar.html',
+        titulo='Importar Catálogo',
+        descripcion='Crea o actualiza productos y servicios desde un archivo CSV o Excel.',
+        nota='Las filas cuyo codigo ya existe actualizan solo las columnas que traen (por ejemplo precio y stock). Los productos nuevos requieren nombre y precio; si no traen codigo se les asigna un SKU automático.',
+        url_volver=url_for('producto.listar_productos'),
+        campos=campos_importacion('productos'),
+        importaciones=list_importaciones(current_user.organizacion_id, 'productos')
+    )
+
+@producto_bp.route('/importar/<importacion_id>', methods=['GET'])
+@login_required
+@admin_required
+def progreso_importacion(importacion_id):
+    importacion = get_importacion(current_user.organizacion_id, importacion_id)
+    if not importacion:
+        flash('La importación no existe.', 'danger')
+        return redirect(url_for('producto.importar'))
+    if request.headers.get('HX-Request'):
+        return render_template('importacion/_progreso.html', importacion=importacion)
+    return render_template('importacion/progreso.html', importacion=importacion, titulo='Importación del Catálogo')
+
+@producto_bp.route('/importar/<importacion_id>/errores', methods=['GET'])
+@login_required
+@admin_required
+def errores_importacion(importacion_id):
+    importacion = get_importacion(current_user.organizacion_id, importacion_id)
+    if not importacion:
+        flash('La importación no existe.', 'danger')
+        return redirect(url_for('producto.importar'))
+    columnas, filas = exportar_errores_importacion(importacion['_id'], campos_importacion(importacion['tipo']))
+    return export_response(f'errores_importacion_{importacion_id}', columnas, filas, 'csv')
+
 @producto_bp.route('/buscar', methods=['GET'])
 @login_required
 def buscar_productos():
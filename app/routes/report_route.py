@@ -1,16 +1,48 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
-from app.services.report_services import get_cuadre_diario
+from app.services.report_services import (
+    CUADRE_DETALLE_LIMITE,
+    get_cajeros,
+    get_cuadre,
+    iter_cuadre_gastos,
+    iter_cuadre_ingresos
+)
 from app.services.report_generation_services import (
-    get_cuentas_por_cobrar, 
+    get_aging_cxc,
     get_reporte_fiscal, 
     get_ventas_por_rango,
     get_gastos_por_rango
 )
+from app.services.export_services import (
+    exportar_cuadre,
+    exportar_cuentas_por_cobrar,
+    exportar_reporte_fiscal,
+    exportar_ventas_por_rango,
+    exportar_gastos_por_rango
+)
+from app.utils.export_util import FORMATOS, export_response
+from app.services.dgii_services import FORMATOS_DGII, generar_formato_dgii, nombre_archivo_dgii, rnc_organizacion
+from app.services.cobranza_services import get_corrida
+from app.services.job_services import encolar
+from app.utils.cliente_util import admin_required
+from app.utils.date_util import get_now
 
 report_bp = Blueprint('report', __name__, url_prefix='/reportes')
 
+def _formato_exportacion():
+    """'csv' o 'xlsx' si se pidió ?format=..., None para la vista HTML."""
+    formato = request.args.get('format')
+    return formato if formato in FORMATOS else None
+
+def _exportar(nombre, formato, columnas, filas):
+    try:
+        return export_response(nombre, columnas, filas, formato)
+    except RuntimeError as e:
+        current_app.logger.error(str(e))
+        flash('No se pudo exportar el reporte en ese formato.', 'danger')
+        return redirect(request.path)
+
 @report_bp.route('/')
 @login_required
 def index():
@@ -20,19 +52,43 @@ def index():
 @report_bp.route('/cuadre')
 @login_required
 def cuadre_diario():
-    fecha_str = request.args.get('fecha')
-    if not fecha_str:
-        fecha_str = datetime.now().strftime('%Y-%m-%d')
-    
-    data = get_cuadre_diario(current_user.organizacion_id, fecha_str)
-    return render_template('reports/cuadre.html', data=data, fecha_actual=fecha_str)
+    """Cuadre de caja de un día o de un rango (cierre semanal/mensual), opcionalmente por cajero."""
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    # ?fecha=... se mantiene para los enlaces del cuadre de un solo día
+    start = request.args.get('fecha_inicio') or request.args.get('fecha') or hoy
+    end = request.args.get('fecha_fin') or start
+    vendedor = request.args.get('vendedor', '').strip() or None
+    org_id = current_user.organizacion_id
+
+    formato = _formato_exportacion()
+    if formato:
+        nombre = f'cuadre_{start}' if start == end else f'cuadre_{start}_{end}'
+        return _exportar(nombre, formato, *exportar_cuadre(org_id, start, end, vendedor))
+
+    data = get_cuadre(org_id, start, end, vendedor)
+    return render_template(
+        'reports/cuadre.html',
+        data=data,
+        fecha_inicio=start,
+        fecha_fin=end,
+        vendedor=vendedor or '',
+        cajeros=get_cajeros(org_id),
+        detalles_ingresos=iter_cuadre_ingresos(org_id, start, end, vendedor, limite=CUADRE_DETALLE_LIMITE),
+        detalles_gastos=iter_cuadre_gastos(org_id, start, end, vendedor, limite=CUADRE_DETALLE_LIMITE),
+        limite_detalle=CUADRE_DETALLE_LIMITE
+    )
 
 @report_bp.route('/cxc')
 @login_required
 def cuentas_por_cobrar():
-    facturas = get_cuentas_por_cobrar(current_user.organizacion_id)
-    total_deuda = sum(f.get('total', 0) for f in facturas)
-    return render_template('reports/cxc.html', facturas=facturas, total_deuda=total_deuda)
+    formato = _formato_exportacion()
+    if formato:
+        return _exportar('cuentas_por_cobrar', formato, *exportar_cuentas_por_cobrar(current_user.organizacion_id))
+
+    page = request.args.get('page', 1, type=int)
+    resumen, clientes, pagination = get_aging_cxc(current_user.organizacion_id, page=page)
+    plantilla = 'reports/_cxc_tabla.html' if request.headers.get('HX-Request') else 'reports/cxc.html'
+    return render_template(plantilla, resumen=resumen, clientes=clientes, pagination=pagination)
 
 @report_bp.route('/fiscal')
 @login_required
@@ -44,6 +100,10 @@ def reporte_fiscal():
 
     start = request.args.get('fecha_inicio', default_start)
     end = request.args.get('fecha_fin', default_end)
+
+    formato = _formato_exportacion()
+    if formato:
+        return _exportar(f'fiscal_{start}_{end}', formato, *exportar_reporte_fiscal(current_user.organizacion_id, start, end))
     
     facturas = get_reporte_fiscal(current_user.organizacion_id, start, end)
     
@@ -70,6 +130,10 @@ def reporte_ventas():
     start = request.args.get('fecha_inicio', default_start)
     end = request.args.get('fecha_fin', default_end)
 
+    formato = _formato_exportacion()
+    if formato:
+        return _exportar(f'ventas_{start}_{end}', formato, *exportar_ventas_por_rango(current_user.organizacion_id, start, end))
+
     ventas = get_ventas_por_rango(current_user.organizacion_id, start, end)
     
     return render_template('reports/ventas.html', ventas=ventas, fecha_inicio=start, fecha_fin=end)
@@ -84,7 +148,65 @@ def reporte_gastos():
     start = request.args.get('fecha_inicio', default_start)
     end = request.args.get('fecha_fin', default_end)
 
+    formato = _formato_exportacion()
+    if formato:
+        return _exportar(f'gastos_{start}_{end}', formato, *exportar_gastos_por_rango(current_user.organizacion_id, start, end))
+
     gastos = get_gastos_por_rango(current_user.organizacion_id, start, end)
     total_gastos = sum(g.get('monto', 0) for g in gastos)
     
     return render_template('reports/gastos.html', gastos=gastos, fecha_inicio=start, fecha_fin=end, total_gastos=total_gastos)
+
+@report_bp.route('/dgii')
+@login_required
+def formatos_dgii():
+    """Formatos 606/607. Sin errores de validación descarga el TXT directamente."""
+    formato = request.args.get('formato', '607')
+    mes = request.args.get('mes')
+    if formato not in FORMATOS_DGII or not mes:
+        default_mes = datetime.now().strftime('%Y-%m')
+        return render_template('reports/dgii.html', formatos=FORMATOS_DGII, formato=formato, mes=mes or default_mes, errores=None)
+
+    try:
+        periodo = datetime.strptime(mes, '%Y-%m').strftime('%Y%m')
+    except ValueError:
+        flash('Periodo inválido.', 'danger')
+        return redirect(url_for('report.formatos_dgii'))
+
+    archivo, cantidad, errores = generar_formato_dgii(formato, current_user.organizacion_id, periodo)
+    if errores and not request.args.get('descargar'):
+        archivo.close() # Libera el archivo temporal sin haberlo recorrido
+        return render_template('reports/dgii.html', formatos=FORMATOS_DGII, formato=formato, mes=mes, errores=errores, cantidad=cantidad)
+
+    try:
+        nombre = nombre_archivo_dgii(formato, rnc_organizacion(current_user.organizacion_id), periodo)
+    except Exception:
+        archivo.close()
+        raise
+    response = Response(stream_with_context(archivo), mimetype='text/plain; charset=utf-8')
+    # También si el cliente corta la descarga antes del primer trozo
+    response.call_on_close(archivo.close)
+    response.headers['Content-Disposition'] = f'attachment; filename={nombre}'
+    return response
+
+@report_bp.route('/cobranza', methods=['POST'])
+@login_required
+@admin_required
+def iniciar_cobranza():
+    """Encola el envío de estados de cuenta a los clientes con deuda (una corrida por día)."""
+    clave = get_now().strftime('%Y-%m-%d')
+    corrida = get_corrida(current_user.organizacion_id, clave)
+    if corrida and corrida.get('estado') == 'en_proceso':
+        flash('Ya hay un envío de estados de cuenta en curso.', 'info')
+    else:
+        encolar('cobranza', {'organizacion_id': str(current_user.organizacion_id), 'clave': clave}, max_intentos=1)
+        flash('Envío de estados de cuenta programado. Los clientes que ya lo recibieron hoy no se repiten.', 'success')
+    return redirect(url_for('report.progreso_cobranza', clave=clave))
+
+@report_bp.route('/cobranza/<clave>')
+@login_required
+def progreso_cobranza(clave):
+    corrida = get_corrida(current_user.organizacion_id, clave)
+    if request.headers.get('HX-Request'):
+        return render_template('reports/_cobranza_progreso.html', corrida=corrida, clave=clave)
+    return render_template('reports/cobranza.html', corrida=corrida, clave=clave)
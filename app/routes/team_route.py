@@ -5,6 +5,7 @@ from flask_login import login_required, current_user
 from ..database import mongo
 from bson import ObjectId
 from ..services.email_services import send_invitation_email
+from ..services.identity_services import get_organizacion_data, invalidar_usuario
 from ..utils.cliente_util import admin_required
 from ..utils.date_util import get_now
 
@@ -76,16 +77,15 @@ def invitar_colaborador():
     mongo.db.invitaciones.insert_one(invitacion)
 
     # Obtener nombre de la organización para el correo
-    org = mongo.db.organizaciones.find_one({'_id': ObjectId(current_user.organizacion_id)})
+    org = get_organizacion_data(current_user.organizacion_id)
     org_name = org.get('nombre_legal', 'Nuestra Empresa') if org else 'Nuestra Empresa'
 
-    # Enviar Email
-    exito, msg = send_invitation_email(email, org_name, role, token)
-    
-    if exito:
-        flash(f'Invitación enviada correctamente a {email}', 'success')
-    else:
-        flash(f'Invitación guardada, pero falló el envío del correo: {msg}', 'warning')
+    # Encolar el email (lo envía el worker, con reintentos)
+    try:
+        send_invitation_email(email, org_name, role, token)
+        flash(f'Invitación creada. El correo a {email} se enviará en unos segundos.', 'success')
+    except Exception as e:
+        flash(f'Invitación guardada, pero no se pudo programar el envío del correo: {e}', 'warning')
 
     return redirect(url_for('team.listar_equipo'))
 
@@ -102,6 +102,7 @@ def eliminar_colaborador(user_id):
         '_id': ObjectId(user_id),
         'organizacion_id': ObjectId(current_user.organizacion_id)
     })
+    invalidar_usuario(user_id)
     
     if result.deleted_count > 0:
         flash('Colaborador eliminado del equipo.', 'success')
@@ -134,5 +135,6 @@ def cambiar_rol(user_id):
         {'_id': ObjectId(user_id), 'organizacion_id': ObjectId(current_user.organizacion_id)},
         {'$set': {'rol': nuevo_rol}}
     )
+    invalidar_usuario(user_id)
     flash('Rol actualizado.', 'success')
     return redirect(url_for('team.listar_equipo'))
\ No newline at end of file
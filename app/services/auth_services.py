@@ -3,6 +3,7 @@ from app.models.usuario import Usuario
 from app.models.organizacion import Organizacion
 from bson.objectid import ObjectId
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.services.identity_services import get_usuario_data, get_organizacion_data, invalidar_usuario
 
 def authenticate_user(correo, contraseña):
     user_data = mongo.db.usuarios.find_one({'correo': correo})
@@ -62,7 +63,7 @@ def register_organizacion(nombre_org, direccion, telefono, email, rnc, logo):
         return None
 
 def get_user_by_id(user_id):
-    user_data = mongo.db.usuarios.find_one({'_id': ObjectId(user_id)})
+    user_data = get_usuario_data(user_id)
     if user_data:
         return Usuario(
             id=user_data['_id'],
@@ -86,7 +87,7 @@ def exists_organizacion_rnc(rnc):
 
 
 def get_organizacion_by_id(org_id):
-    org_data = mongo.db.organizaciones.find_one({'_id': ObjectId(org_id)})
+    org_data = get_organizacion_data(org_id)
     if org_data:
         return Organizacion(
             organizacion_id=org_data['_id'],
@@ -113,6 +114,7 @@ def update_user_profile(user_id, nombre, correo, foto=None):
             {'_id': ObjectId(user_id)},
             {'$set': update_data}
         )
+        invalidar_usuario(user_id)
         return result.modified_count > 0 or result.matched_count > 0
     except Exception as e:
         print(f"Error al actualizar perfil: {e}")
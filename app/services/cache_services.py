@@ -0,0 +1,239 @@
+import functools
+import inspect
+import json
+from datetime import datetime, date
+from bson.objectid import ObjectId
+from flask import current_app, g, has_app_context, request
+from flask_login import current_user
+from pymongo import ReturnDocument
+from app.database import mongo
+from app.utils.cache_util import LRUCache, RedisCache, MISS
+from app.utils.date_util import get_now
+
+# ==========================================
+# CACHÉ DE REPORTES POR ORGANIZACIÓN
+# ==========================================
+# Los resultados de report_services / report_generation_services se guardan bajo
+# (organización, versión de datos, función, argumentos normalizados). Cada
+# escritura de facturas, gastos o productos incrementa la versión de datos de la
+# organización (colección `versiones_datos`), así que las entradas anteriores
+# dejan de usarse sin tener que buscarlas ni borrarlas.
+#
+# Backend (REPORT_CACHE_BACKEND): 'memory' (LRU del proceso), 'redis'
+# (REPORT_CACHE_URL, compartido entre procesos) o 'none' (desactivada).
+
+
+def _crear_cache(extension, max_entries):
+    cache = current_app.extensions.get(extension, MISS)
+    if cache is not MISS:
+        return cache
+
+    backend = current_app.config.get('REPORT_CACHE_BACKEND', 'memory')
+    cache = None
+    if backend == 'redis':
+        try:
+            cache = RedisCache(current_app.config['REPORT_CACHE_URL'])
+        except Exception as e:
+            current_app.logger.error(f"No se pudo conectar la caché de reportes a Redis, se usa memoria: {e}")
+            backend = 'memory'
+    if backend == 'memory':
+        cache = LRUCache(max_entries=max_entries)
+    current_app.extensions[extension] = cache
+    return cache
+
+
+def get_cache():
+    """Backend configurado para la app actual (se crea una sola vez por app)."""
+    return _crear_cache('report_cache', current_app.config.get('REPORT_CACHE_MAX_ENTRIES', 1024))
+
+
+def get_fragment_cache():
+    """Igual que get_cache, con su propio LRU para no desplazar los reportes."""
+    return _crear_cache('fragment_cache', current_app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 512))
+
+
+# ==========================================
+# VERSIÓN DE DATOS POR ORGANIZACIÓN
+# ==========================================
+# `version` cambia con cualquier escritura (reportes). Además cada escritura
+# indica qué colecciones tocó y se incrementa `colecciones.<nombre>`, que es lo
+# que usan los fragmentos HTMX: crear un gasto no invalida la tabla de
+# clientes. Una escritura sin colecciones incrementa `colecciones._todas`.
+
+TODAS_LAS_COLECCIONES = '_todas'
+
+_PROYECCION_VERSIONES = {'version': 1, 'colecciones': 1}
+
+
+def _versiones_request():
+    if not hasattr(g, '_versiones_datos'):
+        g._versiones_datos = {}
+    return g._versiones_datos
+
+
+def _versiones(organizacion_id):
+    organizacion_id = str(organizacion_id)
+    versiones = _versiones_request()
+    if organizacion_id not in versiones:
+        doc = mongo.db.versiones_datos.find_one({'_id': ObjectId(organizacion_id)}, _PROYECCION_VERSIONES)
+        versiones[organizacion_id] = doc or {}
+    return versiones[organizacion_id]
+
+
+def get_data_version(organizacion_id):
+    """Versión actual de los datos de la organización (memorizada durante el request)."""
+    return _versiones(organizacion_id).get('version', 0)
+
+
+def get_collection_versions(organizacion_id, colecciones):
+    """'facturas=12,_todas=3': versión de cada colección más la de cambios generales."""
+    por_coleccion = _versiones(organizacion_id).get('colecciones') or {}
+    return ','.join(
+        f'{nombre}={por_coleccion.get(nombre, 0)}' for nombre in (*colecciones, TODAS_LAS_COLECCIONES)
+    )
+
+
+def bump_data_version(organizacion_id, *colecciones):
+    """
+    Invalida los reportes cacheados de la organización y los fragmentos de
+    `colecciones` (todos si no se indican). Se llama desde las escrituras.
+    """
+    if not organizacion_id:
+        return
+    incrementos = {'version': 1}
+    for nombre in colecciones or (TODAS_LAS_COLECCIONES,):
+        incrementos[f'colecciones.{nombre}'] = 1
+    try:
+        doc = mongo.db.versiones_datos.find_one_and_update(
+            {'_id': ObjectId(str(organizacion_id))},
+            {'$inc': incrementos},
+            projection=_PROYECCION_VERSIONES,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if has_app_context():
+            _versiones_request()[str(organizacion_id)] = doc
+    except Exception as e:
+        print(f"Error al actualizar la versión de datos: {e}")
+
+
+# ==========================================
+# DECORADOR
+# ==========================================
+
+def _normalizar(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _fin_en_pasado(valor):
+    """True si el fin del rango (año, 'YYYY-MM-DD' o fecha) ya terminó."""
+    hoy = get_now().date()
+    try:
+        if isinstance(valor, int):
+            return valor < hoy.year
+        if isinstance(valor, str):
+            valor = datetime.strptime(valor, '%Y-%m-%d')
+        if isinstance(valor, datetime):
+            valor = valor.date()
+        return isinstance(valor, date) and valor < hoy
+    except (ValueError, TypeError):
+        return False
+
+
+def cached_report(ttl=None, fin=None):
+    """
+    Cachea el resultado de una función de reporte cuyo primer argumento es
+    `organizacion_id`. `fin` es el nombre del argumento que marca el final del
+    rango consultado: si ya pasó, la entrada no vence (solo se invalida con la
+    versión de datos). Los resultados cacheados no deben modificarse.
+    """
+    def decorador(funcion):
+        firma = inspect.signature(funcion)
+        nombre = f'{funcion.__module__}.{funcion.__name__}'
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if current_app.config.get('REPORT_CACHE_BACKEND', 'memory') == 'none':
+                return funcion(*args, **kwargs)
+
+            argumentos = firma.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            organizacion_id = str(next(iter(argumentos.arguments.values())))
+            try:
+                cache = get_cache()
+                clave = ':'.join([
+                    'reporte', organizacion_id, str(get_data_version(organizacion_id)), nombre,
+                    json.dumps(argumentos.arguments, sort_keys=True, default=_normalizar)
+                ])
+                valor = cache.get(clave)
+            except Exception as e:
+                current_app.logger.warning(f"Caché de reportes no disponible: {e}")
+                return funcion(*args, **kwargs)
+            if valor is not MISS:
+                return valor
+
+            valor = funcion(*args, **kwargs)
+            vence = ttl if ttl is not None else current_app.config.get('REPORT_CACHE_TTL', 300)
+            if fin and _fin_en_pasado(argumentos.arguments.get(fin)):
+                vence = None
+            try:
+                cache.set(clave, valor, vence)
+            except Exception as e:
+                current_app.logger.warning(f"No se pudo guardar el reporte en caché: {e}")
+            return valor
+
+        return envoltura
+    return decorador
+
+
+# ==========================================
+# FRAGMENTOS HTMX
+# ==========================================
+
+def cached_fragment(template, *colecciones):
+    """
+    Cachea el HTML que una vista de listado devuelve a las peticiones HTMX (el
+    parcial `template`). La clave es (organización, template, ruta, argumentos
+    de la URL, rol del usuario, versión de `colecciones`): volver a una página o
+    filtro ya visto no consulta MongoDB ni renderiza hasta que esas colecciones
+    cambian. Las peticiones que no son HTMX pasan directo.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            if (
+                request.method != 'GET'
+                or not request.headers.get('HX-Request')
+                or not current_app.config.get('FRAGMENT_CACHE', True)
+                or current_app.config.get('REPORT_CACHE_BACKEND', 'memory') == 'none'
+            ):
+                return vista(*args, **kwargs)
+
+            organizacion_id = str(current_user.organizacion_id)
+            try:
+                cache = get_fragment_cache()
+                clave = ':'.join([
+                    'fragmento', organizacion_id, get_collection_versions(organizacion_id, colecciones),
+                    template, request.path, str(getattr(current_user, 'rol', '')),
+                    json.dumps(sorted(request.args.items(multi=True)))
+                ])
+                html = cache.get(clave)
+            except Exception as e:
+                current_app.logger.warning(f"Caché de fragmentos no disponible: {e}")
+                return vista(*args, **kwargs)
+            if html is not MISS:
+                return html
+
+            respuesta = vista(*args, **kwargs)
+            # Solo el HTML renderizado; redirecciones y respuestas armadas no se guardan
+            if isinstance(respuesta, str):
+                try:
+                    cache.set(clave, respuesta, current_app.config.get('FRAGMENT_CACHE_TTL', 600))
+                except Exception as e:
+                    current_app.logger.warning(f"No se pudo guardar el fragmento en caché: {e}")
+            return respuesta
+
+        return envoltura
+    return decorador
@@ -0,0 +1,193 @@
+import threading
+import time
+from bson.objectid import ObjectId
+from flask import current_app
+from app.database import mongo
+from app.models.producto import Producto
+from app.utils.cache_util import LRUCache, MISS
+from app.utils.catalogo_util import CAMPOS_CATALOGO, CatalogoIndex
+
+# ==========================================
+# CATÁLOGO EN MEMORIA POR ORGANIZACIÓN
+# ==========================================
+# El typeahead de productos (una petición HTMX por tecla en cada línea de la
+# factura) y los escaneos por código se resuelven con un CatalogoIndex del
+# proceso, sin ir a MongoDB:
+#   - Se carga completo la primera vez que se usa y queda en un LRU de hasta
+#     CATALOGO_CACHE_MAX_ORGS organizaciones.
+#   - Cada escritura de productos (alta, edición, baja, stock, importación)
+#     llama a bump_catalogo_version: $inc de `catalogo` en versiones_datos y
+#     $push de los ids cambiados en `catalogo_cambios` (últimos
+#     CATALOGO_CAMBIOS_MAX). Una sola operación atómica, así que el cambio
+#     N-ésimo de la lista corresponde a la versión N-ésima.
+#   - Antes de usar el índice se compara su versión con la de MongoDB como
+#     máximo cada CATALOGO_VERSION_CHECK_SECONDS. Si cambió, se releen solo
+#     los productos cambiados ($in); si los cambios ya no están en la lista
+#     (o hubo una importación) se recarga completo.
+# En el proceso que escribe el cambio se ve enseguida; en otros procesos, a lo
+# sumo CATALOGO_VERSION_CHECK_SECONDS después.
+
+_PROYECCION = {campo: 1 for campo in CAMPOS_CATALOGO + ('activo',)}
+
+_cache = None
+_cache_lock = threading.Lock()
+_carga_locks = {}
+
+
+class _Entrada:
+    def __init__(self, indice, version):
+        self.indice = indice
+        self.version = version
+        self.verificado = time.monotonic()
+        self.lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUCache(max_entries=current_app.config.get('CATALOGO_CACHE_MAX_ORGS', 64))
+    return _cache
+
+
+def _carga_lock(clave):
+    with _cache_lock:
+        return _carga_locks.setdefault(clave, threading.Lock())
+
+
+def bump_catalogo_version(organizacion_id, producto_ids=None):
+    """
+    Registra un cambio del catálogo. `producto_ids` son los productos tocados;
+    None indica un cambio masivo (los índices se recargan completos).
+    """
+    if not organizacion_id:
+        return
+    cambio = [str(p) for p in producto_ids] if producto_ids is not None else None
+    try:
+        mongo.db.versiones_datos.update_one(
+            {'_id': ObjectId(str(organizacion_id))},
+            {
+                '$inc': {'catalogo': 1},
+                '$push': {'catalogo_cambios': {
+                    '$each': [cambio], '$slice': -current_app.config.get('CATALOGO_CAMBIOS_MAX', 200)
+                }},
+            },
+            upsert=True
+        )
+        # Este proceso no espera a la próxima verificación
+        if _cache is not None:
+            entrada = _cache.get(str(organizacion_id))
+            if entrada is not MISS:
+                entrada.verificado = 0
+    except Exception as e:
+        print(f"Error al actualizar la versión del catálogo: {e}")
+
+
+def _version_actual(organizacion_id):
+    doc = mongo.db.versiones_datos.find_one({'_id': ObjectId(organizacion_id)}, {'catalogo': 1})
+    return doc.get('catalogo', 0) if doc else 0
+
+
+def _cargar(organizacion_id):
+    version = _version_actual(organizacion_id)
+    cursor = mongo.db.productos.find(
+        {'organizacion_id': ObjectId(organizacion_id), 'activo': True}, _PROYECCION, batch_size=5000
+    )
+    return _Entrada(CatalogoIndex(cursor), version)
+
+
+def _actualizar(organizacion_id, entrada):
+    """Lleva la entrada a la versión actual. Retorna False si hay que recargarla completa."""
+    doc = mongo.db.versiones_datos.find_one(
+        {'_id': ObjectId(organizacion_id)}, {'catalogo': 1, 'catalogo_cambios': 1}
+    ) or {}
+    version = doc.get('catalogo', 0)
+    pendientes = version - entrada.version
+    if pendientes == 0:
+        return True
+    cambios = doc.get('catalogo_cambios', [])
+    if pendientes < 0 or pendientes > len(cambios) or any(c is None for c in cambios[-pendientes:]):
+        return False
+
+    ids = {pid for cambio in cambios[-pendientes:] for pid in cambio if ObjectId.is_valid(pid)}
+    productos = {
+        str(p['_id']): p for p in mongo.db.productos.find(
+            {'_id': {'$in': [ObjectId(pid) for pid in ids]}, 'organizacion_id': ObjectId(organizacion_id)},
+            _PROYECCION
+        )
+    } if ids else {}
+    for pid in ids:
+        entrada.indice.aplicar(pid, productos.get(pid))
+    entrada.version = version
+    return True
+
+
+def get_catalogo(organizacion_id):
+    """CatalogoIndex vigente de la organización (cargado o actualizado si hace falta)."""
+    clave = str(organizacion_id)
+    cache = _get_cache()
+    entrada = cache.get(clave)
+    intervalo = current_app.config.get('CATALOGO_VERSION_CHECK_SECONDS', 2)
+
+    if entrada is not MISS:
+        if time.monotonic() - entrada.verificado < intervalo:
+            return entrada.indice
+        with entrada.lock:
+            if time.monotonic() - entrada.verificado >= intervalo:
+                if not _actualizar(clave, entrada):
+                    entrada = MISS
+                else:
+                    entrada.verificado = time.monotonic()
+        if entrada is not MISS:
+            return entrada.indice
+
+    # Un solo hilo carga el catálogo de la organización; los demás lo esperan
+    with _carga_lock(clave):
+        actual = cache.get(clave)
+        if actual is not MISS and time.monotonic() - actual.verificado < intervalo:
+            return actual.indice
+        entrada = _cargar(clave)
+        cache.set(clave, entrada)
+        return entrada.indice
+
+
+def _producto(organizacion_id, registro):
+    return Producto(
+        id=registro['id'],
+        organizacion_id=organizacion_id,
+        nombre=registro['nombre'],
+        precio=registro['precio'],
+        codigo=registro.get('codigo'),
+        descripcion=registro.get('descripcion'),
+        tipo=registro.get('tipo') or 'Servicio',
+        stock=registro.get('stock', 0)
+    )
+
+
+def buscar_en_catalogo(organizacion_id, termino, limite=10):
+    """Typeahead de productos activos (modelos Producto) desde el índice en memoria."""
+    return [_producto(organizacion_id, r) for r in get_catalogo(organizacion_id).buscar(termino, limite)]
+
+
+def producto_por_codigo(organizacion_id, codigo):
+    """Producto activo con ese código (escaneo de código de barras/SKU), o None."""
+    registro = get_catalogo(organizacion_id).por_codigo(codigo)
+    return _producto(organizacion_id, registro) if registro else None
+
+
+def benchmark_catalogo(organizacion_id, terminos, repeticiones=200):
+    """Tiempo de carga del índice y milisegundos promedio por búsqueda en memoria."""
+    inicio = time.perf_counter()
+    entrada = _cargar(str(organizacion_id))
+    carga = time.perf_counter() - inicio
+    resultados = {}
+    for termino in terminos:
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            encontrados = entrada.indice.buscar(termino)
+        resultados[termino] = {
+            'ms': (time.perf_counter() - inicio) * 1000 / repeticiones,
+            'resultados': len(encontrados),
+        }
+    return {'productos': len(entrada.indice), 'carga_segundos': carga, 'busquedas': resultados}
@@ -1,9 +1,24 @@
 from ..database import mongo
 from ..models.cliente import Cliente
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import time
+from collections import defaultdict
 from datetime import datetime
 from math import ceil
 from ..utils.cliente_util import verify_exits
+from ..utils.import_util import CORREO_RE
+from ..utils.pagination_util import paginate_keyset
+from ..utils.search_util import tokenizar, trigramas_consulta
+from .cache_services import bump_data_version
+from .organizacion_services import crear_organizacion_temporal, eliminar_organizacion_temporal
+from .report_generation_services import ESTADOS_POR_COBRAR
+from .rollup_services import ESTADO_PAGADO
+from .search_services import (
+    apply_search, build_search_keys, refresh_search_keys,
+    buscar_ngrams, eliminar_ngrams, guardar_ngrams, refresh_ngrams
+)
 from flask import flash, current_app
 
 def create_cliente(nombre, apellido, correo, telefono, organizacion_id, identificacion=None):
@@ -13,8 +28,7 @@ def create_cliente(nombre, apellido, correo, telefono, organizacion_id, identifi
         if cliente_exists:
             flash('Ese correo ya esta registrado para clientes', 'danger')
             return None
-        cliente_data = mongo.db.clientes.insert_one(
-            {
+        documento = {
                 'organizacion_id': ObjectId(organizacion_id),
                 'nombre': nombre,
                 'apellido':apellido,
@@ -23,23 +37,21 @@ def create_cliente(nombre, apellido, correo, telefono, organizacion_id, identifi
                 'identificacion': identificacion,
                 'created_at': datetime.utcnow()
             }
-        )
+        documento['search_keys'] = build_search_keys('clientes', documento)
+        cliente_data = mongo.db.clientes.insert_one(documento)
+        guardar_ngrams('clientes', [documento])
+        bump_data_version(organizacion_id, 'clientes')
         return str(cliente_data.inserted_id)
     except Exception as e:
         print(f"Error al crear el cliente: {e}")
         return None
     
-def list_clientes_by_organizacion(organizacion_id, page=1, per_page=10, cliente=None, fecha_desde=None, fecha_hasta=None):
-    skip = (page - 1) * per_page
+def list_clientes_by_organizacion(organizacion_id, page=1, per_page=10, cliente=None, fecha_desde=None, fecha_hasta=None, after=None, before=None):
     query = {'organizacion_id': ObjectId(organizacion_id)}
 
-    import re
-    # Filtro por cliente (búsqueda parcial)
+    # Filtro por cliente (prefijo indexado sobre search_keys)
     if cliente:
-        query['$or'] = [
-            {'nombre': {'$regex': re.escape(cliente), '$options': 'i'}},
-            {'apellido': {'$regex': re.escape(cliente), '$options': 'i'}}
-        ]
+        apply_search(query, cliente)
 
     # Filtro por fechas
     if fecha_desde and fecha_hasta:
@@ -50,12 +62,10 @@ def list_clientes_by_organizacion(organizacion_id, page=1, per_page=10, cliente=
         except ValueError:
             pass
 
-    total = mongo.db.clientes.count_documents(query)
-    cursor = (
-        mongo.db.clientes.find(query)
-        .skip(skip)
-        .limit(per_page)
-        .sort('created_at', -1)
+    # Paginación por cursor (created_at, _id) en lugar de skip
+    docs, pagination = paginate_keyset(
+        mongo.db.clientes, query, 'created_at',
+        per_page=per_page, after=after, before=before, page=page
     )
 
     clientes = [
@@ -68,20 +78,9 @@ def list_clientes_by_organizacion(organizacion_id, page=1, per_page=10, cliente=
             telefono=f['telefono'],
             created_at=f['created_at'],
             identificacion=f['identificacion'],
-        ) for f in cursor
+        ) for f in docs
     ]
 
-    pagination = {
-        'page': page,
-        'per_page': per_page,
-        'total': total,
-        'pages': ceil(total / per_page),
-        'has_prev': page > 1,
-        'has_next': page < ceil(total / per_page),
-        'prev_num': page - 1 if page > 1 else None,
-        'next_num': page + 1 if page < ceil(total / per_page) else None
-    }
-
     return clientes, pagination
 
 def get_cliente_by_id(cliente_id):
@@ -96,6 +95,7 @@ def get_cliente_by_id(cliente_id):
             telefono=cliente_data['telefono'],
             created_at=cliente_data['created_at'],
             identificacion=cliente_data['identificacion'],
+            resumen=cliente_data.get('resumen'),
         )
     return None
 def update_cliente(cliente_id, data_cliente):
@@ -106,14 +106,21 @@ def update_cliente(cliente_id, data_cliente):
             flash('Ese correo ya esta registrado para otro cliente', 'danger')
             return False
         datos_a_actualizar = {k:v for k, v in data_cliente.items() if v is not None}
-        result = mongo.db.clientes.update_one(
+        anterior = mongo.db.clientes.find_one_and_update(
             {'_id': ObjectId(cliente_id)},
             {
                 '$set': datos_a_actualizar
-            }
+            },
+            projection={k: 1 for k in ('organizacion_id', *datos_a_actualizar)}
         )
+        if anterior is None:
+            return False
+        refresh_search_keys('clientes', cliente_id)
+        refresh_ngrams('clientes', cliente_id)
+        bump_data_version(anterior.get('organizacion_id'), 'clientes')
         current_app.logger.info(f"Cliente {cliente_id} actualizado correctamente.")
-        return result.modified_count > 0
+        # Mismo criterio que modified_count: False si ningún valor cambió
+        return any(anterior.get(k) != v for k, v in datos_a_actualizar.items())
     except Exception as e:
         current_app.logger.error(f"Error al actualizar el cliente: {e}")
         return False
@@ -129,8 +136,13 @@ def delete_cliente(cliente_id):
         # if facturas_count > 0:
         #     return False  # No borrar si tiene historial
         
-        result = mongo.db.clientes.delete_one({'_id': ObjectId(cliente_id)})
-        return result.deleted_count > 0
+        eliminado = mongo.db.clientes.find_one_and_delete(
+            {'_id': ObjectId(cliente_id)}, projection={'organizacion_id': 1}
+        )
+        eliminar_ngrams('clientes', cliente_id)
+        if eliminado:
+            bump_data_version(eliminado.get('organizacion_id'), 'clientes')
+        return eliminado is not None
     except Exception as e:
         print(f"Error eliminando cliente: {e}")
         return False
@@ -156,26 +168,47 @@ def get_cliente_by_org(organizacion_id):
         current_app.logger.error(f"Error al obtener clientes por organización: {e}")
         return []
     
-def search_clientes_by_name(organizacion_id, search_term, limit=5):
+def _buscar_clientes_difuso(org_id, search_term, limit):
+    puntajes = dict(buscar_ngrams(
+        'clientes', org_id, search_term,
+        limit=limit * current_app.config.get('FUZZY_SEARCH_OVERFETCH', 4)
+    ))
+    tokens = tokenizar(search_term)
+
+    def orden(c):
+        claves = c.get('search_keys') or []
+        prefijo = all(any(clave.startswith(t) for clave in claves) for t in tokens)
+        return (not prefijo, -puntajes[c['_id']], len(f"{c.get('nombre', '')} {c.get('apellido', '')}"))
+
+    encontrados = mongo.db.clientes.find({'_id': {'$in': list(puntajes)}, 'organizacion_id': org_id})
+    return sorted(encontrados, key=orden)[:limit]
+
+
+def _buscar_clientes_prefijo(org_id, search_term, limit):
+    # Prefijo indexado sobre search_keys (nombre, apellido, correo, identificación)
+    query = apply_search({'organizacion_id': org_id}, search_term)
+    return list(mongo.db.clientes.find(query).limit(limit))
+
+
+def search_clientes_by_name(organizacion_id, search_term, limit=5, fuzzy=None):
     """
-    Busca clientes por nombre dentro de una organización.
+    Busca clientes por nombre, apellido, correo, teléfono o identificación.
+    Con FUZZY_SEARCH (o `fuzzy=True`) los candidatos salen de clientes_ngrams
+    (tolera acentos y errores de tipeo) y se ordenan poniendo primero los que
+    coinciden por prefijo y luego por puntaje de trigramas.
     """
-    query = {
-        'organizacion_id': ObjectId(organizacion_id),
-        # Buscamos en el nombre O el apellido
-        '$or': [
-            {'nombre': {'$regex': search_term, '$options': 'i'}},
-            {'apellido': {'$regex': search_term, '$options': 'i'}}
-        ]
-    }
-    
-    cursor = mongo.db.clientes.find(query).limit(limit)
-    
+    org_id = ObjectId(organizacion_id)
+    if fuzzy is None:
+        fuzzy = current_app.config.get('FUZZY_SEARCH', True)
+    if fuzzy and trigramas_consulta(search_term):
+        docs = _buscar_clientes_difuso(org_id, search_term, limit)
+    else:
+        docs = _buscar_clientes_prefijo(org_id, search_term, limit)
+
     # Reconstruye los objetos Cliente
     clientes = [
         Cliente(
             id=c['_id'],
-            # ... todos los otros campos ...
             nombre=c.get('nombre'),
             apellido=c.get('apellido'),
             identificacion=c.get('identificacion'),
@@ -183,8 +216,346 @@ def search_clientes_by_name(organizacion_id, search_term, limit=5):
             correo=c.get('correo'),
             telefono=c.get('telefono'),
             created_at=c.get('created_at'),
-            
-            # ... etc
-        ) for c in cursor
+        ) for c in docs
+    ]
+    return clientes
+
+
+# ==========================================
+# IMPORTACIÓN MASIVA (ver importacion_services)
+# ==========================================
+
+# Columna normalizada del archivo -> campo del cliente
+ALIAS_CLIENTES = {
+    'nombre': 'nombre', 'nombres': 'nombre',
+    'apellido': 'apellido', 'apellidos': 'apellido',
+    'correo': 'correo', 'email': 'correo', 'e_mail': 'correo', 'correo_electronico': 'correo',
+    'telefono': 'telefono', 'tel': 'telefono', 'celular': 'telefono',
+    'identificacion': 'identificacion', 'cedula': 'identificacion', 'rnc': 'identificacion', 'rnc_cedula': 'identificacion',
+}
+
+
+def _validar_cliente_importado(registro):
+    faltantes = [c for c in ('nombre', 'apellido', 'correo', 'telefono') if not registro.get(c)]
+    if faltantes:
+        return f"Faltan campos: {', '.join(faltantes)}"
+    if not CORREO_RE.match(registro['correo']):
+        return 'Correo inválido'
+    return None
+
+
+def importar_clientes_lote(organizacion_id, filas, vistos):
+    """
+    Inserta un lote de filas (numero_fila, registro) del archivo. Los correos
+    repetidos (en el archivo, en `vistos`, o ya registrados en la organización)
+    se descartan con UNA consulta $in por lote, y los nuevos entran con un
+    insert_many(ordered=False). Retorna (contadores, errores).
+    """
+    org_id = ObjectId(organizacion_id)
+    contadores = {'procesadas': len(filas), 'insertadas': 0, 'duplicadas': 0, 'invalidas': 0}
+    errores = []
+    validas = []
+    for numero, registro in filas:
+        registro['correo'] = registro.get('correo', '').lower()
+        error = _validar_cliente_importado(registro)
+        if error:
+            contadores['invalidas'] += 1
+            errores.append((numero, registro, error))
+        elif registro['correo'] in vistos:
+            contadores['duplicadas'] += 1
+            errores.append((numero, registro, 'Correo repetido en el archivo'))
+        else:
+            vistos.add(registro['correo'])
+            validas.append((numero, registro))
+
+    existentes = {
+        c['correo'] for c in mongo.db.clientes.find(
+            {'organizacion_id': org_id, 'correo': {'$in': [r['correo'] for _, r in validas]}},
+            {'correo': 1, '_id': 0}
+        )
+    } if validas else set()
+
+    nuevos, numeros = [], []
+    ahora = datetime.utcnow()
+    for numero, registro in validas:
+        if registro['correo'] in existentes:
+            contadores['duplicadas'] += 1
+            errores.append((numero, registro, 'Ese correo ya está registrado para clientes'))
+            continue
+        documento = {
+            'organizacion_id': org_id,
+            'nombre': registro['nombre'],
+            'apellido': registro['apellido'],
+            'correo': registro['correo'],
+            'telefono': registro['telefono'],
+            'identificacion': registro.get('identificacion') or None,
+            'created_at': ahora
+        }
+        documento['search_keys'] = build_search_keys('clientes', documento)
+        nuevos.append(documento)
+        numeros.append((numero, registro))
+
+    if nuevos:
+        try:
+            contadores['insertadas'] = len(mongo.db.clientes.insert_many(nuevos, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            contadores['insertadas'] = e.details.get('nInserted', 0)
+            fallidos = {fallo['index'] for fallo in e.details.get('writeErrors', [])}
+            for fallo in e.details.get('writeErrors', []):
+                numero, registro = numeros[fallo['index']]
+                errores.append((numero, registro, fallo.get('errmsg', 'Error al insertar')))
+            contadores['invalidas'] += len(fallidos)
+            nuevos = [doc for indice, doc in enumerate(nuevos) if indice not in fallidos]
+        # insert_many asigna el _id a cada documento
+        guardar_ngrams('clientes', nuevos)
+    return contadores, errores
+
+
+def benchmark_busqueda_clientes(terminos, clientes=200000, repeticiones=10, conservar=False):
+    """
+    Latencia (ms) de search_clientes_by_name con trigramas contra el prefijo
+    sobre search_keys para cada término. Los `clientes` sintéticos se cargan
+    por el mismo camino de la importación en una organización temporal, que
+    se elimina al final con todos sus datos salvo con `conservar`.
+    """
+    nombres = ('José', 'María', 'Juan', 'Ana', 'Luis', 'Carmen', 'Pedro', 'Rosa', 'Miguel', 'Altagracia',
+               'Francisco', 'Yolanda', 'Rafael', 'Mercedes', 'Ramón', 'Josefina', 'Manuel', 'Luz', 'Héctor', 'Dulce')
+    apellidos = ('Rodríguez', 'Pérez', 'Martínez', 'García', 'Fernández', 'Gómez', 'Díaz', 'Reyes', 'Núñez',
+                 'Jiménez', 'Santana', 'Peña', 'De la Cruz', 'Batista', 'Guzmán', 'Castillo', 'Almonte', 'Tavárez')
+    organizacion_id = crear_organizacion_temporal('Benchmark búsqueda de clientes')
+    org_id = ObjectId(organizacion_id)
+    try:
+        vistos = set()
+        for inicio in range(0, clientes, 1000):
+            filas = [
+                (i, {
+                    'nombre': nombres[i % len(nombres)],
+                    'apellido': f"{apellidos[(i // len(nombres)) % len(apellidos)]} {apellidos[(i * 7) % len(apellidos)]}",
+                    'correo': f'bench-{i}@bench.invalid',
+                    'telefono': f'809{i:07d}',
+                    'identificacion': f'{i:011d}',
+                }) for i in range(inicio, min(inicio + 1000, clientes))
+            ]
+            importar_clientes_lote(org_id, filas, vistos)
+
+        resultados = {}
+        for termino in terminos:
+            tiempos = {}
+            for modo, fuzzy in (('trigramas', True), ('prefijo', False)):
+                inicio = time.perf_counter()
+                for _ in range(repeticiones):
+                    encontrados = search_clientes_by_name(org_id, termino, limit=10, fuzzy=fuzzy)
+                tiempos[modo] = {
+                    'ms': (time.perf_counter() - inicio) * 1000 / repeticiones,
+                    'resultados': [f'{c.nombre} {c.apellido}' for c in encontrados[:3]],
+                }
+            resultados[termino] = tiempos
+        return {
+            'organizacion_id': organizacion_id,
+            'clientes': mongo.db.clientes.count_documents({'organizacion_id': org_id}),
+            'busquedas': resultados,
+        }
+    finally:
+        if not conservar:
+            eliminar_organizacion_temporal(organizacion_id)
+
+
+# ==========================================
+# RESUMEN DE FACTURACIÓN POR CLIENTE
+# ==========================================
+# Cada cliente guarda sus totales ya sumados en 'resumen':
+#   {facturado, pagado, pendiente, facturas, pagadas, ultima_factura}
+# Igual que los rollups diarios, los servicios de factura aplican con $inc la
+# diferencia entre la factura anterior y la nueva (aplicar_factura_cliente),
+# así el detalle del cliente y el top del dashboard son lecturas indexadas.
+# Los borradores y anuladas no cuentan. `flask veloce rebuild-client-stats`
+# recalcula los resúmenes desde las facturas. Cada $inc también incrementa
+# 'resumen_version' del cliente: la reconstrucción solo escribe un resumen si
+# esa versión no cambió desde que leyó las facturas, así no pisa un $inc
+# concurrente (el cliente se vuelve a calcular en la pasada siguiente).
+
+ESTADOS_NO_FACTURADOS = ['Borrador', 'Anulada', 'Anulado']
+
+# Campos de la factura que afectan el resumen del cliente
+FACTURA_CLIENTE_PROJECTION = {'cliente_id': 1, 'fecha_emision': 1, 'total': 1, 'estado': 1}
+
+RESUMEN_VACIO = {'facturado': 0.0, 'pagado': 0.0, 'pendiente': 0.0, 'facturas': 0, 'pagadas': 0, 'ultima_factura': None}
+
+
+def _cliente_de_factura(doc):
+    cliente_id = doc.get('cliente_id') if doc else None
+    if not cliente_id or not ObjectId.is_valid(str(cliente_id)) or doc.get('estado') in ESTADOS_NO_FACTURADOS:
+        return None
+    return ObjectId(str(cliente_id))
+
+
+def _aporte_cliente(doc, signo):
+    """Incrementos que la factura suma (signo=1) o resta (signo=-1) al resumen de su cliente."""
+    total = float(doc.get('total') or 0) * signo
+    incrementos = {'resumen.facturado': total, 'resumen.facturas': signo}
+    if doc.get('estado') == ESTADO_PAGADO:
+        incrementos['resumen.pagado'] = total
+        incrementos['resumen.pagadas'] = signo
+    elif doc.get('estado') in ESTADOS_POR_COBRAR:
+        incrementos['resumen.pendiente'] = total
+    return incrementos
+
+
+def _recalcular_ultima_factura(cliente_id):
+    # Con $max no se puede retroceder la fecha: al quitar la factura más reciente
+    # se relee la anterior con el índice (cliente_id, fecha_emision)
+    ultima = mongo.db.facturas.find_one(
+        {'cliente_id': cliente_id, 'estado': {'$nin': ESTADOS_NO_FACTURADOS}, 'fecha_emision': {'$type': 'date'}},
+        {'fecha_emision': 1}, sort=[('fecha_emision', -1)]
+    )
+    mongo.db.clientes.update_one(
+        {'_id': cliente_id}, {'$set': {'resumen.ultima_factura': ultima['fecha_emision'] if ultima else None}}
+    )
+
+
+def aplicar_factura_cliente(anterior=None, nuevo=None):
+    """
+    Refleja en el resumen de los clientes la creación (solo nuevo), modificación
+    o eliminación (solo anterior) de una factura. Usa los campos de
+    FACTURA_CLIENTE_PROJECTION.
+    """
+    por_cliente = defaultdict(lambda: defaultdict(int))
+    for doc, signo in ((anterior, -1), (nuevo, 1)):
+        cliente_id = _cliente_de_factura(doc)
+        if cliente_id:
+            for campo, valor in _aporte_cliente(doc, signo).items():
+                por_cliente[cliente_id][campo] += valor
+
+    cliente_nuevo = _cliente_de_factura(nuevo)
+    fecha_nueva = nuevo.get('fecha_emision') if cliente_nuevo else None
+    operaciones = []
+    for cliente_id, incrementos in por_cliente.items():
+        cambios = {}
+        # Una modificación que no cambia nada (ej. mismo total y estado) se anula
+        incrementos = {campo: valor for campo, valor in incrementos.items() if valor != 0}
+        if incrementos:
+            cambios['$inc'] = incrementos
+        if cliente_id == cliente_nuevo and isinstance(fecha_nueva, datetime):
+            cambios['$max'] = {'resumen.ultima_factura': fecha_nueva}
+        if cambios:
+            cambios.setdefault('$inc', {})['resumen_version'] = 1
+            operaciones.append(UpdateOne({'_id': cliente_id}, cambios))
+
+    try:
+        if operaciones:
+            mongo.db.clientes.bulk_write(operaciones, ordered=False)
+        cliente_anterior = _cliente_de_factura(anterior)
+        fecha_anterior = anterior.get('fecha_emision') if cliente_anterior else None
+        if cliente_anterior and (
+            cliente_anterior != cliente_nuevo
+            or not isinstance(fecha_nueva, datetime)
+            or (isinstance(fecha_anterior, datetime) and fecha_nueva < fecha_anterior)
+        ):
+            _recalcular_ultima_factura(cliente_anterior)
+    except Exception:
+        # La factura ya se guardó; rebuild-client-stats corrige cualquier desfase
+        current_app.logger.exception("Error al actualizar el resumen del cliente")
+
+
+def _resumenes_calculados(org_id, cliente_ids):
+    """{cliente_id: resumen} desde las facturas de `cliente_ids` (índice cliente_id + fecha_emision)."""
+    pipeline = [
+        {'$match': {'cliente_id': {'$in': cliente_ids}, 'organizacion_id': org_id, 'estado': {'$nin': ESTADOS_NO_FACTURADOS}}},
+        {'$group': {
+            '_id': '$cliente_id',
+            'facturado': {'$sum': '$total'},
+            'pagado': {'$sum': {'$cond': [{'$eq': ['$estado', ESTADO_PAGADO]}, '$total', 0]}},
+            'pendiente': {'$sum': {'$cond': [{'$in': ['$estado', ESTADOS_POR_COBRAR]}, '$total', 0]}},
+            'facturas': {'$sum': 1},
+            'pagadas': {'$sum': {'$cond': [{'$eq': ['$estado', ESTADO_PAGADO]}, 1, 0]}},
+            # Datos antiguos guardaron la fecha como string: solo cuentan las fechas
+            'ultima_factura': {'$max': {'$cond': [{'$eq': [{'$type': '$fecha_emision'}, 'date']}, '$fecha_emision', None]}},
+        }},
+    ]
+    return {fila.pop('_id'): fila for fila in mongo.db.facturas.aggregate(pipeline)}
+
+
+def _reconstruir_lote(org_id, versiones, calculado_en):
+    """
+    Escribe el resumen recalculado de los clientes {cliente_id: resumen_version}
+    solo si su resumen_version sigue igual. Retorna (con facturas, omitidos).
+    """
+    calculados = _resumenes_calculados(org_id, list(versiones))
+    operaciones = [
+        UpdateOne(
+            {'_id': cliente_id, 'resumen_version': version},
+            {'$set': {'resumen': {**RESUMEN_VACIO, **calculados.get(cliente_id, {}), 'calculado_en': calculado_en}}}
+        ) for cliente_id, version in versiones.items()
     ]
-    return clientes
\ No newline at end of file
+    escritos = set(versiones)
+    if operaciones:
+        resultado = mongo.db.clientes.bulk_write(operaciones, ordered=False)
+        if resultado.matched_count < len(operaciones):
+            # Algún cliente recibió un $inc mientras se calculaba: se relee su versión
+            actuales = {
+                c['_id']: c.get('resumen_version') for c in mongo.db.clientes.find(
+                    {'_id': {'$in': list(versiones)}}, {'resumen_version': 1}
+                )
+            }
+            escritos = {
+                cliente_id for cliente_id, version in versiones.items()
+                if cliente_id not in actuales or actuales[cliente_id] == version
+            }
+    omitidos = [cliente_id for cliente_id in versiones if cliente_id not in escritos]
+    return sum(1 for cliente_id in escritos if cliente_id in calculados), omitidos
+
+
+def reconstruir_resumen_clientes(organizacion_id, batch_size=1000, reintentos=3):
+    """
+    Recalcula el resumen de todos los clientes de la organización desde sus
+    facturas, por lotes de `batch_size` clientes (los que no tienen facturas
+    quedan en cero). Un cliente cuyo resumen cambia mientras se calcula no se
+    sobrescribe: se vuelve a calcular hasta `reintentos` veces. Retorna la
+    cantidad de clientes con facturas.
+    """
+    org_id = ObjectId(organizacion_id)
+    calculado_en = datetime.utcnow()
+    procesados = 0
+    pendientes = []
+
+    def lote_de_versiones(filtro):
+        # La versión se lee antes que las facturas: un $inc posterior invalida la escritura
+        return {
+            c['_id']: c.get('resumen_version')
+            for c in mongo.db.clientes.find(filtro, {'resumen_version': 1})
+        }
+
+    ultimo_id = None
+    while True:
+        filtro = {'organizacion_id': org_id}
+        if ultimo_id is not None:
+            filtro['_id'] = {'$gt': ultimo_id}
+        ids = [c['_id'] for c in mongo.db.clientes.find(filtro, {'_id': 1}).sort('_id', 1).limit(batch_size)]
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+        con_facturas, omitidos = _reconstruir_lote(org_id, lote_de_versiones({'_id': {'$in': ids}}), calculado_en)
+        procesados += con_facturas
+        pendientes.extend(omitidos)
+
+    for _ in range(reintentos):
+        if not pendientes:
+            break
+        con_facturas, omitidos = _reconstruir_lote(org_id, lote_de_versiones({'_id': {'$in': pendientes}}), calculado_en)
+        procesados += con_facturas
+        pendientes = omitidos
+    if pendientes:
+        current_app.logger.warning(
+            f"rebuild-client-stats: {len(pendientes)} clientes con escrituras concurrentes quedaron sin recalcular"
+        )
+
+    bump_data_version(org_id, 'clientes')
+    return procesados
+
+
+def get_top_clientes_resumen(organizacion_id, limit=5):
+    """Clientes con más facturación pagada, desde el resumen (índice org + resumen.pagado)."""
+    return list(mongo.db.clientes.find(
+        {'organizacion_id': ObjectId(organizacion_id), 'resumen.pagado': {'$gt': 0}},
+        {'nombre': 1, 'apellido': 1, 'resumen': 1}
+    ).sort('resumen.pagado', -1).limit(limit))
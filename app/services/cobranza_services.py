@@ -0,0 +1,240 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.database import mongo
+from app.services.email_services import get_email_transport
+from app.services.identity_services import get_organizacion_data
+from app.services.job_services import renovar_bloqueo
+from app.services.report_generation_services import ESTADOS_POR_COBRAR
+from app.utils.date_util import get_now
+
+# ==========================================
+# COBRANZA MASIVA (ESTADOS DE CUENTA)
+# ==========================================
+# Una corrida envía a cada cliente con facturas por cobrar (mismos estados que
+# get_cuentas_por_cobrar) un estado de cuenta por correo:
+#   - Las facturas se leen con el índice facturas.org_estado_fecha y se agrupan
+#     por cliente en MongoDB ($group): un documento por cliente, no por factura.
+#   - La plantilla emails/estado_cuenta.html se compila una vez por corrida.
+#   - Los correos salen por el transporte de la app (get_email_transport): una
+#     sola conexión reutilizada y EMAIL_RATE_PER_SECOND, con COBRANZA_WORKERS
+#     hilos enviando en paralelo.
+#   - Idempotencia: cada (organización, clave de corrida, cliente) se reclama en
+#     `cobranza_envios` antes de enviar. Repetir la corrida con la misma clave
+#     (por defecto la fecha) solo reintenta los fallidos y los que quedaron a
+#     medias hace más de COBRANZA_RECLAMO_MINUTOS.
+#   - Progreso: el documento de la corrida en `cobranzas` lleva los contadores.
+
+PLANTILLA_ESTADO_CUENTA = 'emails/estado_cuenta.html'
+
+ENVIO_ENVIANDO = 'enviando'
+ENVIO_ENVIADO = 'enviado'
+ENVIO_FALLIDO = 'fallido'
+
+CORRIDA_EN_PROCESO = 'en_proceso'
+CORRIDA_COMPLETADA = 'completada'
+CORRIDA_ERROR = 'error'
+
+_CONTADORES = ('procesados', 'enviados', 'ya_enviados', 'sin_correo', 'fallidos')
+
+
+def _pipeline_deudas_por_cliente(organizacion_id):
+    return [
+        {"$match": {
+            "organizacion_id": ObjectId(organizacion_id),
+            "estado": {"$in": ESTADOS_POR_COBRAR}
+        }},
+        {"$sort": {"fecha_emision": 1}},
+        {"$group": {
+            "_id": {"$ifNull": ["$cliente_id", "$cliente.correo"]},
+            "cliente": {"$first": "$cliente"},
+            "total": {"$sum": "$total"},
+            "cantidad": {"$sum": 1},
+            "mas_antigua": {"$first": "$fecha_emision"},
+            "facturas": {"$push": {
+                "invoice_num": "$invoice_num",
+                "fecha_emision": "$fecha_emision",
+                "estado": "$estado",
+                "total": "$total"
+            }}
+        }},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+def iter_deudas_por_cliente(organizacion_id, batch_size=200):
+    """Un documento por cliente con sus facturas por cobrar (más antiguas primero)."""
+    return mongo.db.facturas.aggregate(
+        _pipeline_deudas_por_cliente(organizacion_id), batchSize=batch_size, allowDiskUse=True
+    )
+
+
+def contar_clientes_con_deuda(organizacion_id):
+    resultado = list(mongo.db.facturas.aggregate(
+        _pipeline_deudas_por_cliente(organizacion_id)[:-1] + [{"$count": "clientes"}], allowDiskUse=True
+    ))
+    return resultado[0]['clientes'] if resultado else 0
+
+
+def _id_corrida(organizacion_id, clave):
+    return f"{organizacion_id}:{clave}"
+
+
+def get_corrida(organizacion_id, clave):
+    return mongo.db.cobranzas.find_one({'_id': _id_corrida(organizacion_id, clave)})
+
+
+def iniciar_corrida(organizacion_id, clave):
+    """Crea (o reinicia) el documento de progreso de la corrida."""
+    ahora = get_now()
+    return mongo.db.cobranzas.find_one_and_update(
+        {'_id': _id_corrida(organizacion_id, clave)},
+        {
+            '$set': {
+                'organizacion_id': ObjectId(organizacion_id),
+                'clave': clave,
+                'estado': CORRIDA_EN_PROCESO,
+                'total_clientes': contar_clientes_con_deuda(organizacion_id),
+                'iniciado_en': ahora,
+                'actualizado_en': ahora,
+                **{c: 0 for c in _CONTADORES},
+            },
+            '$unset': {'finalizado_en': '', 'error': ''},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _avanzar(corrida_id, **incrementos):
+    mongo.db.cobranzas.update_one(
+        {'_id': corrida_id},
+        {'$inc': incrementos, '$set': {'actualizado_en': get_now()}}
+    )
+
+
+def _reclamar_envio(envio_id, datos):
+    """True si este proceso debe enviar al cliente (nadie lo envió ya)."""
+    ahora = get_now()
+    try:
+        mongo.db.cobranza_envios.insert_one({'_id': envio_id, 'estado': ENVIO_ENVIANDO, 'reclamado_en': ahora, **datos})
+        return True
+    except DuplicateKeyError:
+        limite = ahora - timedelta(minutes=current_app.config.get('COBRANZA_RECLAMO_MINUTOS', 30))
+        resultado = mongo.db.cobranza_envios.update_one(
+            {'_id': envio_id, '$or': [
+                {'estado': ENVIO_FALLIDO},
+                {'estado': ENVIO_ENVIANDO, 'reclamado_en': {'$lt': limite}},
+            ]},
+            {'$set': {'estado': ENVIO_ENVIANDO, 'reclamado_en': ahora, **datos}}
+        )
+        return resultado.modified_count == 1
+
+
+def _nombre_cliente(cliente):
+    if isinstance(cliente, dict):
+        return f"{cliente.get('nombre', '')} {cliente.get('apellido', '')}".strip()
+    return str(cliente or '')
+
+
+def ejecutar_cobranza(organizacion_id, clave=None, workers=None, solo_simular=False):
+    """
+    Envía los estados de cuenta de la organización. `clave` identifica la
+    corrida (por defecto la fecha de hoy). Con `solo_simular` se renderizan los
+    correos sin reclamar ni enviar. Retorna el documento final de la corrida.
+    """
+    app = current_app._get_current_object()
+    clave = clave or get_now().strftime('%Y-%m-%d')
+    organizacion = get_organizacion_data(organizacion_id) or {}
+    plantilla = app.jinja_env.get_template(PLANTILLA_ESTADO_CUENTA)
+    transporte = get_email_transport()
+    workers = workers or app.config.get('COBRANZA_WORKERS', 4)
+    # PyMongo devuelve las fechas sin zona: los días de atraso se calculan en naive local
+    fecha = get_now().replace(tzinfo=None)
+
+    corrida = iniciar_corrida(organizacion_id, clave)
+    corrida_id = corrida['_id']
+
+    def enviar(envio_id, correo, asunto, html):
+        with app.app_context():
+            try:
+                message_id = transporte.enviar(correo, asunto, html)
+            except Exception as e:
+                mongo.db.cobranza_envios.update_one(
+                    {'_id': envio_id}, {'$set': {'estado': ENVIO_FALLIDO, 'error': str(e), 'actualizado_en': get_now()}}
+                )
+                _avanzar(corrida_id, procesados=1, fallidos=1)
+                return
+            mongo.db.cobranza_envios.update_one(
+                {'_id': envio_id},
+                {'$set': {'estado': ENVIO_ENVIADO, 'message_id': message_id, 'enviado_en': get_now()}, '$unset': {'error': ''}}
+            )
+            _avanzar(corrida_id, procesados=1, enviados=1)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            en_vuelo = set()
+            for deuda in iter_deudas_por_cliente(organizacion_id):
+                # La corrida puede durar más que el bloqueo del trabajo en la cola
+                if not renovar_bloqueo():
+                    raise RuntimeError('El trabajo de cobranza fue tomado por otro worker')
+                cliente = deuda.get('cliente') if isinstance(deuda.get('cliente'), dict) else {}
+                correo = (cliente.get('correo') or '').strip()
+                if not correo:
+                    _avanzar(corrida_id, procesados=1, sin_correo=1)
+                    continue
+
+                asunto = f"Estado de cuenta - {organizacion.get('nombre', 'Veloce')}"
+                for factura in deuda['facturas']:
+                    # Datos antiguos guardaron la fecha como string
+                    emitida = factura.get('fecha_emision')
+                    factura['dias'] = (fecha - emitida).days if isinstance(emitida, datetime) else None
+                html = plantilla.render(
+                    organizacion=organizacion,
+                    cliente=cliente,
+                    nombre_cliente=_nombre_cliente(cliente),
+                    facturas=deuda['facturas'],
+                    total=deuda['total'],
+                    fecha=fecha
+                )
+                if solo_simular:
+                    _avanzar(corrida_id, procesados=1)
+                    continue
+
+                envio_id = f"{corrida_id}:{deuda['_id']}"
+                datos = {
+                    'corrida_id': corrida_id,
+                    'organizacion_id': ObjectId(organizacion_id),
+                    'correo': correo,
+                    'total': deuda['total'],
+                    'cantidad': deuda['cantidad'],
+                }
+                if not _reclamar_envio(envio_id, datos):
+                    _avanzar(corrida_id, procesados=1, ya_enviados=1)
+                    continue
+
+                # Pocos correos en vuelo: el cursor se consume al ritmo del envío
+                if len(en_vuelo) >= workers * 2:
+                    _, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                en_vuelo.add(pool.submit(enviar, envio_id, correo, asunto, html))
+    except Exception as e:
+        mongo.db.cobranzas.update_one(
+            {'_id': corrida_id}, {'$set': {'estado': CORRIDA_ERROR, 'error': str(e), 'finalizado_en': get_now()}}
+        )
+        raise
+
+    return mongo.db.cobranzas.find_one_and_update(
+        {'_id': corrida_id},
+        {'$set': {'estado': CORRIDA_COMPLETADA, 'finalizado_en': get_now()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def tarea_cobranza(payload):
+    """Trabajo 'cobranza' de la cola (job_services)."""
+    corrida = ejecutar_cobranza(payload['organizacion_id'], payload.get('clave'))
+    return {c: corrida.get(c, 0) for c in _CONTADORES}
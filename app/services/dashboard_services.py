@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from flask import current_app
+from app.services.auth_services import get_organizacion_by_id
+from app.services.report_services import get_kpis_mes_actual, get_comparativa_anual, get_gastos_por_categoria, get_top_clientes
+
+# ==========================================
+# DATOS DEL DASHBOARD EN PARALELO
+# ==========================================
+# Cada widget del dashboard es una consulta independiente. En lugar de
+# ejecutarlas una tras otra (la latencia sería la suma de todas) se lanzan a la
+# vez en un pool de hilos compartido y acotado. Cada widget tiene un
+# presupuesto de tiempo: si no responde a tiempo se usa su valor por defecto y
+# la página se muestra igual. Se reporta cuánto tardó cada uno.
+
+# (nombre, función, valor por defecto si falla o excede el presupuesto)
+WIDGETS = (
+    ('organizacion', get_organizacion_by_id, None),
+    ('kpis', get_kpis_mes_actual, {'ingresos_mes': 0, 'gastos_mes': 0, 'beneficio_neto': 0, 'facturas_pendientes': 0}),
+    ('comparativa', get_comparativa_anual, {'labels': [], 'ingresos': [], 'gastos': []}),
+    ('gastos_cat', get_gastos_por_categoria, {'labels': [], 'data': []}),
+    ('top_clientes', get_top_clientes, []),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('DASHBOARD_WORKERS', 8),
+                    thread_name_prefix='dashboard'
+                )
+    return _executor
+
+
+def _medir(app, funcion, organizacion_id):
+    inicio = time.perf_counter()
+    with app.app_context():
+        resultado = funcion(organizacion_id)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def get_dashboard_data(organizacion_id, presupuesto_ms=None):
+    """
+    Ejecuta los widgets del dashboard en paralelo.
+    Retorna (datos, tiempos): datos es {widget: resultado} y tiempos es
+    {widget: {'ms': float, 'estado': 'ok' | 'timeout' | 'error'}}.
+    """
+    app = current_app._get_current_object()
+    if presupuesto_ms is None:
+        presupuesto_ms = app.config.get('DASHBOARD_WIDGET_TIMEOUT_MS', 2000)
+
+    executor = _get_executor()
+    inicio = time.perf_counter()
+    futuros = {nombre: executor.submit(_medir, app, funcion, organizacion_id) for nombre, funcion, _ in WIDGETS}
+
+    datos = {}
+    tiempos = {}
+    for nombre, _, defecto in WIDGETS:
+        # Todos corren a la vez: el presupuesto se mide desde el inicio, no por widget en serie
+        restante = max(0.0, presupuesto_ms / 1000 - (time.perf_counter() - inicio))
+        try:
+            datos[nombre], ms = futuros[nombre].result(timeout=restante)
+            tiempos[nombre] = {'ms': ms, 'estado': 'ok'}
+        except FuturesTimeoutError:
+            datos[nombre] = defecto
+            tiempos[nombre] = {'ms': (time.perf_counter() - inicio) * 1000, 'estado': 'timeout'}
+            app.logger.warning(f"Dashboard: el widget '{nombre}' excedió {presupuesto_ms} ms")
+        except Exception as e:
+            datos[nombre] = defecto
+            tiempos[nombre] = {'ms': (time.perf_counter() - inicio) * 1000, 'estado': 'error'}
+            app.logger.error(f"Dashboard: error en el widget '{nombre}': {e}")
+    return datos, tiempos
+
+
+def server_timing_header(tiempos):
+    """Valor del header Server-Timing para ver los tiempos en las DevTools del navegador."""
+    return ', '.join(
+        f"{nombre};dur={t['ms']:.1f};desc=\"{t['estado']}\"" for nombre, t in tiempos.items()
+    )
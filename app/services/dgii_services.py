@@ -0,0 +1,251 @@
+import os
+import tempfile
+from datetime import datetime
+from bson.objectid import ObjectId
+from app.database import mongo
+from app.services.identity_services import get_organizacion_data
+from app.utils.dgii_util import (
+    validar_identificacion, ncf_valido, tipo_ncf, monto_dgii, fecha_dgii, linea_dgii
+)
+
+# ==========================================
+# FORMATOS 606 / 607 DE LA DGII
+# ==========================================
+# Archivos TXT con una línea de encabezado (formato|RNC|periodo|cantidad) y un
+# registro por comprobante con los campos separados por '|'.
+#   607: ventas, desde `facturas` del periodo (excepto borradores/anuladas).
+#   606: compras, desde `gastos` con NCF del proveedor.
+# Los registros se leen con cursores sobre los índices (organizacion_id, fecha)
+# y se escriben en un archivo temporal (SpooledTemporaryFile) mientras se cuenta:
+# el encabezado necesita la cantidad final, así que no se carga el periodo
+# completo en memoria. Los comprobantes con RNC/NCF inválidos no se incluyen y se
+# devuelven en la lista de errores.
+
+DGII_BATCH_SIZE = 500
+
+# Estados que no son ventas
+ESTADOS_EXCLUIDOS_607 = ['Borrador', 'Anulada', 'Anulado']
+
+# Columnas 17-23 del 607 según la forma de pago
+_FORMA_PAGO_607 = {
+    'efectivo': 0,
+    'cheque': 1,
+    'transferencia': 1,
+    'deposito': 1,
+    'tarjeta': 2,
+}
+# Código de forma de pago del 606
+_FORMA_PAGO_606 = {
+    'efectivo': '01',
+    'cheque': '02',
+    'transferencia': '02',
+    'deposito': '02',
+    'tarjeta': '03',
+    'credito': '04',
+}
+
+# Tipo de bienes y servicios comprados (606, campo 3) por categoría de gasto
+_TIPO_GASTO_606 = {
+    'Nómina': '01',
+    'Servicios': '02',
+    'Alquiler': '03',
+    'Insumos': '09',
+    'Impuestos': '10',
+}
+TIPO_GASTO_606_DEFECTO = '02'
+
+
+def periodo_rango(periodo):
+    """'AAAAMM' -> (inicio, inicio del mes siguiente)."""
+    inicio = datetime.strptime(periodo, '%Y%m')
+    fin = datetime(inicio.year + 1, 1, 1) if inicio.month == 12 else datetime(inicio.year, inicio.month + 1, 1)
+    return inicio, fin
+
+
+def _itbis_incluido(total):
+    # Mismo criterio que get_reporte_fiscal: el total incluye ITBIS 18%
+    return float(total or 0) - float(total or 0) / 1.18
+
+
+def _registros_607(organizacion_id, periodo, errores, batch_size):
+    inicio, fin = periodo_rango(periodo)
+    cursor = mongo.db.facturas.find(
+        {
+            'organizacion_id': ObjectId(organizacion_id),
+            'fecha_emision': {'$gte': inicio, '$lt': fin},
+            'estado': {'$nin': ESTADOS_EXCLUIDOS_607}
+        },
+        {'invoice_num': 1, 'ncf': 1, 'cliente': 1, 'fecha_emision': 1, 'total': 1, 'itbis': 1, 'estado': 1, 'forma_pago': 1},
+        batch_size=batch_size
+    ).sort('fecha_emision', 1)
+
+    for f in cursor:
+        referencia = f.get('invoice_num') or str(f['_id'])
+        ncf = (f.get('ncf') or f.get('invoice_num') or '').strip().upper()
+        if not ncf_valido(ncf):
+            errores.append({'referencia': referencia, 'mensaje': f'NCF inválido: {ncf or "(vacío)"}'})
+            continue
+
+        cliente = f.get('cliente') if isinstance(f.get('cliente'), dict) else {}
+        tipo_id, identificacion = validar_identificacion(cliente.get('identificacion'))
+        if tipo_id is None:
+            # Consumidor final (B02/E32) puede ir sin RNC/Cédula
+            if tipo_ncf(ncf) in ('B02', 'E32'):
+                tipo_id, identificacion = '', ''
+            else:
+                errores.append({'referencia': referencia, 'mensaje': identificacion})
+                continue
+
+        total = float(f.get('total') or 0)
+        itbis = f['itbis'] if f.get('itbis') is not None else _itbis_incluido(total)
+        formas = ['0.00'] * 7
+        if f.get('estado') == 'Pagado':
+            formas[_FORMA_PAGO_607.get(f.get('forma_pago') or 'efectivo', 6)] = monto_dgii(total)
+        else:
+            formas[3] = monto_dgii(total) # Venta a crédito
+        yield linea_dgii([
+            identificacion, tipo_id, ncf, '', '01', fecha_dgii(f.get('fecha_emision')), '',
+            monto_dgii(total - itbis), monto_dgii(itbis),
+            '0.00', '0.00', '0.00', '0.00', '0.00', '0.00', '0.00',
+            *formas
+        ])
+
+
+def _registros_606(organizacion_id, periodo, errores, batch_size):
+    inicio, fin = periodo_rango(periodo)
+    cursor = mongo.db.gastos.find(
+        {'organizacion_id': ObjectId(organizacion_id), 'fecha': {'$gte': inicio, '$lt': fin}},
+        {'descripcion': 1, 'proveedor': 1, 'rnc_proveedor': 1, 'ncf': 1, 'fecha': 1, 'monto': 1, 'itbis': 1, 'categoria': 1, 'forma_pago': 1},
+        batch_size=batch_size
+    ).sort('fecha', 1)
+
+    for g in cursor:
+        referencia = g.get('descripcion') or str(g['_id'])
+        if not g.get('ncf'):
+            # Gastos sin comprobante fiscal (nómina, caja chica...) no van al 606
+            continue
+        ncf = g['ncf'].strip().upper()
+        if not ncf_valido(ncf):
+            errores.append({'referencia': referencia, 'mensaje': f'NCF inválido: {ncf}'})
+            continue
+        tipo_id, identificacion = validar_identificacion(g.get('rnc_proveedor'))
+        if tipo_id is None:
+            errores.append({'referencia': referencia, 'mensaje': identificacion})
+            continue
+
+        monto = float(g.get('monto') or 0)
+        itbis = float(g.get('itbis') or 0)
+        yield linea_dgii([
+            identificacion, tipo_id, _TIPO_GASTO_606.get(g.get('categoria'), TIPO_GASTO_606_DEFECTO),
+            ncf, '', fecha_dgii(g.get('fecha')), '',
+            monto_dgii(monto - itbis), '0.00', monto_dgii(monto - itbis), monto_dgii(itbis),
+            '0.00', '0.00', '0.00', monto_dgii(itbis), '0.00', '', '0.00', '0.00', '0.00', '0.00', '0.00',
+            _FORMA_PAGO_606.get(g.get('forma_pago') or 'efectivo', '07')
+        ])
+
+
+_REGISTROS = {'606': _registros_606, '607': _registros_607}
+FORMATOS_DGII = tuple(sorted(_REGISTROS))
+
+
+class ArchivoDGII:
+    """
+    Archivo 606/607 ya generado: se itera en trozos de bytes (encabezado
+    incluido) y close() libera el archivo temporal aunque no se haya leído.
+    Se cierra solo al terminar la iteración; también sirve como `with`.
+    """
+
+    def __init__(self, encabezado, temporal):
+        self.encabezado = encabezado
+        self.temporal = temporal
+
+    def __iter__(self):
+        try:
+            yield self.encabezado
+            self.temporal.seek(0)
+            while True:
+                trozo = self.temporal.read(64 * 1024)
+                if not trozo:
+                    break
+                yield trozo
+        finally:
+            self.close()
+
+    def close(self):
+        self.temporal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def generar_formato_dgii(formato, organizacion_id, periodo, batch_size=DGII_BATCH_SIZE):
+    """
+    Genera el archivo 606/607 de un periodo 'AAAAMM'.
+    Retorna (archivo, cantidad, errores): `archivo` es un ArchivoDGII listo
+    para enviar o escribir; quien no lo recorra completo debe llamar close().
+    """
+    organizacion = get_organizacion_data(organizacion_id) or {}
+    errores = []
+    tipo_id, rnc = validar_identificacion(organizacion.get('rnc'))
+    if tipo_id is None:
+        errores.append({'referencia': 'Organización', 'mensaje': rnc})
+        rnc = ''
+
+    temporal = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    cantidad = 0
+    try:
+        for linea in _REGISTROS[formato](organizacion_id, periodo, errores, batch_size):
+            temporal.write((linea + '\r\n').encode('utf-8'))
+            cantidad += 1
+    except Exception:
+        temporal.close()
+        raise
+
+    encabezado = (linea_dgii([formato, rnc, periodo, cantidad]) + '\r\n').encode('utf-8')
+    return ArchivoDGII(encabezado, temporal), cantidad, errores
+
+
+def rnc_organizacion(organizacion_id):
+    """RNC limpio de la organización para el nombre del archivo (el id si no es válido)."""
+    organizacion = get_organizacion_data(organizacion_id) or {}
+    tipo_id, rnc = validar_identificacion(organizacion.get('rnc'))
+    return rnc if tipo_id else str(organizacion_id)
+
+
+def nombre_archivo_dgii(formato, rnc, periodo):
+    """Nombre que usa la herramienta de envío: DGII_F_607_<RNC>_<AAAAMM>.TXT"""
+    return f'DGII_F_{formato}_{rnc}_{periodo}.TXT'
+
+
+def generar_formatos_lote(formato, anio, directorio, organizacion_ids=None, batch_size=DGII_BATCH_SIZE):
+    """
+    Escribe los archivos de los 12 meses de `anio` para varias organizaciones
+    (todas las que tengan datos si no se indican). Una organización y un mes a
+    la vez, siempre en streaming. Los comprobantes rechazados de cada archivo se
+    escriben al lado, en <archivo>.errores.txt.
+    Retorna [(organizacion_id, periodo, ruta, cantidad, cantidad_errores)].
+    """
+    if not organizacion_ids:
+        coleccion = mongo.db.facturas if formato == '607' else mongo.db.gastos
+        organizacion_ids = coleccion.distinct('organizacion_id')
+    os.makedirs(directorio, exist_ok=True)
+
+    resultados = []
+    for organizacion_id in organizacion_ids:
+        rnc = rnc_organizacion(organizacion_id)
+        for mes in range(1, 13):
+            periodo = f'{anio}{mes:02d}'
+            generado, cantidad, errores = generar_formato_dgii(formato, organizacion_id, periodo, batch_size)
+            ruta = os.path.join(directorio, nombre_archivo_dgii(formato, rnc, periodo))
+            with generado, open(ruta, 'wb') as archivo:
+                for trozo in generado:
+                    archivo.write(trozo)
+            if errores:
+                with open(ruta + '.errores.txt', 'w', encoding='utf-8') as archivo:
+                    for error in errores:
+                        archivo.write(f"{error['referencia']}: {error['mensaje']}\n")
+            resultados.append((str(organizacion_id), periodo, ruta, cantidad, len(errores)))
+    return resultados
@@ -0,0 +1,337 @@
+import difflib
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+from app.database import mongo
+from app.models.factura import Factura
+from app.models.organizacion import Organizacion
+from app.services.cache_services import bump_data_version
+from app.services.identity_services import get_organizacion_data
+from app.services.secuencia_services import reservar_bloque
+from app.utils.dgii_util import validar_identificacion, ncf_valido
+from app.utils.ecf_util import escribir_ecf_archivo, ecf_bytes, estructura_xml
+
+# ==========================================
+# GENERACIÓN MASIVA DE e-CF
+# ==========================================
+# Para el cierre de un periodo:
+#   1. Se recorren las facturas del rango con un cursor, en lotes de ECF_LOTE.
+#   2. Cada lote reserva sus eNCF de una sola vez por tipo (reservar_bloque sobre
+#      la secuencia 'ecf_31' / 'ecf_32') y los guarda en `facturas.ncf`, que es
+#      el NCF que usa el formato 607. Las facturas que ya tienen eNCF lo conservan,
+#      así que repetir el cierre no consume números nuevos.
+#   3. Los datos de cada comprobante (dicts planos) se envían a un pool de
+#      procesos que escribe los XML (utils/ecf_util). Mientras el pool escribe un
+#      lote, el proceso principal ya está leyendo y numerando el siguiente.
+# El cierre de una misma organización no debe ejecutarse dos veces en paralelo.
+
+ECF_LOTE = 500
+
+ECF_CREDITO_FISCAL = '31'
+ECF_CONSUMO = '32'
+
+ESTADOS_EXCLUIDOS_ECF = ['Borrador', 'Anulada', 'Anulado']
+
+# Código de forma de pago del e-CF
+_FORMA_PAGO_ECF = {
+    'efectivo': '1',
+    'cheque': '2',
+    'transferencia': '2',
+    'deposito': '2',
+    'tarjeta': '3',
+}
+
+FACTURA_ECF_PROJECTION = {
+    'invoice_num': 1, 'ncf': 1, 'vendedor': 1, 'cliente': 1, 'fecha_emision': 1,
+    'items': 1, 'total': 1, 'estado': 1, 'forma_pago': 1, 'organizacion_id': 1
+}
+
+
+def formatear_encf(tipo, numero):
+    """E + tipo + 10 dígitos: ('31', 15) -> 'E310000000015'."""
+    return f'E{tipo}{int(numero):010d}'
+
+
+def tipo_ecf(factura):
+    """Crédito fiscal (31) si el cliente tiene RNC/Cédula válido, si no consumo (32)."""
+    cliente = factura.cliente if isinstance(factura.cliente, dict) else {}
+    tipo_id, _ = validar_identificacion(cliente.get('identificacion'))
+    return ECF_CREDITO_FISCAL if tipo_id else ECF_CONSUMO
+
+
+def _fecha_ecf(valor):
+    return valor.strftime('%d-%m-%Y') if isinstance(valor, datetime) else ''
+
+
+def _vencimiento_secuencia(fecha_emision):
+    configurado = current_app.config.get('ECF_VENCIMIENTO_SECUENCIA')
+    if configurado:
+        return configurado
+    anio = fecha_emision.year if isinstance(fecha_emision, datetime) else datetime.now().year
+    return f'31-12-{anio}'
+
+
+def datos_ecf(factura, organizacion, encf, vencimiento_secuencia=None):
+    """
+    Datos planos del e-CF (ver utils/ecf_util.escribir_ecf) a partir de una
+    Factura y su Organizacion. Los montos de la factura incluyen ITBIS (mismo
+    criterio que el reporte fiscal), por eso IndicadorMontoGravado = 1.
+    """
+    total = float(factura.total or 0)
+    gravado = round(total / 1.18, 2)
+    pagada = factura.estado == 'Pagado'
+
+    cliente = factura.cliente if isinstance(factura.cliente, dict) else {}
+    tipo_id, rnc_comprador = validar_identificacion(cliente.get('identificacion'))
+    _, rnc_emisor = validar_identificacion(organizacion.rnc)
+
+    items = []
+    for item in factura.items or []:
+        descripcion = str(item.get('descripcion') or '').strip()
+        items.append({
+            'nombre': descripcion or 'Artículo',
+            'descripcion': descripcion,
+            'bien_o_servicio': '1' if item.get('tipo') == 'Producto' else '2',
+            'cantidad': item.get('cantidad') or 0,
+            'precio_unitario': item.get('precio_unitario') or 0,
+            'monto': item.get('total', (item.get('cantidad') or 0) * (item.get('precio_unitario') or 0)),
+        })
+
+    return {
+        'tipo': encf[1:3],
+        'encf': encf,
+        'vencimiento_secuencia': vencimiento_secuencia or _vencimiento_secuencia(factura.fecha_emision),
+        'indicador_monto_gravado': '1',
+        'tipo_ingresos': '01',
+        'tipo_pago': '1' if pagada else '2', # 1 contado, 2 crédito
+        'formas_pago': [(_FORMA_PAGO_ECF.get(factura.forma_pago, '8'), total)] if pagada else [],
+        'fecha_emision': _fecha_ecf(factura.fecha_emision),
+        'emisor': {
+            'rnc': rnc_emisor,
+            'razon_social': organizacion.nombre,
+            'direccion': organizacion.direccion,
+            'telefono': organizacion.telefono,
+            'correo': organizacion.email,
+        },
+        'comprador': {
+            'rnc': rnc_comprador if tipo_id else None,
+            'razon_social': f"{cliente.get('nombre', '')} {cliente.get('apellido', '')}".strip(),
+        },
+        'totales': {'gravado': gravado, 'itbis': round(total - gravado, 2), 'total': total},
+        'items': items,
+    }
+
+
+def _organizacion_ecf(organizacion_id):
+    data = get_organizacion_data(organizacion_id)
+    if not data:
+        raise ValueError(f'Organización no encontrada: {organizacion_id}')
+    organizacion = Organizacion(
+        organizacion_id=data['_id'],
+        nombre=data.get('nombre'),
+        direccion=data.get('direccion'),
+        telefono=data.get('telefono'),
+        email=data.get('email'),
+        rnc=data.get('rnc'),
+        logo=data.get('logo'),
+        moneda=data.get('moneda', 'RD$')
+    )
+    tipo_id, mensaje = validar_identificacion(organizacion.rnc)
+    if tipo_id is None:
+        raise ValueError(f'La organización no tiene un RNC válido para emitir e-CF ({mensaje})')
+    return organizacion
+
+
+def _factura_desde_doc(doc):
+    return Factura(
+        id=doc['_id'],
+        organizacion_id=doc['organizacion_id'],
+        invoice_num=doc.get('invoice_num'),
+        vendedor=doc.get('vendedor'),
+        cliente=doc.get('cliente'),
+        fecha_emision=doc.get('fecha_emision'),
+        items=doc.get('items', []),
+        total=doc.get('total', 0),
+        estado=doc.get('estado'),
+        forma_pago=doc.get('forma_pago', 'efectivo')
+    )
+
+
+def asignar_encf(organizacion_id, facturas):
+    """
+    Asigna eNCF a las facturas (objetos Factura) que no lo tienen: un bloque de
+    la secuencia por tipo para todo el lote. Guarda `ncf` en las facturas
+    numeradas. Retorna [(factura, encf)] en el mismo orden.
+    """
+    asignados = {}
+    pendientes = {}
+    for factura in facturas:
+        actual = (getattr(factura, 'ncf', None) or '').strip().upper()
+        if actual.startswith('E') and ncf_valido(actual):
+            asignados[factura.id] = actual
+        else:
+            pendientes.setdefault(tipo_ecf(factura), []).append(factura)
+
+    operaciones = []
+    for tipo, lista in pendientes.items():
+        primero, _ = reservar_bloque(organizacion_id, f'ecf_{tipo}', len(lista))
+        for numero, factura in enumerate(lista, start=primero):
+            encf = formatear_encf(tipo, numero)
+            asignados[factura.id] = encf
+            operaciones.append(UpdateOne({'_id': factura.id}, {'$set': {'ncf': encf}}))
+    if operaciones:
+        mongo.db.facturas.bulk_write(operaciones, ordered=False)
+
+    return [(factura, asignados[factura.id]) for factura in facturas]
+
+
+def _lotes_facturas(organizacion_id, desde, hasta, lote):
+    cursor = mongo.db.facturas.find(
+        {
+            'organizacion_id': ObjectId(organizacion_id),
+            'fecha_emision': {'$gte': desde, '$lt': hasta},
+            'estado': {'$nin': ESTADOS_EXCLUIDOS_ECF}
+        },
+        FACTURA_ECF_PROJECTION,
+        batch_size=lote
+    ).sort([('fecha_emision', 1), ('_id', 1)])
+
+    actual = []
+    for doc in cursor:
+        factura = _factura_desde_doc(doc)
+        factura.ncf = doc.get('ncf')
+        actual.append(factura)
+        if len(actual) >= lote:
+            yield actual
+            actual = []
+    if actual:
+        yield actual
+
+
+def _procesos(procesos):
+    return procesos or current_app.config.get('ECF_PROCESOS') or os.cpu_count() or 1
+
+
+def generar_ecf_cierre(organizacion_id, desde, hasta, directorio, procesos=None, lote=ECF_LOTE):
+    """
+    Genera los XML e-CF de las facturas de [desde, hasta) en `directorio`.
+    Retorna {'documentos', 'segundos', 'por_segundo', 'directorio'}.
+    """
+    organizacion = _organizacion_ecf(organizacion_id)
+    os.makedirs(directorio, exist_ok=True)
+    procesos = _procesos(procesos)
+    chunksize = max(1, lote // (4 * procesos))
+
+    inicio = time.perf_counter()
+    documentos = 0
+    numerados = False
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        anterior = None
+        for facturas in _lotes_facturas(organizacion_id, desde, hasta, lote):
+            trabajos = [
+                (datos_ecf(factura, organizacion, encf), directorio)
+                for factura, encf in asignar_encf(organizacion_id, facturas)
+            ]
+            numerados = True
+            resultado = pool.map(escribir_ecf_archivo, trabajos, chunksize=chunksize)
+            if anterior is not None:
+                documentos += sum(1 for _ in anterior)
+            anterior = resultado
+        if anterior is not None:
+            documentos += sum(1 for _ in anterior)
+
+    if numerados:
+        # El reporte fiscal muestra el NCF: los eNCF nuevos invalidan su caché
+        bump_data_version(organizacion_id, 'facturas')
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'documentos': documentos,
+        'segundos': segundos,
+        'por_segundo': documentos / segundos if segundos else 0.0,
+        'directorio': directorio,
+    }
+
+
+# ==========================================
+# BENCHMARK CONTRA LA MUESTRA
+# ==========================================
+
+def ruta_muestra_ecf():
+    return os.path.join(current_app.static_folder, 'image', 'ecf.xml')
+
+
+def _factura_muestra():
+    """Factura y organización equivalentes a app/static/image/ecf.xml (sin MongoDB)."""
+    organizacion = Organizacion(
+        organizacion_id=ObjectId(),
+        nombre='Integraciones Tecnologicas, M&A, SRL.',
+        direccion='C/ Arístides García Mella No. 32, Esq. Calle Dolores Rodríguez Objío',
+        telefono='809-797-7444',
+        email='zohohisac@integrateccorp.com',
+        rnc='131179037',
+        logo=None
+    )
+    factura = Factura(
+        id=ObjectId(),
+        organizacion_id=organizacion.organizacion_id,
+        invoice_num='000015',
+        vendedor='Benchmark',
+        cliente={'nombre': 'Brito,', 'apellido': 'Darling', 'id': None, 'identificacion': '131333664'},
+        fecha_emision=datetime(2025, 10, 21),
+        items=[{
+            'descripcion': 'integración de facturación electronica',
+            'cantidad': 1, 'precio_unitario': 118000.0, 'total': 118000.0
+        }],
+        total=118000.0,
+        estado='Pagado',
+        forma_pago='transferencia'
+    )
+    return factura, organizacion
+
+
+def benchmark_ecf(cantidad=5000, procesos=None):
+    """
+    Serializa `cantidad` e-CF de la factura de muestra con el pool de procesos y
+    mide documentos por segundo (sin MongoDB: solo el serializador y la
+    escritura a disco). Verifica que la estructura de los elementos coincida con
+    la muestra, sin la firma. Retorna un dict con los resultados.
+    """
+    factura, organizacion = _factura_muestra()
+    base = datos_ecf(factura, organizacion, formatear_encf(ECF_CREDITO_FISCAL, 1), '31-12-2026')
+
+    esperado = estructura_xml(ruta_muestra_ecf())
+    generado = estructura_xml(io.BytesIO(ecf_bytes(base)))
+    diferencias = [
+        linea for linea in difflib.ndiff(esperado, generado)
+        if linea[:1] in ('-', '+')
+    ]
+
+    procesos = _procesos(procesos)
+    with tempfile.TemporaryDirectory(prefix='ecf-bench-') as directorio:
+        trabajos = [(dict(base, encf=formatear_encf(ECF_CREDITO_FISCAL, n)), directorio) for n in range(1, cantidad + 1)]
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            escritos = sum(1 for _ in pool.map(escribir_ecf_archivo, trabajos, chunksize=max(1, cantidad // (4 * procesos))))
+        segundos = time.perf_counter() - inicio
+
+        inicio_serie = time.perf_counter()
+        for n in range(1, min(cantidad, 1000) + 1):
+            ecf_bytes(dict(base, encf=formatear_encf(ECF_CREDITO_FISCAL, n)))
+        serie = min(cantidad, 1000) / (time.perf_counter() - inicio_serie)
+
+    return {
+        'documentos': escritos,
+        'procesos': procesos,
+        'segundos': segundos,
+        'por_segundo': escritos / segundos if segundos else 0.0,
+        'serie_por_segundo': serie,
+        'coincide_muestra': not diferencias,
+        'diferencias': diferencias[:10],
+    }
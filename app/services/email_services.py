@@ -1,35 +1,47 @@
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+import os
 from flask import current_app, url_for
+from app.utils.transport_util import BrevoEmailTransport, FakeEmailTransport
 
-def send_invitation_email(to_email, org_name, role, token):
+# Remitente verificado en Brevo
+REMITENTE = {"name": "Veloce", "email": "dionyjunior11@gmail.com"}
+
+
+def get_email_transport():
     """
-    Envía un correo de invitación usando Brevo (Sendinblue).
-    Retorna: (True, ID_Email) si éxito, (False, Error) si falla.
+    Transporte de correo de la app (EMAIL_TRANSPORT): 'brevo' o 'fake'
+    (sin red, guarda los correos en FAKE_TRANSPORT_DIR/correos). Es uno por app:
+    todos los envíos comparten sus conexiones y el límite EMAIL_RATE_PER_SECOND.
     """
-    # Configurar la API Key
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = current_app.config.get("BREVO_API_KEY")
+    transporte = current_app.extensions.get('email_transport')
+    if transporte is None:
+        if current_app.config.get('EMAIL_TRANSPORT', 'brevo') == 'fake':
+            directorio = current_app.config.get('FAKE_TRANSPORT_DIR') or os.path.join(current_app.instance_path, 'fake_transport')
+            transporte = FakeEmailTransport(directorio, por_segundo=current_app.config.get('EMAIL_RATE_PER_SECOND', 0))
+        else:
+            transporte = BrevoEmailTransport(
+                current_app.config.get("BREVO_API_KEY"), REMITENTE,
+                pool_size=current_app.config.get('EMAIL_POOL_SIZE', 4),
+                por_segundo=current_app.config.get('EMAIL_RATE_PER_SECOND', 0)
+            )
+        current_app.extensions['email_transport'] = transporte
+    return transporte
 
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-    
-    # Generar enlace de invitación
-    invite_link = url_for('auth.register_via_invite', token=token, _external=True)
 
-    # Contenido HTML del correo
+def invitation_email(org_name, role, invite_link):
+    """Asunto y HTML del correo de invitación."""
     html_content = f"""
     <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 8px;">
         <h2 style="color: #0d6efd;">Bienvenido a Veloce</h2>
         <p>Hola,</p>
         <p>Te han invitado a unirte al equipo de <strong>{org_name}</strong> con el rol de <strong>{role.upper()}</strong>.</p>
         <p>Para configurar tu cuenta y comenzar, haz clic en el siguiente botón:</p>
-        
+
         <div style="text-align: center; margin: 30px 0;">
             <a href="{invite_link}" style="background-color: #0d6efd; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; font-weight: bold; display: inline-block;">
                 Aceptar Invitación
             </a>
         </div>
-        
+
         <p style="font-size: 12px; color: #666;">
             Si el botón no funciona, copia y pega este enlace en tu navegador:<br>
             <a href="{invite_link}">{invite_link}</a>
@@ -37,18 +49,27 @@ def send_invitation_email(to_email, org_name, role, token):
         <p style="color: #888; font-size: 12px; margin-top: 20px;">Este enlace es válido por 48 horas.</p>
     </div>
     """
+    return f"Invitación a colaborar en {org_name}", html_content
+
+
+def send_invitation_email(to_email, org_name, role, token):
+    """
+    Encola el correo de invitación (lo envía el worker, ver job_services).
+    El enlace se genera aquí porque el worker no tiene request para url_for.
+    Retorna el id del trabajo.
+    """
+    from app.services.job_services import encolar
+    invite_link = url_for('auth.register_via_invite', token=token, _external=True)
+    return encolar('email_invitacion', {
+        'to_email': to_email,
+        'org_name': org_name,
+        'role': role,
+        'invite_link': invite_link,
+    })
+
 
-    # Crear el objeto de email transaccional
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-        to=[{"email": to_email}],
-        sender={"name": "Veloce", "email": "dionyjunior11@gmail.com"}, # Asegúrate de que este remitente esté verificado en Brevo
-        subject=f"Invitación a colaborar en {org_name}",
-        html_content=html_content
-    )
-
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        return True, api_response.message_id
-    except ApiException as e:
-        print(f"Error al enviar email con Brevo: {e}")
-        return False, str(e)
\ No newline at end of file
+def tarea_email_invitacion(payload):
+    """Trabajo 'email_invitacion': envía el correo. Los errores se reintentan."""
+    asunto, html = invitation_email(payload['org_name'], payload['role'], payload['invite_link'])
+    message_id = get_email_transport().enviar(payload['to_email'], asunto, html)
+    return {'message_id': message_id}
@@ -0,0 +1,144 @@
+from datetime import datetime
+from app.services.report_generation_services import (
+    iter_cuentas_por_cobrar,
+    iter_reporte_fiscal,
+    iter_ventas_por_rango,
+    iter_gastos_por_rango
+)
+from app.services.report_services import get_cuadre, iter_cuadre_ingresos, iter_cuadre_gastos
+from app.services.importacion_services import iter_errores_importacion
+
+# ==========================================
+# FILAS DE LOS REPORTES PARA EXPORTAR
+# ==========================================
+# Cada función retorna (columnas, filas): `filas` es un generador que recorre
+# el cursor del reporte y acumula los totales en la misma pasada; la última
+# fila es la de TOTAL. Se combinan con utils/export_util.export_response.
+
+
+def _fecha(valor, formato='%Y-%m-%d'):
+    if isinstance(valor, datetime):
+        return valor.strftime(formato)
+    return str(valor) if valor else ''
+
+
+def _nombre_cliente(cliente):
+    if isinstance(cliente, dict):
+        return f"{cliente.get('nombre', '')} {cliente.get('apellido', '')}".strip()
+    return str(cliente) if cliente else ''
+
+
+def _monto(valor):
+    try:
+        return round(float(valor or 0), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def exportar_cuentas_por_cobrar(organizacion_id):
+    columnas = ['Factura', 'Cliente', 'Fecha Emisión', 'Días', 'Estado', 'Total']
+
+    def filas():
+        total = 0.0
+        for f in iter_cuentas_por_cobrar(organizacion_id):
+            total += _monto(f.get('total'))
+            dias = f.get('dias_vencido')
+            yield [
+                f.get('invoice_num', ''),
+                _nombre_cliente(f.get('cliente')),
+                _fecha(f.get('fecha_emision')),
+                int(dias) if isinstance(dias, (int, float)) else '',
+                f.get('estado', ''),
+                _monto(f.get('total'))
+            ]
+        yield ['TOTAL', '', '', '', '', round(total, 2)]
+
+    return columnas, filas()
+
+
+def exportar_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
+    columnas = ['Fecha', 'NCF / Referencia', 'Cliente', 'Base Imponible', 'ITBIS (18%)', 'Total']
+
+    def filas():
+        total_base = total_itbis = total_general = 0.0
+        for f in iter_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
+            base, itbis, total = _monto(f.get('base_imponible')), _monto(f.get('itbis_calculado')), _monto(f.get('total_facturado'))
+            total_base += base
+            total_itbis += itbis
+            total_general += total
+            yield [_fecha(f.get('fecha')), f.get('ncf', ''), _nombre_cliente(f.get('cliente')), base, itbis, total]
+        yield ['TOTAL', '', '', round(total_base, 2), round(total_itbis, 2), round(total_general, 2)]
+
+    return columnas, filas()
+
+
+def exportar_ventas_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+    columnas = ['Fecha', 'Facturas', 'Total Ventas']
+
+    def filas():
+        total_facturas = 0
+        total_ventas = 0.0
+        for v in iter_ventas_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+            total_facturas += v['cantidad_facturas']
+            total_ventas += _monto(v['total_ventas'])
+            yield [v['_id'], v['cantidad_facturas'], _monto(v['total_ventas'])]
+        yield ['TOTAL', total_facturas, round(total_ventas, 2)]
+
+    return columnas, filas()
+
+
+def exportar_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+    columnas = ['Fecha', 'Proveedor', 'Descripción', 'Categoría', 'Registrado por', 'Monto']
+
+    def filas():
+        total = 0.0
+        for g in iter_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+            total += _monto(g.get('monto'))
+            yield [
+                _fecha(g.get('fecha')),
+                g.get('proveedor') or '',
+                g.get('descripcion', ''),
+                g.get('categoria', ''),
+                g.get('registrado_por') or '',
+                _monto(g.get('monto'))
+            ]
+        yield ['TOTAL', '', '', '', '', round(total, 2)]
+
+    return columnas, filas()
+
+
+def exportar_cuadre(organizacion_id, desde, hasta, vendedor=None):
+    """
+    Detalle del cuadre leído con cursores (sirve para cierres semanales o
+    mensuales); los totales salen de get_cuadre, la misma agregación de la vista.
+    """
+    columnas = ['Tipo', 'Fecha', 'Hora', 'Referencia', 'Detalle', 'Cajero', 'Forma de Pago / Categoría', 'Monto']
+
+    def filas():
+        for i in iter_cuadre_ingresos(organizacion_id, desde, hasta, vendedor):
+            yield ['Ingreso', _fecha(i['fecha']), i['hora'], i['numero'], i['cliente'], i['vendedor'], i['forma_pago'], _monto(i['total'])]
+        for g in iter_cuadre_gastos(organizacion_id, desde, hasta, vendedor):
+            yield ['Gasto', _fecha(g['fecha']), g['hora'], '', g['descripcion'], g['registrado_por'], g['categoria'], -_monto(g['monto'])]
+        cuadre = get_cuadre(organizacion_id, desde, hasta, vendedor)
+        for f in cuadre['por_forma_pago']:
+            yield [f'TOTAL {f["forma_pago"].upper()}', '', '', '', '', '', '', _monto(f['total'])]
+        for c in cuadre['por_categoria']:
+            yield [f'GASTOS {c["categoria"]}', '', '', '', '', '', '', -_monto(c['total'])]
+        resumen = cuadre['resumen']
+        yield ['TOTAL INGRESOS', '', '', '', '', '', '', _monto(resumen['total_ingresos'])]
+        yield ['TOTAL GASTOS', '', '', '', '', '', '', -_monto(resumen['total_gastos'])]
+        yield ['BALANCE NETO', '', '', '', '', '', '', _monto(resumen['balance_neto'])]
+
+    return columnas, filas()
+
+
+def exportar_errores_importacion(importacion_id, campos):
+    """Filas rechazadas de una importación, con sus valores originales para corregirlas y reintentar."""
+    columnas = ['Fila', 'Error'] + list(campos)
+
+    def filas():
+        for e in iter_errores_importacion(importacion_id):
+            valores = e.get('valores') or {}
+            yield [e.get('fila'), e.get('error', '')] + [valores.get(c, '') for c in campos]
+
+    return columnas, filas()
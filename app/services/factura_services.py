@@ -1,20 +1,65 @@
 from flask import current_app
 from app.database import mongo
-from app.models.factura import Factura
+from app.models.factura import Factura, FacturaResumen
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 import re
 from datetime import datetime
 from math import ceil
+from app.utils.pagination_util import paginate_keyset
+from app.services.secuencia_services import siguiente_numero, formatear_numero_factura
+from app.services.search_services import apply_search, build_search_keys, refresh_search_keys
+from app.services.pdf_services import invalidar_pdf_factura
+from app.services.rollup_services import aplicar_factura, FACTURA_ROLLUP_PROJECTION
+from app.services.cache_services import bump_data_version
+from app.services.cliente_services import aplicar_factura_cliente, FACTURA_CLIENTE_PROJECTION
 
-def create_factura(organizacion_id, invoice_num, cliente, vendedor, items, total, fecha, estado='pendiente', forma_pago='efectivo'):
-    try:
+# Campos que necesitan los listados (_factura_table.html). Excluye 'items',
+# que es lo más pesado del documento, y los datos de contacto del cliente;
+# todo eso solo se carga en ver/editar factura. Del cliente incrustado se
+# proyectan nombre, apellido e id; las facturas antiguas que lo guardaron como
+# texto lo conservan tal cual (normalizar_cliente lo muestra como nombre).
+FACTURA_RESUMEN_PROJECTION = {
+    'organizacion_id': 1,
+    'invoice_num': 1,
+    'vendedor': 1,
+    'cliente': {'$cond': [
+        {'$eq': [{'$type': '$cliente'}, 'object']},
+        {'nombre': '$cliente.nombre', 'apellido': '$cliente.apellido', 'id': '$cliente.id'},
+        '$cliente'
+    ]},
+    'cliente_id': 1,
+    'fecha_emision': 1,
+    'total': 1,
+    'estado': 1,
+    'forma_pago': 1,
+}
 
-        
+# Lo que hay que leer antes de modificar o eliminar una factura para descontarla
+# de los rollups diarios y del resumen del cliente
+FACTURA_CONTADORES_PROJECTION = {**FACTURA_ROLLUP_PROJECTION, **FACTURA_CLIENTE_PROJECTION}
+
+def _factura_resumen(f):
+    return FacturaResumen(
+        id=f['_id'],
+        organizacion_id=f.get('organizacion_id'),
+        invoice_num=f.get('invoice_num'),
+        vendedor=f.get('vendedor'),
+        cliente=f.get('cliente'),
+        fecha_emision=f.get('fecha_emision'),
+        total=f.get('total'),
+        estado=f.get('estado'),
+        forma_pago=f.get('forma_pago', 'efectivo')
+    )
 
-                    
-        # Movido el insert para después de la validación
-        factura_data = mongo.db.facturas.insert_one(
-             {
+def create_factura(organizacion_id, invoice_num, cliente, vendedor, items, total, fecha, estado='pendiente', forma_pago='efectivo', descontar_stock=True):
+    """
+    Inserta la factura y, si descontar_stock es True, descuenta el inventario de
+    todas sus líneas en lote. Quien necesite los resultados por línea (para avisar
+    de faltantes) puede pasar descontar_stock=False y llamar a descontar_stock_lote.
+    """
+    try:
+        documento = {
                 'organizacion_id': ObjectId(organizacion_id),
                 'invoice_num': invoice_num,
                 'cliente':{
@@ -33,23 +78,16 @@ def create_factura(organizacion_id, invoice_num, cliente, vendedor, items, total
                 'estado': estado,
                 'forma_pago': forma_pago
             }
-        )
+        documento['search_keys'] = build_search_keys('facturas', documento)
+        factura_data = mongo.db.facturas.insert_one(documento)
+        aplicar_factura(nuevo=documento)
+        aplicar_factura_cliente(nuevo=documento)
+        bump_data_version(organizacion_id, 'facturas')
         
-        # --- DESCONTAR STOCK ---
-        from app.services.producto_services import decrease_stock
-        for item in items:
-            # Asumimos que si tiene 'producto_id' viene del inventario
-            # El campo puede venir como 'id' o 'producto_id' dependiendo de cómo lo mande el frontend
-            prod_id = item.get('producto_id') or item.get('id') 
-            
-            # Solo intentamos descontar si tenemos un ID válido (mongo object id lookalike)
-            if prod_id and len(str(prod_id)) == 24:
-                try:
-                    cantidad = float(item.get('cantidad', 0))
-                    if cantidad > 0:
-                        decrease_stock(prod_id, cantidad)
-                except ValueError:
-                    pass
+        # --- DESCONTAR STOCK (una consulta $in + un bulk_write) ---
+        if descontar_stock:
+            from app.services.producto_services import descontar_stock_lote
+            descontar_stock_lote(items)
 
         return str(factura_data.inserted_id)
     except Exception as e:
@@ -73,8 +111,7 @@ def get_factura_by_id(factura_id):
         )
     return None
 
-def list_facturas_by_organizacion(organizacion_id, page=1, per_page=10, cliente=None, fecha_desde=None, fecha_hasta=None):
-    skip = (page - 1) * per_page
+def list_facturas_by_organizacion(organizacion_id, page=1, per_page=10, cliente=None, fecha_desde=None, fecha_hasta=None, after=None, before=None):
     query = {'organizacion_id': ObjectId(organizacion_id)}
 
     # Filtro por cliente (búsqueda parcial)
@@ -90,101 +127,80 @@ def list_facturas_by_organizacion(organizacion_id, page=1, per_page=10, cliente=
         except ValueError:
             pass
 
-    total = mongo.db.facturas.count_documents(query)
-    cursor = (
-        mongo.db.facturas.find(query)
-        .skip(skip)
-        .limit(per_page)
-        .sort('fecha_emision', -1)
+    # Paginación por cursor (fecha_emision, _id) en lugar de skip
+    docs, pagination = paginate_keyset(
+        mongo.db.facturas, query, 'fecha_emision',
+        per_page=per_page, after=after, before=before, page=page,
+        projection=FACTURA_RESUMEN_PROJECTION
     )
 
-    facturas = [
-        Factura(
-            id=f['_id'],
-            organizacion_id=f['organizacion_id'],
-            invoice_num=f['invoice_num'],
-            vendedor=f['vendedor'],
-            cliente=f['cliente'],
-            fecha_emision=f['fecha_emision'],
-            items=f['items'],
-            total=f['total'],
-            estado=f['estado'],
-            forma_pago=f.get('forma_pago', 'efectivo')
-        ) for f in cursor
-    ]
-
-    pagination = {
-        'page': page,
-        'per_page': per_page,
-        'total': total,
-        'pages': ceil(total / per_page),
-        'has_prev': page > 1,
-        'has_next': page < ceil(total / per_page),
-        'prev_num': page - 1 if page > 1 else None,
-        'next_num': page + 1 if page < ceil(total / per_page) else None
-    }
+    facturas = [_factura_resumen(f) for f in docs]
 
     return facturas, pagination
 
 
 def update_factura_estado(factura_id, nuevo_estado):
     try:
-        result = (mongo.db.facturas.update_one(
-            {'_id': ObjectId(factura_id)},
-            {'$set': {'estado': nuevo_estado}}
-        ))
-        return result.modified_count > 0
+        # find_one_and_update devuelve la imagen previa de la misma escritura: los
+        # contadores reciben la diferencia real aunque otra petición cambie la
+        # factura en paralelo. El filtro por estado distinto evita contar un no-cambio.
+        anterior = mongo.db.facturas.find_one_and_update(
+            {'_id': ObjectId(factura_id), 'estado': {'$ne': nuevo_estado}},
+            {'$set': {'estado': nuevo_estado}},
+            projection=FACTURA_CONTADORES_PROJECTION,
+            return_document=ReturnDocument.BEFORE
+        )
+        if anterior is not None:
+            refresh_search_keys('facturas', factura_id)
+            invalidar_pdf_factura(factura_id)
+            aplicar_factura(anterior, {**anterior, 'estado': nuevo_estado})
+            aplicar_factura_cliente(anterior, {**anterior, 'estado': nuevo_estado})
+            bump_data_version(anterior.get('organizacion_id'), 'facturas')
+        return anterior is not None
     except Exception as e:
         print(f"Error al actualizar el estado de la factura: {e}")
         return False
     
 def modificar_factura(factura_id, factura_data):
     try:
-        result = mongo.db.facturas.update_one(
-            {'_id': ObjectId(factura_id)},
-            {'$set': factura_data}
+        # Igual que update_factura_estado; $nor descarta la factura si ya tiene
+        # todos los valores de factura_data (equivalente a modified_count == 0)
+        anterior = mongo.db.facturas.find_one_and_update(
+            {'_id': ObjectId(factura_id), '$nor': [factura_data]},
+            {'$set': factura_data},
+            projection=FACTURA_CONTADORES_PROJECTION,
+            return_document=ReturnDocument.BEFORE
         )
-        return result.modified_count > 0
+        if anterior is not None:
+            refresh_search_keys('facturas', factura_id)
+            invalidar_pdf_factura(factura_id)
+            aplicar_factura(anterior, {**anterior, **factura_data})
+            aplicar_factura_cliente(anterior, {**anterior, **factura_data})
+            bump_data_version(anterior.get('organizacion_id'), 'facturas')
+        return anterior is not None
     except Exception as e:
         print(f"Error al modificar la factura: {e}")
         return False
     
 def buscar_facturas(organizacion_id, criterio_busqueda='alan', skip=0, limit=12):
     try:
-        factura_cursor = mongo.db.facturas.find({
-            'organizacion_id': ObjectId(organizacion_id),
-            '$or': [
-                {'cliente.nombre': {'$regex': criterio_busqueda, '$options': 'i'}},
-                {'vendedor.nombre': {'$regex': criterio_busqueda, '$options': 'i'}},
-                {'estado': {'$regex': criterio_busqueda, '$options': 'i'}}
-            ]
-        }).sort('fecha_emision', -1).skip(skip).limit(limit)
-        facturas = [Factura(
-            id=factura_data['_id'],
-            organizacion_id=factura_data['organizacion_id'],
-            invoice_num=factura_data['invoice_num'],
-            vendedor=factura_data['vendedor'],
-            cliente=factura_data['cliente'],
-            fecha_emision=factura_data['fecha_emision'],
-            items=factura_data['items'],
-            total=factura_data['total'],
-            estado=factura_data['estado'],
-            forma_pago=factura_data.get('forma_pago', 'efectivo')
-        ) for factura_data in factura_cursor]
+        # Búsqueda por prefijo sobre search_keys (cliente, vendedor, estado, número)
+        query = apply_search({'organizacion_id': ObjectId(organizacion_id)}, criterio_busqueda)
+        factura_cursor = mongo.db.facturas.find(query, FACTURA_RESUMEN_PROJECTION).sort('fecha_emision', -1).skip(skip).limit(limit)
+        facturas = [_factura_resumen(factura_data) for factura_data in factura_cursor]
         return facturas
     except Exception as e:
         print(f"Error al buscar facturas: {e}")
         return []
     
 def generate_invoice_number(organizacion_id):
+    """
+    Genera el siguiente número de factura de la organización usando el contador
+    atómico de la colección `secuencias` (ver secuencia_services).
+    """
     try:
-        ultima_factura = mongo.db.facturas.find({'organizacion_id': ObjectId(organizacion_id)}).sort('invoice_num', -1).limit(1)
-        if ultima_factura.count() > 0:
-            ultimo_numero = ultima_factura[0]['invoice_num']
-            nuevo_numero = int(ultimo_numero) + 1
-        else:
-            nuevo_numero = 1
-        return str(nuevo_numero).zfill(6)  # Rellenar con ceros a la izquierda hasta 6 dígitos
+        numero = siguiente_numero(organizacion_id, 'factura')
+        return formatear_numero_factura(numero)
     except Exception as e:
         print(f"Error al generar el número de factura: {e}")
         return None
@@ -200,37 +216,24 @@ def count_facturas_by_organizacion(organizacion_id):
     
 def eliminar_fact(factura_id):
     try:
-        result = mongo.db.facturas.delete_one({'_id': ObjectId(factura_id)})
-        return result.deleted_count > 0
+        # find_one_and_delete retorna lo eliminado para descontarlo de los rollups y del cliente
+        eliminada = mongo.db.facturas.find_one_and_delete({'_id': ObjectId(factura_id)}, projection=FACTURA_CONTADORES_PROJECTION)
+        if eliminada:
+            invalidar_pdf_factura(factura_id)
+            aplicar_factura(anterior=eliminada)
+            aplicar_factura_cliente(anterior=eliminada)
+            bump_data_version(eliminada.get('organizacion_id'), 'facturas')
+        return eliminada is not None
     except Exception as e:
         print(f"Error al eliminar la factura: {e}")
         return False
     
     
 def list_facturas_by_criterio(organizacion_id, criterio_busqueda, skip=0, limit=12):
-    factura_cursor = mongo.db.facturas.find({
-        'organizacion_id': ObjectId(organizacion_id),
-        '$or': [
-            {'cliente.nombre': {'$regex': criterio_busqueda, '$options': 'i'}},
-            {'vendedor.nombre': {'$regex': criterio_busqueda, '$options': 'i'}},
-            {'estado': {'$regex': criterio_busqueda, '$options': 'i'}}
-        ]
-    }).skip(skip).limit(limit).sort('fecha_emision', -1)
+    query = apply_search({'organizacion_id': ObjectId(organizacion_id)}, criterio_busqueda)
+    factura_cursor = mongo.db.facturas.find(query, FACTURA_RESUMEN_PROJECTION).skip(skip).limit(limit).sort('fecha_emision', -1)
     
-    facturas = [
-        Factura(
-            id=f['_id'],
-            organizacion_id=f['organizacion_id'],
-            invoice_num=f['invoice_num'],
-            vendedor=f['vendedor'],
-            cliente=f['cliente'],
-            fecha_emision=f['fecha_emision'],
-            items=f['items'],
-            total=f['total'],
-            estado=f.get('estado', 'pendiente'),
-            forma_pago=f.get('forma_pago', 'efectivo')
-        ) for f in factura_cursor
-    ]
+    facturas = [_factura_resumen(f) for f in factura_cursor]
     return facturas
 
 
@@ -275,28 +278,11 @@ def list_facturas_filtradas(organizacion_id, filters, skip=0, limit=12):
             fecha_query['$lte'] = filters['fecha_hasta']
         query['fecha_emision'] = fecha_query
     
-    factura_cursor = mongo.db.facturas.find(query)\
+    factura_cursor = mongo.db.facturas.find(query, FACTURA_RESUMEN_PROJECTION)\
         .skip(skip).limit(limit)\
         .sort('fecha_emision', -1)
     
-    # Aseguramos que f tenga forma_pago antes de desempaquetar o instanciamos explícitamente
-    facturas_obj = []
-    for f in factura_cursor:
-        # Inyectamos el default si no existe para que **f funcione si las claves coinciden con los argumentos
-        # Pero es mejor ser explícito:
-        facturas_obj.append(Factura(
-            id=f.get('_id'),
-            organizacion_id=f.get('organizacion_id'),
-            invoice_num=f.get('invoice_num'),
-            vendedor=f.get('vendedor'),
-            cliente=f.get('cliente'),
-            fecha_emision=f.get('fecha_emision'),
-            items=f.get('items', []),
-            total=f.get('total'),
-            estado=f.get('estado'),
-            forma_pago=f.get('forma_pago', 'efectivo')
-        ))
-    return facturas_obj
+    return [_factura_resumen(f) for f in factura_cursor]
 
 
 def list_facturas_by_cliente(cliente_id, page=1, per_page=5):
@@ -314,28 +300,14 @@ def list_facturas_by_cliente(cliente_id, page=1, per_page=5):
 
         total = mongo.db.facturas.count_documents(query)
         cursor = (
-            mongo.db.facturas.find(query)
+            mongo.db.facturas.find(query, FACTURA_RESUMEN_PROJECTION)
             .skip(skip)
             .limit(per_page)
             .sort('fecha_emision', -1)
         )
 
-        facturas = []
-        for f in cursor:
-            # Reconstruye el objeto Factura
-            # Nota: 'cliente' aquí es el DICT incrustado, ¡lo cual es perfecto!
-            facturas.append(Factura(
-                id=f['_id'],
-                organizacion_id=f.get('organizacion_id'),
-                invoice_num=f.get('invoice_num'),
-                vendedor=f.get('vendedor'),
-                cliente=f.get('cliente'), # El dict incrustado
-                fecha_emision=f.get('fecha_emision'),
-                items=f.get('items', []),
-                total=f.get('total'),
-                estado=f.get('estado'),
-                forma_pago=f.get('forma_pago', 'efectivo')
-            ))
+        # Nota: 'cliente' aquí es el DICT incrustado, ¡lo cual es perfecto!
+        facturas = [_factura_resumen(f) for f in cursor]
         
         # Tu lógica de paginación manual
         pagination = {
@@ -4,10 +4,14 @@ from datetime import datetime
 from bson.objectid import ObjectId
 from flask import current_app as app
 from math import ceil
+from ..utils.pagination_util import paginate_keyset
+from .search_services import apply_search, build_search_keys
+from .rollup_services import aplicar_gasto, GASTO_ROLLUP_PROJECTION
+from .cache_services import bump_data_version
 
-def crear_gastos(organizacion_id, descripcion, monto, categoria, fecha, proveedor=None, comprobante=None, registrado_por=None):
+def crear_gastos(organizacion_id, descripcion, monto, categoria, fecha, proveedor=None, comprobante=None, registrado_por=None, rnc_proveedor=None, ncf=None, itbis=None):
     try:
-        nuevo_gasto =  mongo.db.gastos.insert_one( {
+        documento = {
             "organizacion_id": ObjectId(organizacion_id),
             "descripcion": descripcion,
             "monto": float(monto),
@@ -15,8 +19,15 @@ def crear_gastos(organizacion_id, descripcion, monto, categoria, fecha, proveedo
             "fecha": fecha,
             "proveedor": proveedor,
             "comprobante": comprobante,
-            "registrado_por": registrado_por
-        })
+            "registrado_por": registrado_por,
+            "rnc_proveedor": rnc_proveedor,
+            "ncf": ncf,
+            "itbis": float(itbis) if itbis else 0.0
+        }
+        documento["search_keys"] = build_search_keys('gastos', documento)
+        nuevo_gasto = mongo.db.gastos.insert_one(documento)
+        aplicar_gasto(nuevo=documento)
+        bump_data_version(organizacion_id, 'gastos')
         app.logger.info(f"Gasto creado con ID: {nuevo_gasto.inserted_id}")
   
         return str(nuevo_gasto.inserted_id)
@@ -37,7 +48,10 @@ def get_gastos_by_id(gasto_id):
                 fecha=gasto_data['fecha'],
                 proveedor=gasto_data.get('proveedor'),
                 comprobante=gasto_data.get('comprobante'),
-                registrado_por=gasto_data.get('registrado_por')
+                registrado_por=gasto_data.get('registrado_por'),
+                rnc_proveedor=gasto_data.get('rnc_proveedor'),
+                ncf=gasto_data.get('ncf'),
+                itbis=gasto_data.get('itbis')
             )
             return gasto
         else:
@@ -49,13 +63,11 @@ def get_gastos_by_id(gasto_id):
 
 
 
-def list_gastos_by_organizacion(organizacion_id, page=1, per_page=10, categoria=None, fecha_desde=None, fecha_hasta=None, search=None):
+def list_gastos_by_organizacion(organizacion_id, page=1, per_page=10, categoria=None, fecha_desde=None, fecha_hasta=None, search=None, after=None, before=None):
     """
-    Lista los gastos de una organización con paginación y múltiples filtros.
+    Lista los gastos de una organización con paginación por cursor y múltiples filtros.
     """
     try:
-        skip = (page - 1) * per_page
-        
         # Filtro base: Solo gastos de esta organización
         query = {'organizacion_id': ObjectId(organizacion_id)}
         
@@ -65,12 +77,9 @@ def list_gastos_by_organizacion(organizacion_id, page=1, per_page=10, categoria=
         if categoria and categoria != "":
             query['categoria'] = categoria
             
-        # 2. Búsqueda por Texto (Regex en Descripción o Proveedor)
+        # 2. Búsqueda por Texto (prefijo indexado en Descripción o Proveedor)
         if search and search != "":
-            query['$or'] = [
-                {'descripcion': {'$regex': search, '$options': 'i'}},
-                {'proveedor': {'$regex': search, '$options': 'i'}}
-            ]
+            apply_search(query, search)
 
         # 3. Rango de Fechas
         if fecha_desde and fecha_hasta:
@@ -85,13 +94,10 @@ def list_gastos_by_organizacion(organizacion_id, page=1, per_page=10, categoria=
 
         # --- Ejecución de la Consulta ---
         
-        total = mongo.db.gastos.count_documents(query)
-        
-        cursor = (
-            mongo.db.gastos.find(query)
-            .skip(skip)
-            .limit(per_page)
-            .sort('fecha', -1) # Ordenar: Más recientes primero
+        # Paginación por cursor (fecha, _id): más recientes primero, sin skip
+        docs, pagination = paginate_keyset(
+            mongo.db.gastos, query, 'fecha',
+            per_page=per_page, after=after, before=before, page=page
         )
         
         # Convertimos los documentos BSON a objetos Gasto
@@ -106,21 +112,9 @@ def list_gastos_by_organizacion(organizacion_id, page=1, per_page=10, categoria=
                 proveedor=g.get('proveedor'),
                 comprobante=g.get('comprobante'),
                 registrado_por=g.get('registrado_por')
-            ) for g in cursor
+            ) for g in docs
         ]
         
-        # Construimos el objeto de paginación
-        pagination = {
-            'page': page,
-            'per_page': per_page,
-            'total': total,
-            'pages': ceil(total / per_page),
-            'has_prev': page > 1,
-            'has_next': page < ceil(total / per_page),
-            'prev_num': page - 1,
-            'next_num': page + 1
-        }
-        
         return gastos, pagination
         
     except Exception as e:
@@ -130,8 +124,13 @@ def list_gastos_by_organizacion(organizacion_id, page=1, per_page=10, categoria=
     
 def eliminar_gasto(organizacion_id, gasto_id):
     try:
-        resultado = mongo.db.gastos.delete_one({"_id": ObjectId(gasto_id), "organizacion_id": ObjectId(organizacion_id)})
-        if resultado.deleted_count == 1:
+        eliminado = mongo.db.gastos.find_one_and_delete(
+            {"_id": ObjectId(gasto_id), "organizacion_id": ObjectId(organizacion_id)},
+            projection=GASTO_ROLLUP_PROJECTION
+        )
+        if eliminado:
+            aplicar_gasto(anterior=eliminado)
+            bump_data_version(organizacion_id, 'gastos')
             app.logger.info(f"Gasto con ID {gasto_id} eliminado exitosamente.")
             return True
         else:
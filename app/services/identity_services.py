@@ -0,0 +1,117 @@
+import threading
+import time
+from bson.objectid import ObjectId
+from flask import current_app, g, has_app_context
+from app.database import mongo
+from app.utils.cache_util import LRUCache, MISS
+
+# ==========================================
+# CACHÉ DE IDENTIDAD (usuarios y organizaciones)
+# ==========================================
+# load_user se ejecuta en cada request (incluidas las búsquedas HTMX) y varias
+# vistas vuelven a leer la organización. Los documentos se guardan en dos
+# niveles:
+#   1. El request (flask.g): una sola lectura por request aunque se pida varias veces.
+#   2. Un LRU del proceso (con IDENTITY_CACHE_TTL como red de seguridad).
+# Cada entrada del LRU guarda junto al documento la versión de identidad con la
+# que se leyó: el campo `identidad` del documento de `versiones_datos` cuyo _id
+# es el mismo ObjectId del usuario/organización. Igual que el catálogo en
+# memoria, esa versión se vuelve a consultar como máximo cada
+# IDENTITY_VERSION_CHECK_SECONDS; entre verificaciones un request no hace
+# ninguna consulta de identidad. Si cambió, se relee el documento.
+# Las escrituras sobre usuarios/organizaciones llaman a invalidar_usuario /
+# invalidar_organizacion, que incrementan esa versión en MongoDB y descartan la
+# entrada local: el proceso que escribe ve el cambio enseguida y los demás (web
+# y worker) a lo sumo IDENTITY_VERSION_CHECK_SECONDS después.
+#
+# Se guardan los documentos (dict), no los modelos: cada llamador construye su
+# propio objeto y no comparte instancias entre requests.
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUCache(max_entries=current_app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 2048))
+    return _cache
+
+
+def _memo_request():
+    if not has_app_context():
+        return {}
+    if not hasattr(g, '_identidad'):
+        g._identidad = {}
+    return g._identidad
+
+
+def _version_identidad(oid):
+    doc = mongo.db.versiones_datos.find_one({'_id': oid}, {'identidad': 1})
+    return (doc or {}).get('identidad', 0)
+
+
+def _obtener(coleccion, doc_id):
+    try:
+        oid = ObjectId(str(doc_id))
+    except Exception:
+        return None
+    clave = f'{coleccion}:{oid}'
+    memo = _memo_request()
+    if clave in memo:
+        return memo[clave]
+
+    cache = _get_cache()
+    entrada = cache.get(clave)
+    intervalo = current_app.config.get('IDENTITY_VERSION_CHECK_SECONDS', 5)
+    if entrada is not MISS and time.monotonic() - entrada[2] < intervalo:
+        # Verificada hace poco: ninguna consulta a MongoDB
+        doc = entrada[1]
+    else:
+        # La versión se lee antes que el documento: si una invalidación ocurre en
+        # medio, la entrada queda con la versión vieja y se relee en la próxima verificación
+        version = _version_identidad(oid)
+        if entrada is not MISS and entrada[0] == version:
+            entrada[2] = time.monotonic()
+            doc = entrada[1]
+        else:
+            doc = mongo.db[coleccion].find_one({'_id': oid})
+            # Los inexistentes no se guardan: un id recién creado debe verse enseguida
+            if doc is not None:
+                cache.set(clave, [version, doc, time.monotonic()], current_app.config.get('IDENTITY_CACHE_TTL', 60))
+            else:
+                cache.delete(clave)
+    memo[clave] = doc
+    return doc
+
+
+def _invalidar(coleccion, doc_id):
+    try:
+        oid = ObjectId(str(doc_id))
+    except Exception:
+        return
+    clave = f'{coleccion}:{oid}'
+    mongo.db.versiones_datos.update_one({'_id': oid}, {'$inc': {'identidad': 1}}, upsert=True)
+    _memo_request().pop(clave, None)
+    if _cache is not None:
+        _cache.delete(clave)
+
+
+def get_usuario_data(user_id):
+    """Documento del usuario (o None) desde la caché de identidad."""
+    return _obtener('usuarios', user_id)
+
+
+def get_organizacion_data(organizacion_id):
+    """Documento de la organización (o None) desde la caché de identidad."""
+    return _obtener('organizaciones', organizacion_id)
+
+
+def invalidar_usuario(user_id):
+    _invalidar('usuarios', user_id)
+
+
+def invalidar_organizacion(organizacion_id):
+    _invalidar('organizaciones', organizacion_id)
@@ -0,0 +1,238 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument
+from app.database import mongo
+from app.services.cache_services import bump_data_version
+from app.services.catalogo_services import bump_catalogo_version
+from app.services.organizacion_services import crear_organizacion_temporal, eliminar_organizacion_temporal
+from app.services.cliente_services import ALIAS_CLIENTES, importar_clientes_lote
+from app.services.producto_services import ALIAS_PRODUCTOS, importar_productos_lote
+from app.services.job_services import encolar, renovar_bloqueo, ErrorPermanente
+from app.utils.date_util import get_now
+from app.utils.import_util import contar_filas, formato_archivo, leer_filas, lotes
+
+# ==========================================
+# IMPORTACIÓN MASIVA DESDE CSV / XLSX
+# ==========================================
+# La ruta guarda el documento de la importación en `importaciones` y encola un
+# trabajo 'importacion' con el archivo; el worker lo recorre fila por fila
+# (utils/import_util.leer_filas) en lotes de IMPORT_BATCH_SIZE. Cada tipo
+# registra en _IMPORTADORES:
+#   - alias: columnas del archivo -> campos
+#   - lote: función(organizacion_id, filas, estado) -> (contadores, errores),
+#     que valida y escribe el lote completo con operaciones masivas. `estado`
+#     es un dict que se conserva entre lotes (p. ej. correos ya vistos).
+# El progreso son contadores con $inc en el documento de la importación y las
+# filas rechazadas quedan en `importacion_errores` para descargarlas.
+
+IMPORTACION_PENDIENTE = 'pendiente'
+IMPORTACION_EN_PROCESO = 'en_proceso'
+IMPORTACION_COMPLETADA = 'completada'
+IMPORTACION_ERROR = 'error'
+
+_CONTADORES = ('procesadas', 'insertadas', 'actualizadas', 'duplicadas', 'invalidas', 'inactivas')
+
+
+def _importar_clientes(organizacion_id, filas, estado):
+    return importar_clientes_lote(organizacion_id, filas, estado.setdefault('vistos', set()))
+
+
+def _importar_productos(organizacion_id, filas, estado):
+    return importar_productos_lote(organizacion_id, filas, estado.setdefault('codigos', set()))
+
+
+# tipo -> (alias de columnas, importador del lote)
+_IMPORTADORES = {
+    'clientes': (ALIAS_CLIENTES, _importar_clientes),
+    'productos': (ALIAS_PRODUCTOS, _importar_productos),
+}
+TIPOS_IMPORTACION = tuple(_IMPORTADORES)
+
+
+def campos_importacion(tipo):
+    """Campos que acepta el tipo, en el orden de sus alias (plantilla y reporte de errores)."""
+    return list(dict.fromkeys(_IMPORTADORES[tipo][0].values()))
+
+
+def crear_importacion(organizacion_id, tipo, archivo, usuario=None):
+    """
+    Registra la importación de `archivo` (FileStorage) y encola su trabajo.
+    Retorna el id de la importación. Lanza ValueError si el formato no es
+    CSV/XLSX o el archivo supera IMPORT_MAX_BYTES.
+    """
+    if tipo not in _IMPORTADORES:
+        raise ValueError(f'Tipo de importación desconocido: {tipo}')
+    formato = formato_archivo(archivo.filename)
+    if not formato:
+        raise ValueError('El archivo debe ser .csv o .xlsx')
+    contenido = archivo.read()
+    maximo = current_app.config.get('IMPORT_MAX_BYTES', 12 * 1024 * 1024)
+    if len(contenido) > maximo:
+        raise ValueError(f'El archivo supera el máximo de {maximo // (1024 * 1024)} MB')
+    if not contenido:
+        raise ValueError('El archivo está vacío')
+
+    importacion_id = _registrar(
+        organizacion_id, tipo, archivo.filename, formato, contar_filas(io.BytesIO(contenido), formato), usuario
+    )
+    # Un solo intento: reintentar a medias duplicaría el trabajo ya contado
+    encolar('importacion', {'importacion_id': importacion_id, 'contenido': Binary(contenido)}, max_intentos=1)
+    return importacion_id
+
+
+def _registrar(organizacion_id, tipo, nombre_archivo, formato, total_filas, usuario):
+    return str(mongo.db.importaciones.insert_one({
+        'organizacion_id': ObjectId(organizacion_id),
+        'tipo': tipo,
+        'nombre_archivo': nombre_archivo,
+        'formato': formato,
+        'usuario': usuario,
+        'estado': IMPORTACION_PENDIENTE,
+        'total_filas': total_filas,
+        'creado_en': get_now(),
+        'errores': 0,
+        **{c: 0 for c in _CONTADORES},
+    }).inserted_id)
+
+
+def get_importacion(organizacion_id, importacion_id):
+    try:
+        return mongo.db.importaciones.find_one({
+            '_id': ObjectId(importacion_id), 'organizacion_id': ObjectId(organizacion_id)
+        })
+    except Exception:
+        return None
+
+
+def list_importaciones(organizacion_id, tipo, limit=10):
+    return list(mongo.db.importaciones.find(
+        {'organizacion_id': ObjectId(organizacion_id), 'tipo': tipo}
+    ).sort('creado_en', -1).limit(limit))
+
+
+def _guardar_errores(importacion_id, errores):
+    if errores:
+        mongo.db.importacion_errores.insert_many([
+            {'importacion_id': importacion_id, 'fila': numero, 'valores': registro, 'error': error}
+            for numero, registro, error in errores
+        ], ordered=False)
+
+
+def iter_errores_importacion(importacion_id, batch_size=1000):
+    return mongo.db.importacion_errores.find(
+        {'importacion_id': ObjectId(importacion_id)}, batch_size=batch_size
+    ).sort('fila', 1)
+
+
+def ejecutar_importacion(importacion_id, binario):
+    """Procesa el archivo (binario con seek) de la importación. Retorna el documento final."""
+    importacion_id = ObjectId(importacion_id)
+    importacion = mongo.db.importaciones.find_one_and_update(
+        {'_id': importacion_id},
+        {'$set': {'estado': IMPORTACION_EN_PROCESO, 'iniciado_en': get_now()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if importacion is None:
+        raise ErrorPermanente(f'La importación {importacion_id} no existe')
+    organizacion_id = importacion['organizacion_id']
+    alias, importador = _IMPORTADORES[importacion['tipo']]
+    tamano = current_app.config.get('IMPORT_BATCH_SIZE', 1000)
+    estado = {}
+
+    try:
+        for lote in lotes(leer_filas(binario, importacion['formato'], alias), tamano):
+            # Un solo intento: el bloqueo no puede vencer a mitad del archivo
+            if not renovar_bloqueo():
+                raise ErrorPermanente('La importación fue tomada por otro worker')
+            contadores, errores = importador(organizacion_id, lote, estado)
+            _guardar_errores(importacion_id, errores)
+            mongo.db.importaciones.update_one(
+                {'_id': importacion_id},
+                {'$inc': {**contadores, 'errores': len(errores)}, '$set': {'actualizado_en': get_now()}}
+            )
+    except Exception as e:
+        current_app.logger.error(f'Importación {importacion_id} falló: {e}')
+        mongo.db.importaciones.update_one(
+            {'_id': importacion_id},
+            {'$set': {'estado': IMPORTACION_ERROR, 'error': str(e), 'finalizado_en': get_now()}}
+        )
+        raise ErrorPermanente(str(e))
+    finally:
+        bump_data_version(organizacion_id, importacion['tipo'])
+        if importacion['tipo'] == 'productos':
+            # Cambio masivo: los índices del catálogo se recargan completos
+            bump_catalogo_version(organizacion_id)
+
+    return mongo.db.importaciones.find_one_and_update(
+        {'_id': importacion_id},
+        {'$set': {'estado': IMPORTACION_COMPLETADA, 'finalizado_en': get_now()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def importar_archivo(organizacion_id, tipo, ruta, usuario=None):
+    """Importa un archivo local en este proceso (CLI). Retorna el documento final."""
+    formato = formato_archivo(ruta)
+    if tipo not in _IMPORTADORES or not formato:
+        raise ValueError('Tipo o formato de archivo no soportado')
+    with open(ruta, 'rb') as archivo:
+        importacion_id = _registrar(
+            organizacion_id, tipo, os.path.basename(ruta), formato, contar_filas(archivo, formato), usuario
+        )
+        return ejecutar_importacion(importacion_id, archivo)
+
+
+def benchmark_importacion_productos(filas=100000, conservar=False):
+    """
+    Importa un catálogo sintético de `filas` productos (códigos BENCH-*) en una
+    organización temporal y luego lo vuelve a importar cambiando precio y
+    stock. Retorna (organizacion_id, filas/s de cada pasada). Sin `conservar`,
+    la organización temporal y sus datos se eliminan al final.
+    """
+    def escribir(ruta, factor):
+        with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+            escritor = csv.writer(archivo)
+            if factor == 1:
+                escritor.writerow(['codigo', 'nombre', 'precio', 'stock', 'tipo'])
+                escritor.writerows(
+                    [f'BENCH-{i:06d}', f'Producto de prueba {i}', f'{10 + i % 500}.00', i % 100, 'Producto']
+                    for i in range(filas)
+                )
+            else:
+                escritor.writerow(['codigo', 'precio', 'stock'])
+                escritor.writerows([f'BENCH-{i:06d}', f'{(10 + i % 500) * factor:.2f}', i % 50] for i in range(filas))
+
+    organizacion_id = crear_organizacion_temporal('Benchmark importación de productos')
+    resultados = {}
+    directorio = tempfile.mkdtemp()
+    try:
+        for pasada, factor in (('alta', 1), ('actualizacion', 1.1)):
+            ruta = os.path.join(directorio, f'{pasada}.csv')
+            escribir(ruta, factor)
+            importacion = importar_archivo(organizacion_id, 'productos', ruta, usuario='benchmark')
+            segundos = max((importacion['finalizado_en'] - importacion['iniciado_en']).total_seconds(), 0.001)
+            resultados[pasada] = {
+                'filas': importacion['procesadas'],
+                'segundos': round(segundos, 2),
+                'filas_por_segundo': round(importacion['procesadas'] / segundos),
+                'insertadas': importacion['insertadas'],
+                'actualizadas': importacion['actualizadas'],
+                'errores': importacion['errores'],
+            }
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+        if not conservar:
+            eliminar_organizacion_temporal(organizacion_id)
+    return organizacion_id, resultados
+
+
+def tarea_importacion(payload):
+    """Trabajo 'importacion' de la cola (job_services)."""
+    importacion = ejecutar_importacion(payload['importacion_id'], io.BytesIO(bytes(payload['contenido'])))
+    return {c: importacion.get(c, 0) for c in _CONTADORES}
@@ -0,0 +1,252 @@
+import importlib
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from bson.objectid import ObjectId
+from flask import current_app, g
+from pymongo import ReturnDocument
+from app.database import mongo
+from app.utils.date_util import get_now
+
+# ==========================================
+# COLA DE TRABAJOS EN SEGUNDO PLANO
+# ==========================================
+# Colección `jobs`: las rutas solo encolan (encolar) y un proceso aparte
+# (worker.py / `flask veloce worker`) los ejecuta. Ciclo de vida:
+#
+#   pendiente --(tomar_siguiente)--> en_proceso --> completado
+#        ^                               |
+#        +---- reintento con backoff ----+--> fallido (dead-letter)
+#
+# - Un worker toma el trabajo con find_one_and_update, así que dos workers nunca
+#   ejecutan el mismo. El trabajo queda "bloqueado" JOBS_LEASE_SECONDS; si el
+#   worker muere, otro lo retoma al vencer el bloqueo.
+# - Cada fallo espera JOBS_BACKOFF_SECONDS * 2^(intento-1) (con tope y jitter).
+#   Al agotar JOBS_MAX_ATTEMPTS, o con ErrorPermanente, queda en 'fallido' con el
+#   historial de errores y se puede reencolar con reintentar_fallidos.
+# - Las tareas largas (cobranza, importación) llaman a renovar_bloqueo mientras
+#   avanzan para que otro worker no las retome por un bloqueo vencido.
+# - Con JOBS_EAGER=1 (desarrollo sin worker) se ejecutan en el mismo request.
+
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+COMPLETADO = 'completado'
+FALLIDO = 'fallido'
+ESTADOS = (PENDIENTE, EN_PROCESO, COMPLETADO, FALLIDO)
+
+# Tipo de trabajo -> 'modulo:funcion'. La función recibe el payload y retorna
+# un resultado serializable (se guarda en el job).
+TAREAS = {
+    'email_invitacion': 'app.services.email_services:tarea_email_invitacion',
+    'subir_imagen': 'app.services.upload_services:tarea_subir_imagen',
+    'cobranza': 'app.services.cobranza_services:tarea_cobranza',
+    'importacion': 'app.services.importacion_services:tarea_importacion',
+}
+
+# Historial de errores guardado por trabajo
+_MAX_HISTORIAL = 10
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+class ErrorPermanente(Exception):
+    """Fallo que no se corrige reintentando: el trabajo pasa directo a 'fallido'."""
+
+
+def _handler(tipo):
+    with _handlers_lock:
+        if tipo not in _handlers:
+            modulo, funcion = TAREAS[tipo].split(':')
+            _handlers[tipo] = getattr(importlib.import_module(modulo), funcion)
+        return _handlers[tipo]
+
+
+def _config(nombre, defecto):
+    return current_app.config.get(nombre, defecto)
+
+
+def encolar(tipo, payload, max_intentos=None, retraso_segundos=0):
+    """Guarda un trabajo pendiente y retorna su id."""
+    if tipo not in TAREAS:
+        raise ValueError(f'Tipo de trabajo desconocido: {tipo}')
+    ahora = get_now()
+    job = {
+        'tipo': tipo,
+        'payload': payload,
+        'estado': PENDIENTE,
+        'intentos': 0,
+        'max_intentos': max_intentos or _config('JOBS_MAX_ATTEMPTS', 5),
+        'disponible_en': ahora + timedelta(seconds=retraso_segundos),
+        'creado_en': ahora,
+        'errores': [],
+    }
+    job_id = mongo.db.jobs.insert_one(job).inserted_id
+
+    if _config('JOBS_EAGER', False):
+        tomado = mongo.db.jobs.find_one_and_update(
+            {'_id': job_id, 'estado': PENDIENTE},
+            {'$set': {'estado': EN_PROCESO, 'worker': 'eager', 'iniciado_en': ahora}, '$inc': {'intentos': 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if tomado:
+            ejecutar_job(tomado, 'eager')
+    return job_id
+
+
+def tomar_siguiente(worker_id):
+    """Marca como en_proceso el siguiente trabajo disponible (o uno con el bloqueo vencido)."""
+    ahora = get_now()
+    return mongo.db.jobs.find_one_and_update(
+        {'$or': [
+            {'estado': PENDIENTE, 'disponible_en': {'$lte': ahora}},
+            {'estado': EN_PROCESO, 'bloqueado_hasta': {'$lt': ahora}},
+        ]},
+        {
+            '$set': {
+                'estado': EN_PROCESO,
+                'worker': worker_id,
+                'iniciado_en': ahora,
+                'bloqueado_hasta': ahora + timedelta(seconds=_config('JOBS_LEASE_SECONDS', 300)),
+            },
+            '$inc': {'intentos': 1},
+        },
+        sort=[('disponible_en', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def backoff_segundos(intento):
+    """Espera antes del siguiente intento: exponencial, con tope y ±20% de jitter."""
+    base = _config('JOBS_BACKOFF_SECONDS', 30)
+    espera = min(base * 2 ** max(intento - 1, 0), _config('JOBS_BACKOFF_MAX_SECONDS', 3600))
+    return espera * random.uniform(0.8, 1.2)
+
+
+def _completar(job, worker_id, resultado):
+    mongo.db.jobs.update_one(
+        {'_id': job['_id'], 'worker': worker_id},
+        {
+            '$set': {'estado': COMPLETADO, 'resultado': resultado, 'finalizado_en': get_now()},
+            # Los archivos adjuntos ya no se necesitan
+            '$unset': {'payload.contenido': '', 'bloqueado_hasta': ''},
+        }
+    )
+
+
+def _fallar(job, worker_id, error, permanente=False):
+    ahora = get_now()
+    registro = {'intento': job['intentos'], 'fecha': ahora, 'error': error}
+    agotado = permanente or job['intentos'] >= job['max_intentos']
+    cambios = {'ultimo_error': error}
+    if agotado:
+        cambios.update({'estado': FALLIDO, 'finalizado_en': ahora})
+    else:
+        cambios.update({
+            'estado': PENDIENTE,
+            'disponible_en': ahora + timedelta(seconds=backoff_segundos(job['intentos'])),
+        })
+    mongo.db.jobs.update_one(
+        {'_id': job['_id'], 'worker': worker_id},
+        {
+            '$set': cambios,
+            '$unset': {'bloqueado_hasta': ''},
+            '$push': {'errores': {'$each': [registro], '$slice': -_MAX_HISTORIAL}},
+        }
+    )
+    return FALLIDO if agotado else PENDIENTE
+
+
+def renovar_bloqueo():
+    """
+    Extiende JOBS_LEASE_SECONDS el bloqueo del trabajo que se ejecuta en este
+    contexto. Se puede llamar en cada lote: escribe como máximo una vez por
+    tercio del bloqueo. Fuera de un trabajo no hace nada. Retorna False si el
+    trabajo ya no pertenece a este worker.
+    """
+    actual = g.get('_job_actual')
+    if actual is None:
+        return True
+    duracion = _config('JOBS_LEASE_SECONDS', 300)
+    if time.monotonic() - actual['renovado'] < duracion / 3:
+        return True
+    resultado = mongo.db.jobs.update_one(
+        {'_id': actual['id'], 'worker': actual['worker'], 'estado': EN_PROCESO},
+        {'$set': {'bloqueado_hasta': get_now() + timedelta(seconds=duracion)}}
+    )
+    actual['renovado'] = time.monotonic()
+    return resultado.matched_count == 1
+
+
+def ejecutar_job(job, worker_id):
+    """Ejecuta un trabajo ya tomado. Retorna el estado en que queda."""
+    if job['intentos'] > job['max_intentos']:
+        # Retomado tras la caída de un worker en su último intento
+        return _fallar(job, worker_id, 'Intentos agotados (worker interrumpido)', permanente=True)
+    g._job_actual = {'id': job['_id'], 'worker': worker_id, 'renovado': time.monotonic()}
+    try:
+        resultado = _handler(job['tipo'])(job['payload'])
+    except ErrorPermanente as e:
+        current_app.logger.error(f"Trabajo {job['_id']} ({job['tipo']}) falló sin reintento: {e}")
+        return _fallar(job, worker_id, str(e), permanente=True)
+    except Exception as e:
+        current_app.logger.warning(f"Trabajo {job['_id']} ({job['tipo']}) intento {job['intentos']} falló: {e}")
+        return _fallar(job, worker_id, f'{e.__class__.__name__}: {e}\n{traceback.format_exc(limit=5)}')
+    finally:
+        g.pop('_job_actual', None)
+    _completar(job, worker_id, resultado)
+    return COMPLETADO
+
+
+def worker_id_por_defecto():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def run_worker(app, worker_id=None, detener=None, max_jobs=None):
+    """
+    Bucle del worker: toma y ejecuta trabajos hasta que `detener` (threading.Event)
+    se active o se procesen `max_jobs`. Cada trabajo corre en su propio contexto
+    de aplicación (las cachés de `g` no se arrastran entre trabajos).
+    """
+    worker_id = worker_id or worker_id_por_defecto()
+    detener = detener or threading.Event()
+    espera = app.config.get('JOBS_POLL_SECONDS', 2)
+    procesados = 0
+    app.logger.info(f'Worker {worker_id} iniciado')
+    while not detener.is_set() and (max_jobs is None or procesados < max_jobs):
+        with app.app_context():
+            job = tomar_siguiente(worker_id)
+            if job is not None:
+                ejecutar_job(job, worker_id)
+                procesados += 1
+                continue
+        detener.wait(espera)
+    app.logger.info(f'Worker {worker_id} detenido ({procesados} trabajos)')
+    return procesados
+
+
+def reintentar_fallidos(job_id=None, tipo=None):
+    """Reencola trabajos en 'fallido' (dead-letter) con los intentos en cero."""
+    filtro = {'estado': FALLIDO}
+    if job_id:
+        filtro['_id'] = ObjectId(job_id)
+    if tipo:
+        filtro['tipo'] = tipo
+    resultado = mongo.db.jobs.update_many(
+        filtro,
+        {
+            '$set': {'estado': PENDIENTE, 'intentos': 0, 'disponible_en': get_now()},
+            '$unset': {'finalizado_en': ''},
+        }
+    )
+    return resultado.modified_count
+
+
+def resumen_jobs():
+    """{(tipo, estado): cantidad} para monitoreo."""
+    pipeline = [{'$group': {'_id': {'tipo': '$tipo', 'estado': '$estado'}, 'cantidad': {'$sum': 1}}}]
+    return {(r['_id']['tipo'], r['_id']['estado']): r['cantidad'] for r in mongo.db.jobs.aggregate(pipeline)}
@@ -2,12 +2,14 @@ from ..database import mongo
 from ..models.organizacion import Organizacion
 from flask import current_app as app
 from bson.objectid import ObjectId
+from .pdf_services import invalidar_pdf_organizacion
+from .identity_services import get_organizacion_data, invalidar_organizacion
 
 
 
 def get_organizacion_by_id(organizacion_id):
     try:
-        organizacion_data = mongo.db.organizaciones.find_one({"_id": ObjectId(organizacion_id)})
+        organizacion_data = get_organizacion_data(organizacion_id)
         if organizacion_data:
             organizacion = Organizacion(
                 organizacion_id=str(organizacion_data['_id']),
@@ -39,9 +41,58 @@ def update_organizacion(organizacion_id, nombre, direccion, telefono, email, rnc
         if logo:
             update_data['logo'] = logo
         mongo.db.organizaciones.update_one({"_id": ObjectId(organizacion_id)}, {"$set": update_data})
+        invalidar_organizacion(organizacion_id)
+        invalidar_pdf_organizacion(organizacion_id)
         app.logger.info(f"Organizacion con ID {organizacion_id} actualizada exitosamente.")
         return True
     except Exception as e:
         app.logger.error(f"Error al actualizar organizacion: {e}")
         return False
-        
\ No newline at end of file
+        
+
+# ==========================================
+# ORGANIZACIONES TEMPORALES (benchmarks)
+# ==========================================
+# Los comandos de benchmark cargan datos sintéticos en una organización creada
+# para la corrida (marcada con 'temporal': True) y no en la de un cliente real.
+# Al terminar se eliminan la organización y todo lo que quedó a su nombre.
+
+# Colecciones con documentos por organizacion_id
+_COLECCIONES_POR_ORGANIZACION = (
+    'productos', 'clientes', 'clientes_ngrams', 'clientes_ngrams_frecuencias', 'facturas', 'gastos', 'rollups', 'importaciones',
+)
+
+
+def crear_organizacion_temporal(nombre):
+    """Crea una organización vacía marcada como temporal y retorna su id (str)."""
+    resultado = mongo.db.organizaciones.insert_one({
+        'nombre': nombre,
+        'direccion': '',
+        'telefono': '',
+        'email': '',
+        'rnc': '',
+        'logo': None,
+        'temporal': True
+    })
+    return str(resultado.inserted_id)
+
+
+def eliminar_organizacion_temporal(organizacion_id):
+    """
+    Elimina una organización creada con crear_organizacion_temporal y sus datos.
+    No hace nada (retorna False) si la organización no está marcada como temporal.
+    """
+    org_id = ObjectId(organizacion_id)
+    if not mongo.db.organizaciones.count_documents({'_id': org_id, 'temporal': True}, limit=1):
+        return False
+    importaciones = [i['_id'] for i in mongo.db.importaciones.find({'organizacion_id': org_id}, {'_id': 1})]
+    if importaciones:
+        mongo.db.importacion_errores.delete_many({'importacion_id': {'$in': [str(i) for i in importaciones]}})
+    for coleccion in _COLECCIONES_POR_ORGANIZACION:
+        mongo.db[coleccion].delete_many({'organizacion_id': org_id})
+    mongo.db.secuencias.delete_many({'_id': {'$regex': f'^{org_id}:'}})
+    mongo.db.organizaciones.delete_one({'_id': org_id})
+    invalidar_organizacion(org_id)
+    # Al final: invalidar_organizacion incrementa su versión en versiones_datos
+    mongo.db.versiones_datos.delete_one({'_id': org_id})
+    return True
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from io import BytesIO
+from bson import Binary
+from bson.objectid import ObjectId
+from flask import current_app, render_template
+from app.database import mongo
+
+# ==========================================
+# PDF DE FACTURAS EN EL SERVIDOR
+# ==========================================
+# El PDF se genera con xhtml2pdf a partir de factura/factura_print.html y se
+# guarda en la colección `pdf_cache` bajo el hash del contenido (factura +
+# organización + versión de la plantilla). El mismo hash sirve de ETag, así que
+# una descarga repetida se responde desde la caché o con 304 sin renderizar.
+
+# Subir este valor al cambiar factura_print.html para invalidar todos los PDFs
+PDF_TEMPLATE_VERSION = 1
+
+
+def _json_default(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+
+def factura_pdf_hash(factura, organizacion):
+    """Hash del contenido que se imprime en el PDF."""
+    contenido = {
+        'version': PDF_TEMPLATE_VERSION,
+        'factura': {
+            'id': factura.id,
+            'invoice_num': factura.invoice_num,
+            'vendedor': factura.vendedor,
+            'cliente': factura.cliente,
+            'fecha_emision': factura.fecha_emision,
+            'items': factura.items,
+            'total': factura.total,
+            'estado': factura.estado,
+            'forma_pago': factura.forma_pago,
+        },
+        'organizacion': organizacion.to_dict() if organizacion else None,
+    }
+    serializado = json.dumps(contenido, sort_keys=True, default=_json_default)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+def _link_callback(uri, rel):
+    """Resuelve /static/... a la ruta local para que xhtml2pdf no haga HTTP contra la propia app."""
+    static_url = current_app.static_url_path.rstrip('/') + '/'
+    if uri.startswith(static_url):
+        return os.path.join(current_app.static_folder, uri[len(static_url):])
+    return uri
+
+
+def renderizar_factura_pdf(factura, organizacion):
+    """Genera los bytes del PDF. Lanza RuntimeError si xhtml2pdf no está instalado."""
+    try:
+        from xhtml2pdf import pisa
+    except ImportError:
+        raise RuntimeError("xhtml2pdf no está instalado; no se puede generar el PDF en el servidor")
+
+    html = render_template('factura/factura_print.html', factura=factura, organizacion=organizacion)
+    salida = BytesIO()
+    resultado = pisa.CreatePDF(html, dest=salida, encoding='utf-8', link_callback=_link_callback)
+    if resultado.err:
+        raise RuntimeError(f"Error al generar el PDF de la factura {factura.invoice_num}")
+    return salida.getvalue()
+
+
+def get_factura_pdf(factura, organizacion, etag=None):
+    """
+    Retorna (pdf_bytes, etag). Si `etag` ya se calculó se reutiliza.
+    El PDF sale de `pdf_cache` cuando existe; si no, se renderiza y se guarda.
+    """
+    etag = etag or factura_pdf_hash(factura, organizacion)
+    cache = mongo.db.pdf_cache.find_one({'_id': etag}, {'pdf': 1})
+    if cache:
+        return bytes(cache['pdf']), etag
+
+    pdf = renderizar_factura_pdf(factura, organizacion)
+    try:
+        mongo.db.pdf_cache.replace_one(
+            {'_id': etag},
+            {
+                '_id': etag,
+                'factura_id': ObjectId(str(factura.id)),
+                'organizacion_id': ObjectId(str(factura.organizacion_id)),
+                'pdf': Binary(pdf),
+                'created_at': datetime.utcnow()
+            },
+            upsert=True
+        )
+    except Exception as e:
+        current_app.logger.warning(f"No se pudo guardar el PDF en caché: {e}")
+    return pdf, etag
+
+
+def invalidar_pdf_factura(factura_id):
+    """Elimina los PDFs en caché de una factura (llamado al modificarla)."""
+    try:
+        mongo.db.pdf_cache.delete_many({'factura_id': ObjectId(str(factura_id))})
+    except Exception as e:
+        print(f"Error al invalidar el PDF de la factura: {e}")
+
+
+def invalidar_pdf_organizacion(organizacion_id):
+    """Elimina los PDFs en caché de una organización (cambio de logo, RNC, etc.)."""
+    try:
+        mongo.db.pdf_cache.delete_many({'organizacion_id': ObjectId(str(organizacion_id))})
+    except Exception as e:
+        print(f"Error al invalidar los PDFs de la organización: {e}")
@@ -1,10 +1,33 @@
+from flask import current_app, flash
 from app.database import mongo
 from app.models.producto import Producto
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 import math
-import re
+from app.utils.pagination_util import paginate_keyset
+from app.services.search_services import apply_search, build_search_keys, refresh_search_keys
+from app.services.cache_services import bump_data_version
+from app.services.catalogo_services import bump_catalogo_version, buscar_en_catalogo, producto_por_codigo
+from app.services.secuencia_services import existe_secuencia, reservar_bloque, sembrar_secuencia
+from app.utils.import_util import a_numero
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+def _mensaje_codigo_duplicado(organizacion_id, codigo):
+    existente = mongo.db.productos.find_one(
+        {"organizacion_id": ObjectId(str(organizacion_id)), "codigo": codigo}, {"nombre": 1, "activo": 1}
+    ) or {}
+    if existente.get('activo') is False:
+        return f"El código '{codigo}' pertenece al producto desactivado '{existente.get('nombre')}'"
+    return f"Ya existe un producto con el código '{codigo}' ({existente.get('nombre')})"
+
 
 def create_producto(organizacion_id, nombre, precio, codigo=None, descripcion=None, tipo='Servicio', stock=0):
+    """
+    Crea el producto. El código es único por organización (índice
+    org_codigo_unique): si pertenece a un producto desactivado, ese producto se
+    reactiva con los datos nuevos (conserva su _id y su historial); si está
+    activo, se avisa con flash y retorna None.
+    """
     try:
         if not codigo:
             codigo = generate_next_sku(organizacion_id)
@@ -19,37 +42,66 @@ def create_producto(organizacion_id, nombre, precio, codigo=None, descripcion=No
             tipo=tipo,
             stock=stock
         )
-        result = mongo.db.productos.insert_one(nuevo_producto.to_dict())
-        return str(result.inserted_id)
+        documento = nuevo_producto.to_dict()
+        documento['search_keys'] = build_search_keys('productos', documento)
+        try:
+            producto_id = mongo.db.productos.insert_one(documento).inserted_id
+        except DuplicateKeyError:
+            reactivado = mongo.db.productos.find_one_and_update(
+                {"organizacion_id": documento['organizacion_id'], "codigo": codigo, "activo": False},
+                {"$set": documento},
+                projection={"_id": 1}
+            )
+            if not reactivado:
+                flash(_mensaje_codigo_duplicado(organizacion_id, codigo), 'danger')
+                return None
+            producto_id = reactivado['_id']
+            flash(f"El código '{codigo}' era de un producto desactivado: se reactivó con los datos nuevos.", 'info')
+        bump_data_version(organizacion_id, 'productos')
+        bump_catalogo_version(organizacion_id, [producto_id])
+        return str(producto_id)
     except Exception as e:
         print(f"Error creating product: {e}")
+        flash('Error al crear el producto', 'danger')
         return None
 
+SKU_PREFIJO = 'PROD-'
+# Contador atómico de SKUs automáticos en `secuencias` (ver secuencia_services)
+SECUENCIA_SKU = 'sku'
+# Marcas de descuento que guarda cada producto para confirmar qué líneas de una
+# venta se aplicaron (descontar_stock_lote)
+DESCUENTOS_RECIENTES = 20
+
+
+def formatear_sku(numero):
+    return f"{SKU_PREFIJO}{str(numero).zfill(5)}"
+
+
+def _ultimo_sku_existente(organizacion_id):
+    """Mayor número de los SKU automáticos creados antes de existir el contador."""
+    resultado = list(mongo.db.productos.aggregate([
+        {"$match": {"organizacion_id": ObjectId(organizacion_id), "codigo": {"$regex": f"^{SKU_PREFIJO}[0-9]+$"}}},
+        {"$group": {"_id": None, "maximo": {"$max": {"$toLong": {"$substrCP": ["$codigo", len(SKU_PREFIJO), 20]}}}}}
+    ]))
+    return resultado[0]['maximo'] if resultado and resultado[0].get('maximo') else 0
+
+
+def reservar_skus(organizacion_id, cantidad):
+    """
+    Reserva `cantidad` SKUs consecutivos (PROD-00001...) con un solo $inc
+    atómico: dos creaciones simultáneas nunca reciben el mismo código. La
+    primera vez el contador arranca desde los SKU que ya existen.
+    """
+    if not existe_secuencia(organizacion_id, SECUENCIA_SKU):
+        sembrar_secuencia(organizacion_id, SECUENCIA_SKU, _ultimo_sku_existente(organizacion_id))
+    primero, ultimo = reservar_bloque(organizacion_id, SECUENCIA_SKU, cantidad)
+    return [formatear_sku(numero) for numero in range(primero, ultimo + 1)]
+
+
 def generate_next_sku(organizacion_id):
     """Genera un SKU secuencial automático (ej. PROD-00001) para la organización."""
     try:
-        # Buscar el último producto creado con un SKU automático (que empiece por PROD-)
-        last_prod = mongo.db.productos.find_one(
-            {
-                "organizacion_id": ObjectId(organizacion_id),
-                "codigo": {"$regex": "^PROD-"}
-            },
-            sort=[("_id", -1)]
-        )
-        
-        if last_prod and 'codigo' in last_prod:
-            # Extraer el número
-            last_code = last_prod['codigo']
-            try:
-                # Asumimos formato PROD-XXXXX
-                number_part = int(last_code.split('-')[1])
-                new_number = number_part + 1
-            except (IndexError, ValueError):
-                new_number = 1
-        else:
-            new_number = 1
-            
-        return f"PROD-{str(new_number).zfill(5)}"
+        return reservar_skus(organizacion_id, 1)[0]
     except Exception as e:
         print(f"Error generating SKU: {e}")
         import uuid
@@ -74,26 +126,22 @@ def get_producto_by_id(producto_id):
         print(f"Error getting product: {e}")
         return None
 
-def list_productos_by_organizacion(organizacion_id, page=1, per_page=10, search=None):
+def list_productos_by_organizacion(organizacion_id, page=1, per_page=10, search=None, after=None, before=None):
     try:
         query = {"organizacion_id": ObjectId(organizacion_id), "activo": True}
         
         if search:
-            # Búsqueda por nombre o código (case insensitive)
-            regex = re.compile(search, re.IGNORECASE)
-            query["$or"] = [
-                {"nombre": {"$regex": regex}},
-                {"codigo": {"$regex": regex}}
-            ]
-
-        total_productos = mongo.db.productos.count_documents(query)
-        total_pages = math.ceil(total_productos / per_page)
-        
-        skip = (page - 1) * per_page
-        cursor = mongo.db.productos.find(query).skip(skip).limit(per_page)
+            # Búsqueda por prefijo de nombre o código (sin mayúsculas ni acentos)
+            apply_search(query, search)
+
+        # Paginación por cursor sobre _id (más recientes primero), sin skip
+        docs, pagination = paginate_keyset(
+            mongo.db.productos, query, '_id',
+            per_page=per_page, after=after, before=before, page=page
+        )
         
         productos = []
-        for data in cursor:
+        for data in docs:
             productos.append(Producto(
                 id=str(data['_id']),
                 organizacion_id=data['organizacion_id'],
@@ -104,16 +152,6 @@ def list_productos_by_organizacion(organizacion_id, page=1, per_page=10, search=
                 tipo=data.get('tipo', 'Servicio'),
                 stock=data.get('stock', 0)
             ))
-            
-        pagination = {
-            'page': page,
-            'pages': total_pages,
-            'total': total_productos,
-            'has_prev': page > 1,
-            'has_next': page < total_pages,
-            'prev_num': page - 1,
-            'next_num': page + 1
-        }
         
         return productos, pagination
     except Exception as e:
@@ -128,23 +166,40 @@ def update_producto(producto_id, data):
             data['precio'] = float(data['precio'])
         if 'stock' in data:
             data['stock'] = int(data['stock'])
+        if 'codigo' in data and not data['codigo']:
+            data.pop('codigo')  # Un código vacío no reemplaza el actual
             
-        mongo.db.productos.update_one(
-            {"_id": ObjectId(producto_id)},
-            {"$set": data}
-        )
+        try:
+            producto = mongo.db.productos.find_one_and_update(
+                {"_id": ObjectId(producto_id)},
+                {"$set": data},
+                projection={"organizacion_id": 1}
+            )
+        except DuplicateKeyError:
+            actual = mongo.db.productos.find_one({"_id": ObjectId(producto_id)}, {"organizacion_id": 1}) or {}
+            flash(_mensaje_codigo_duplicado(actual.get('organizacion_id'), data['codigo']), 'danger')
+            return False
+        refresh_search_keys('productos', producto_id)
+        if producto:
+            bump_data_version(producto.get('organizacion_id'), 'productos')
+            bump_catalogo_version(producto.get('organizacion_id'), [producto_id])
         return True
     except Exception as e:
         print(f"Error updating product: {e}")
+        flash('Error al actualizar el producto', 'danger')
         return False
 
 def delete_producto(producto_id):
     try:
         # Soft delete
-        mongo.db.productos.update_one(
+        producto = mongo.db.productos.find_one_and_update(
             {"_id": ObjectId(producto_id)},
-            {"$set": {"activo": False}}
+            {"$set": {"activo": False}},
+            projection={"organizacion_id": 1}
         )
+        if producto:
+            bump_data_version(producto.get('organizacion_id'), 'productos')
+            bump_catalogo_version(producto.get('organizacion_id'), [producto_id])
         return True
     except Exception as e:
         print(f"Error deleting product: {e}")
@@ -152,17 +207,17 @@ def delete_producto(producto_id):
 
 def search_productos_by_nombre_codigo(organizacion_id, query_str):
     try:
+        if query_str and current_app.config.get('CATALOGO_INDEX', True):
+            # Typeahead del POS: índice en memoria (catalogo_services)
+            return buscar_en_catalogo(organizacion_id, query_str)
+
         query = {
             "organizacion_id": ObjectId(organizacion_id),
             "activo": True
         }
         
         if query_str:
-            regex = re.compile(query_str, re.IGNORECASE)
-            query["$or"] = [
-                {"nombre": {"$regex": regex}},
-                {"codigo": {"$regex": regex}}
-            ]
+            apply_search(query, query_str)
             
         cursor = mongo.db.productos.find(query).limit(10)
         
@@ -214,6 +269,8 @@ def check_stock_availability(producto_id, cantidad_requerida):
 def get_producto_by_sku(organizacion_id, sku):
     """Busca un producto por su código SKU."""
     try:
+        if current_app.config.get('CATALOGO_INDEX', True):
+            return producto_por_codigo(organizacion_id, sku)
         data = mongo.db.productos.find_one({
             "organizacion_id": ObjectId(organizacion_id),
             "codigo": sku
@@ -250,8 +307,240 @@ def decrease_stock(producto_id, quantity):
                 {"_id": ObjectId(producto_id)},
                 {"$inc": {"stock": -int(quantity)}}
             )
+            bump_data_version(prod_data.get('organizacion_id'), 'productos')
+            bump_catalogo_version(prod_data.get('organizacion_id'), [producto_id])
             return True
         return True # Si es servicio no hacemos nada pero retornamos éxito
     except Exception as e:
         print(f"Error decreasing stock: {e}")
         return False
+
+def descontar_stock_lote(items):
+    """
+    Valida y descuenta el stock de todas las líneas de una factura con una sola
+    consulta $in y un solo bulk_write de $inc condicionales
+    (tipo != 'Servicio' y stock >= cantidad). Si no alcanza, la línea no se descuenta.
+
+    Cada $inc agrega además una marca propia a `descuentos_recientes` del
+    producto (últimas DESCUENTOS_RECIENTES): si otra venta consumió el stock
+    entre la lectura y la escritura, se releen los productos afectados y las
+    líneas cuya marca no está quedan con ok=False.
+
+    Retorna una lista con un resultado por cada línea que referencia un producto:
+    {'indice', 'producto_id', 'nombre', 'cantidad', 'ok', 'mensaje'}
+    """
+    lineas = []
+    for indice, item in enumerate(items):
+        prod_id = item.get('producto_id') or item.get('id')
+        if not prod_id or not ObjectId.is_valid(str(prod_id)):
+            continue  # Ítem manual sin inventario
+        try:
+            cantidad = int(float(item.get('cantidad', 0)))
+        except (TypeError, ValueError):
+            continue
+        if cantidad > 0:
+            lineas.append((indice, ObjectId(str(prod_id)), cantidad))
+
+    if not lineas:
+        return []
+
+    try:
+        ids = list({prod_id for _, prod_id, _ in lineas})
+        productos = {
+            p['_id']: p for p in mongo.db.productos.find(
+                {"_id": {"$in": ids}},
+                {"nombre": 1, "tipo": 1, "stock": 1, "organizacion_id": 1}
+            )
+        }
+        # Stock disponible simulado en memoria para líneas repetidas del mismo producto
+        disponible = {prod_id: int(p.get('stock', 0)) for prod_id, p in productos.items()}
+
+        resultados = []
+        operaciones = []
+        descontados = []
+        for indice, prod_id, cantidad in lineas:
+            prod = productos.get(prod_id)
+            resultado = {
+                'indice': indice,
+                'producto_id': str(prod_id),
+                'nombre': prod.get('nombre') if prod else None,
+                'cantidad': cantidad,
+                'ok': True,
+                'mensaje': None
+            }
+            # Producto borrado o servicio: no se valida stock
+            if prod and prod.get('tipo') != 'Servicio':
+                if disponible[prod_id] >= cantidad:
+                    disponible[prod_id] -= cantidad
+                    marca = ObjectId()
+                    descontados.append((resultado, prod_id, marca))
+                    operaciones.append(UpdateOne(
+                        {"_id": prod_id, "tipo": {"$ne": "Servicio"}, "stock": {"$gte": cantidad}},
+                        {
+                            "$inc": {"stock": -cantidad},
+                            "$push": {"descuentos_recientes": {"$each": [marca], "$slice": -DESCUENTOS_RECIENTES}}
+                        }
+                    ))
+                else:
+                    resultado['ok'] = False
+                    resultado['mensaje'] = f"Stock insuficiente para '{prod['nombre']}' (Stock: {disponible[prod_id]}, Solicitado: {cantidad})"
+            resultados.append(resultado)
+
+        if operaciones:
+            escritura = mongo.db.productos.bulk_write(operaciones, ordered=True)
+            por_organizacion = {}
+            for _, prod_id, _ in descontados:
+                por_organizacion.setdefault(productos[prod_id].get('organizacion_id'), set()).add(prod_id)
+            for organizacion_id, tocados in por_organizacion.items():
+                bump_data_version(organizacion_id, 'productos')
+                bump_catalogo_version(organizacion_id, tocados)
+            if escritura.modified_count < len(operaciones):
+                # Otra venta consumió stock entre la lectura y la escritura: las
+                # líneas sin su marca en el producto no se descontaron
+                print(f"Advertencia: {len(operaciones) - escritura.modified_count} descuentos de stock no aplicados por concurrencia")
+                actuales = {
+                    p['_id']: p for p in mongo.db.productos.find(
+                        {"_id": {"$in": list({prod_id for _, prod_id, _ in descontados})}},
+                        {"stock": 1, "descuentos_recientes": 1}
+                    )
+                }
+                for resultado, prod_id, marca in descontados:
+                    actual = actuales.get(prod_id) or {}
+                    if marca not in (actual.get('descuentos_recientes') or []):
+                        resultado['ok'] = False
+                        resultado['mensaje'] = (
+                            f"Stock insuficiente para '{resultado['nombre']}': otra venta lo consumió "
+                            f"(Stock: {actual.get('stock', 0)}, Solicitado: {resultado['cantidad']})"
+                        )
+
+        return resultados
+    except Exception as e:
+        print(f"Error descontando stock en lote: {e}")
+        return [
+            {'indice': indice, 'producto_id': str(prod_id), 'nombre': None, 'cantidad': cantidad,
+             'ok': False, 'mensaje': "Error verificando inventario"}
+            for indice, prod_id, cantidad in lineas
+        ]
+
+
+# ==========================================
+# IMPORTACIÓN DEL CATÁLOGO (ver importacion_services)
+# ==========================================
+
+# Columna normalizada del archivo -> campo del producto
+ALIAS_PRODUCTOS = {
+    'codigo': 'codigo', 'sku': 'codigo', 'codigo_de_barras': 'codigo', 'codigo_barras': 'codigo', 'barcode': 'codigo',
+    'nombre': 'nombre', 'producto': 'nombre',
+    'precio': 'precio', 'precio_venta': 'precio',
+    'stock': 'stock', 'existencia': 'stock', 'inventario': 'stock',
+    'tipo': 'tipo',
+    'descripcion': 'descripcion',
+}
+TIPOS_PRODUCTO = ('Producto', 'Servicio')
+
+
+def _campos_producto_importado(registro):
+    """Campos presentes en la fila, ya convertidos. Retorna (campos, error)."""
+    campos = {c: registro[c] for c in ('codigo', 'nombre', 'descripcion') if registro.get(c)}
+    if registro.get('precio'):
+        precio = a_numero(registro['precio'])
+        if precio is None or precio < 0:
+            return None, 'Precio inválido'
+        campos['precio'] = precio
+    if registro.get('stock'):
+        stock = a_numero(registro['stock'])
+        if stock is None or not stock.is_integer():
+            return None, 'Stock inválido'
+        campos['stock'] = int(stock)
+    if registro.get('tipo'):
+        tipo = registro['tipo'].capitalize()
+        if tipo not in TIPOS_PRODUCTO:
+            return None, f"Tipo inválido (use {' o '.join(TIPOS_PRODUCTO)})"
+        campos['tipo'] = tipo
+    return campos, None
+
+
+def importar_productos_lote(organizacion_id, filas, vistos):
+    """
+    Crea o actualiza (por `codigo`) un lote de filas (numero_fila, registro).
+    Una consulta $in indica qué códigos ya existen; los productos nuevos sin
+    código reciben un bloque de SKUs con un solo $inc, y todo el lote se
+    escribe con un bulk_write(ordered=False) de upserts. Las filas de productos
+    existentes pueden traer solo los campos a cambiar (p. ej. precio y stock);
+    las de productos desactivados se rechazan y se cuentan en 'inactivas'.
+    Retorna (contadores, errores).
+    """
+    org_id = ObjectId(organizacion_id)
+    contadores = {'procesadas': len(filas), 'insertadas': 0, 'actualizadas': 0, 'duplicadas': 0, 'invalidas': 0, 'inactivas': 0}
+    errores = []
+    validas = []
+    for numero, registro in filas:
+        campos, error = _campos_producto_importado(registro)
+        if error:
+            contadores['invalidas'] += 1
+            errores.append((numero, registro, error))
+        elif campos.get('codigo') and campos['codigo'] in vistos:
+            contadores['duplicadas'] += 1
+            errores.append((numero, registro, 'Código repetido en el archivo'))
+        else:
+            if campos.get('codigo'):
+                vistos.add(campos['codigo'])
+            validas.append((numero, registro, campos))
+
+    codigos = [campos['codigo'] for _, _, campos in validas if campos.get('codigo')]
+    existentes = {
+        p['codigo']: p.get('activo', True) for p in mongo.db.productos.find(
+            {"organizacion_id": org_id, "codigo": {"$in": codigos}}, {"codigo": 1, "activo": 1, "_id": 0}
+        )
+    } if codigos else {}
+
+    aceptadas = []
+    for numero, registro, campos in validas:
+        if existentes.get(campos.get('codigo')) is False:
+            # Un producto dado de baja no se modifica ni se reactiva desde el archivo
+            contadores['inactivas'] += 1
+            errores.append((numero, registro, 'El código pertenece a un producto desactivado'))
+        elif campos.get('codigo') not in existentes and not ('nombre' in campos and 'precio' in campos):
+            contadores['invalidas'] += 1
+            errores.append((numero, registro, 'Un producto nuevo requiere nombre y precio'))
+        else:
+            aceptadas.append((numero, registro, campos))
+
+    sin_codigo = [campos for _, _, campos in aceptadas if not campos.get('codigo')]
+    if sin_codigo:
+        for campos, sku in zip(sin_codigo, reservar_skus(organizacion_id, len(sin_codigo))):
+            campos['codigo'] = sku
+
+    operaciones = []
+    for _, _, campos in aceptadas:
+        cambios = dict(campos)
+        if 'nombre' in campos:
+            cambios['search_keys'] = build_search_keys('productos', campos)
+        # Valores de Producto para los campos que la fila no trae (solo al crear).
+        # `activo` va aquí: reimportar un código dado de baja no lo reactiva
+        por_defecto = {
+            'organizacion_id': org_id,
+            'activo': True,
+            'descripcion': None,
+            'tipo': 'Producto' if 'stock' in campos else 'Servicio',
+            'stock': 0,
+        }
+        operaciones.append(UpdateOne(
+            {"organizacion_id": org_id, "codigo": campos['codigo']},
+            {"$set": cambios, "$setOnInsert": {k: v for k, v in por_defecto.items() if k not in cambios}},
+            upsert=True
+        ))
+
+    if operaciones:
+        try:
+            resultado = mongo.db.productos.bulk_write(operaciones, ordered=False)
+            contadores['insertadas'] = resultado.upserted_count
+            contadores['actualizadas'] = resultado.matched_count
+        except BulkWriteError as e:
+            contadores['insertadas'] = e.details.get('nUpserted', 0)
+            contadores['actualizadas'] = e.details.get('nMatched', 0)
+            for fallo in e.details.get('writeErrors', []):
+                numero, registro, _ = aceptadas[fallo['index']]
+                errores.append((numero, registro, fallo.get('errmsg', 'Error al guardar')))
+            contadores['invalidas'] += len(e.details.get('writeErrors', []))
+    return contadores, errores
@@ -1,16 +1,26 @@
 from app import mongo
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+from math import ceil
+from app.services.rollup_services import iter_rollups, valor_rollup, ESTADO_PAGADO
+from app.services.cache_services import cached_report
 
-def get_cuentas_por_cobrar(organizacion_id):
-    """
-    Retorna todas las facturas que están pendientes de pago.
-    Estados considerados deuda: 'Pendiente', 'Enviado', 'Vencido'
-    """
-    pipeline = [
+# Documentos por lote al recorrer cursores en las exportaciones (CSV/XLSX)
+EXPORT_BATCH_SIZE = 500
+
+# Estados considerados deuda (cuentas por cobrar y cobranza)
+ESTADOS_POR_COBRAR = ["Pendiente", "Enviado", "Vencido"]
+
+def _rango(fecha_inicio, fecha_fin):
+    start = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    end = datetime.strptime(fecha_fin, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    return start, end
+
+def _pipeline_cuentas_por_cobrar(organizacion_id):
+    return [
         {"$match": {
             "organizacion_id": ObjectId(organizacion_id),
-            "estado": {"$in": ["Pendiente", "Enviado", "Vencido"]}
+            "estado": {"$in": ESTADOS_POR_COBRAR}
         }},
         {"$project": {
             "invoice_num": 1,
@@ -27,17 +37,133 @@ def get_cuentas_por_cobrar(organizacion_id):
         }},
         {"$sort": {"fecha_emision": 1}} # Las más antiguas primero
     ]
-    return list(mongo.db.facturas.aggregate(pipeline))
 
-def get_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
+def iter_cuentas_por_cobrar(organizacion_id, batch_size=EXPORT_BATCH_SIZE):
+    """Cursor de get_cuentas_por_cobrar, para recorrerlo sin cargarlo en memoria."""
+    return mongo.db.facturas.aggregate(_pipeline_cuentas_por_cobrar(organizacion_id), batchSize=batch_size)
+
+@cached_report()
+def get_cuentas_por_cobrar(organizacion_id):
     """
-    Genera reporte para impuestos (ITBIS).
-    Asume que el TOTAL guardado incluye ITBIS (18%).
+    Retorna todas las facturas que están pendientes de pago.
+    Estados considerados deuda: 'Pendiente', 'Enviado', 'Vencido'
     """
-    start = datetime.strptime(fecha_inicio, '%Y-%m-%d')
-    end = datetime.strptime(fecha_fin, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    return list(mongo.db.facturas.aggregate(_pipeline_cuentas_por_cobrar(organizacion_id)))
+
+# ==========================================
+# ANTIGÜEDAD DE SALDOS (AGING)
+# ==========================================
+# Tramos por días desde la emisión. Los límites son los de $bucket: cada tramo
+# incluye su límite inferior y excluye el siguiente; lo demás cae en '90+'.
+AGING_LIMITES = [0, 31, 61, 91]
+AGING_TRAMOS = ['0-30', '31-60', '61-90', '90+']
+_MS_DIA = 1000 * 60 * 60 * 24
+
+def _pipeline_aging_cxc(organizacion_id, ahora, skip, limit):
+    cliente_key = {"$ifNull": ["$cliente_id", {"$ifNull": ["$cliente.correo", {"$ifNull": ["$cliente.nombre", "$cliente"]}]}]}
+    por_tramo = {}
+    for etiqueta, desde, hasta in zip(AGING_TRAMOS, AGING_LIMITES, AGING_LIMITES[1:] + [None]):
+        condicion = [{"$gte": ["$dias", desde]}]
+        if hasta is not None:
+            condicion.append({"$lt": ["$dias", hasta]})
+        por_tramo[etiqueta] = {"$sum": {"$cond": [{"$and": condicion}, "$total", 0]}}
 
-    pipeline = [
+    return [
+        {"$match": {
+            "organizacion_id": ObjectId(organizacion_id),
+            "estado": {"$in": ESTADOS_POR_COBRAR}
+        }},
+        {"$project": {
+            "cliente_id": 1,
+            "cliente": 1,
+            "total": 1,
+            "fecha_emision": 1,
+            "dias": {"$max": [0, {"$floor": {"$divide": [{"$subtract": [ahora, "$fecha_emision"]}, _MS_DIA]}}]}
+        }},
+        # Una sola lectura de las facturas para los totales por tramo y la tabla por cliente
+        {"$facet": {
+            "tramos": [
+                {"$bucket": {
+                    "groupBy": "$dias",
+                    "boundaries": AGING_LIMITES,
+                    "default": AGING_TRAMOS[-1],
+                    "output": {"total": {"$sum": "$total"}, "cantidad": {"$sum": 1}}
+                }}
+            ],
+            "clientes": [
+                {"$group": {
+                    "_id": cliente_key,
+                    "cliente": {"$first": "$cliente"},
+                    "total": {"$sum": "$total"},
+                    "cantidad": {"$sum": 1},
+                    "mas_antigua": {"$min": "$fecha_emision"},
+                    **por_tramo
+                }},
+                {"$sort": {"total": -1, "_id": 1}},
+                {"$skip": skip},
+                {"$limit": limit}
+            ],
+            "conteo": [
+                {"$group": {"_id": cliente_key}},
+                {"$count": "clientes"}
+            ]
+        }}
+    ]
+
+@cached_report()
+def get_aging_cxc(organizacion_id, page=1, per_page=20):
+    """
+    Antigüedad de las cuentas por cobrar en una sola agregación.
+    Retorna (resumen, clientes, pagination):
+    - resumen: {'tramos': [{'tramo', 'total', 'cantidad'}], 'total', 'cantidad'}
+      sobre todas las facturas por cobrar.
+    - clientes: la página pedida de clientes ordenados por deuda, cada uno con
+      el total por tramo en 'tramos'.
+    """
+    page = max(int(page or 1), 1)
+    resultado = next(mongo.db.facturas.aggregate(
+        _pipeline_aging_cxc(organizacion_id, datetime.now(), (page - 1) * per_page, per_page),
+        allowDiskUse=True
+    ))
+
+    por_tramo = {AGING_TRAMOS[AGING_LIMITES.index(t['_id'])] if t['_id'] in AGING_LIMITES else t['_id']: t
+                 for t in resultado['tramos']}
+    tramos = [
+        {'tramo': etiqueta, 'total': por_tramo.get(etiqueta, {}).get('total', 0), 'cantidad': por_tramo.get(etiqueta, {}).get('cantidad', 0)}
+        for etiqueta in AGING_TRAMOS
+    ]
+    resumen = {
+        'tramos': tramos,
+        'total': sum(t['total'] for t in tramos),
+        'cantidad': sum(t['cantidad'] for t in tramos),
+    }
+
+    clientes = [{
+        'cliente_id': c['_id'] if isinstance(c['_id'], ObjectId) else None,
+        'cliente': c.get('cliente'),
+        'total': c['total'],
+        'cantidad': c['cantidad'],
+        'mas_antigua': c.get('mas_antigua'),
+        'tramos': {etiqueta: c.get(etiqueta, 0) for etiqueta in AGING_TRAMOS},
+    } for c in resultado['clientes']]
+
+    total = resultado['conteo'][0]['clientes'] if resultado['conteo'] else 0
+    pages = ceil(total / per_page) if per_page else 0
+    pagination = {
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': pages,
+        'has_prev': page > 1,
+        'has_next': page < pages,
+        'prev_num': page - 1 if page > 1 else None,
+        'next_num': page + 1 if page < pages else None
+    }
+    return resumen, clientes, pagination
+
+def _pipeline_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
+    start, end = _rango(fecha_inicio, fecha_fin)
+    return [
         {"$match": {
             "organizacion_id": ObjectId(organizacion_id),
             "estado": "Pagado", # Solo facturas pagadas o emitidas? Usualmente emitidas validas.
@@ -45,7 +171,7 @@ def get_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
         }},
         {"$project": {
             "fecha": "$fecha_emision",
-            "ncf": "$invoice_num", # Asumiendo invoice_num como referencia fiscal
+            "ncf": {"$ifNull": ["$ncf", "$invoice_num"]}, # eNCF asignado en el cierre e-CF o el número interno
             "cliente": "$cliente",
             "total_facturado": "$total",
             # Calculo inverso del ITBIS (Total = Base + 18% Base => Total = 1.18 Base => Base = Total / 1.18)
@@ -54,42 +180,55 @@ def get_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
         }},
         {"$sort": {"fecha": 1}}
     ]
-    return list(mongo.db.facturas.aggregate(pipeline))
 
-def get_ventas_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+def iter_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin, batch_size=EXPORT_BATCH_SIZE):
+    return mongo.db.facturas.aggregate(_pipeline_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin), batchSize=batch_size)
+
+@cached_report(fin='fecha_fin')
+def get_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin):
     """
-    Reporte simple de ventas por rango.
+    Genera reporte para impuestos (ITBIS).
+    Asume que el TOTAL guardado incluye ITBIS (18%).
     """
+    return list(mongo.db.facturas.aggregate(_pipeline_reporte_fiscal(organizacion_id, fecha_inicio, fecha_fin)))
+
+def iter_ventas_por_rango(organizacion_id, fecha_inicio, fecha_fin, batch_size=EXPORT_BATCH_SIZE):
+    """Ventas pagadas por día, leídas de los rollups diarios (uno por día con ventas)."""
     start = datetime.strptime(fecha_inicio, '%Y-%m-%d')
-    end = datetime.strptime(fecha_fin, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    end = datetime.strptime(fecha_fin, '%Y-%m-%d') + timedelta(days=1)
 
-    pipeline = [
-        {"$match": {
-            "organizacion_id": ObjectId(organizacion_id),
-            "estado": "Pagado",
-            "fecha_emision": {"$gte": start, "$lte": end}
-        }},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha_emision"}},
-            "total_ventas": {"$sum": "$total"},
-            "cantidad_facturas": {"$sum": 1}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    return list(mongo.db.facturas.aggregate(pipeline))
+    for r in iter_rollups(organizacion_id, desde=start, hasta=end, batch_size=batch_size):
+        cantidad = valor_rollup(r, 'facturas', ESTADO_PAGADO, 'cantidad')
+        if cantidad:
+            yield {
+                "_id": r['dia'],
+                "total_ventas": valor_rollup(r, 'facturas', ESTADO_PAGADO, 'total'),
+                "cantidad_facturas": cantidad
+            }
 
-def get_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+@cached_report(fin='fecha_fin')
+def get_ventas_por_rango(organizacion_id, fecha_inicio, fecha_fin):
     """
-    Reporte de gastos por rango de fechas (Cuentas por Pagar / Egresos).
+    Reporte simple de ventas por rango.
     """
-    start = datetime.strptime(fecha_inicio, '%Y-%m-%d')
-    end = datetime.strptime(fecha_fin, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    return list(iter_ventas_por_rango(organizacion_id, fecha_inicio, fecha_fin))
 
-    pipeline = [
+def _pipeline_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+    start, end = _rango(fecha_inicio, fecha_fin)
+    return [
         {"$match": {
             "organizacion_id": ObjectId(organizacion_id),
             "fecha": {"$gte": start, "$lte": end}
         }},
         {"$sort": {"fecha": 1}}
     ]
-    return list(mongo.db.gastos.aggregate(pipeline))
+
+def iter_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin, batch_size=EXPORT_BATCH_SIZE):
+    return mongo.db.gastos.aggregate(_pipeline_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin), batchSize=batch_size)
+
+@cached_report(fin='fecha_fin')
+def get_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin):
+    """
+    Reporte de gastos por rango de fechas (Cuentas por Pagar / Egresos).
+    """
+    return list(mongo.db.gastos.aggregate(_pipeline_gastos_por_rango(organizacion_id, fecha_inicio, fecha_fin)))
@@ -1,11 +1,16 @@
 from app import mongo
 from bson import ObjectId
 from datetime import datetime, timedelta
+from app.services.rollup_services import get_rollups, valor_rollup, ESTADO_PAGADO
+from app.utils.date_util import get_now
+from app.services.cache_services import cached_report
+from app.services.cliente_services import get_top_clientes_resumen
 
 # ==========================================
 # 1. KPIs PARA EL DASHBOARD PRINCIPAL
 # ==========================================
 
+@cached_report()
 def get_kpis_mes_actual(organizacion_id):
     """
     Calcula los indicadores clave (KPIs) del mes en curso:
@@ -13,32 +18,14 @@ def get_kpis_mes_actual(organizacion_id):
     - Total Gastos
     - Beneficio Neto
     - Cantidad de Facturas Pendientes
+    Ingresos y gastos salen de los rollups diarios (a lo sumo 31 documentos).
     """
     now = datetime.now()
     start_date = datetime(now.year, now.month, 1) # Primer día del mes actual
 
-    # PIPELINE 1: Total Ingresos del Mes
-    pipeline_ingresos = [
-        {"$match": {
-            "organizacion_id": ObjectId(organizacion_id),
-            "estado": "Pagado",
-            "fecha_emision": {"$gte": start_date}
-        }},
-        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-    ]
-    res_ingresos = list(mongo.db.facturas.aggregate(pipeline_ingresos))
-    total_ingresos = res_ingresos[0]['total'] if res_ingresos else 0.0
-
-    # PIPELINE 2: Total Gastos del Mes
-    pipeline_gastos = [
-        {"$match": {
-            "organizacion_id": ObjectId(organizacion_id),
-            "fecha": {"$gte": start_date}
-        }},
-        {"$group": {"_id": None, "total": {"$sum": "$monto"}}}
-    ]
-    res_gastos = list(mongo.db.gastos.aggregate(pipeline_gastos))
-    total_gastos = res_gastos[0]['total'] if res_gastos else 0.0
+    rollups = get_rollups(organizacion_id, desde=start_date)
+    total_ingresos = sum(valor_rollup(r, 'facturas', ESTADO_PAGADO, 'total') for r in rollups)
+    total_gastos = sum(valor_rollup(r, 'gastos', 'total') for r in rollups)
 
     # CONSULTA SIMPLE: Conteo de Facturas Pendientes
     # No requiere pipeline complejo, count_documents es más eficiente aquí
@@ -58,92 +45,84 @@ def get_kpis_mes_actual(organizacion_id):
 # 2. GRÁFICOS DEL DASHBOARD
 # ==========================================
 
-def get_comparativa_anual(organizacion_id, year=None):
+MESES = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
+
+def get_comparativa_anios(organizacion_id, years):
     """
-    Genera dos arrays (Ingresos y Gastos) mes a mes para el gráfico de barras.
-    Retorna datos listos para Chart.js.
+    Ingresos y gastos mes a mes de varios años en una sola pasada ($facet).
+    El $match inicial acota por [1 de enero del primer año, 1 de enero siguiente
+    al último) sobre el índice (organizacion_id, fecha) de los rollups, así que
+    solo se leen los días de esos años, sin importar cuánta historia exista.
+    Retorna {year: {"labels", "ingresos", "gastos"}}.
     """
-    if not year:
-        year = datetime.now().year
-
-    # Inicializamos arrays con 12 ceros (Enero a Diciembre)
-    ingresos = [0] * 12
-    gastos = [0] * 12
+    years = sorted({int(y) for y in years})
+    resultado = {y: {"labels": MESES, "ingresos": [0] * 12, "gastos": [0] * 12} for y in years}
+    if not years:
+        return resultado
 
-    # PIPELINE 1: Ingresos por Mes (Facturas)
-    pipeline_facturas = [
+    # La fecha de los rollups ya es el día local (ver rollup_services), por eso
+    # $month se aplica directo y no se le vuelve a pasar la zona horaria.
+    facetas = {
+        str(y): [
+            {"$match": {"fecha": {"$gte": datetime(y, 1, 1), "$lt": datetime(y + 1, 1, 1)}}},
+            {"$group": {
+                "_id": {"$month": "$fecha"}, # Agrupa por mes (retorna número 1-12)
+                "ingresos": {"$sum": f"$facturas.{ESTADO_PAGADO}.total"},
+                "gastos": {"$sum": "$gastos.total"}
+            }}
+        ]
+        for y in years
+    }
+    pipeline = [
         {"$match": {
             "organizacion_id": ObjectId(organizacion_id),
-            "estado": "Pagado"
-        }},
-        # Paso intermedio: Convertir string a fecha si es necesario
-        {"$addFields": {
-            "fecha_obj": {"$toDate": "$fecha_emision"}
-        }},
-        {"$match": {
-            "$expr": {"$eq": [{"$year": "$fecha_obj"}, int(year)]}
+            "fecha": {"$gte": datetime(years[0], 1, 1), "$lt": datetime(years[-1] + 1, 1, 1)}
         }},
-        {"$group": {
-            "_id": {"$month": "$fecha_obj"}, # Agrupa por mes (retorna número 1-12)
-            "total": {"$sum": "$total"}
-        }}
-    ]
-    
-    try:
-        for doc in mongo.db.facturas.aggregate(pipeline_facturas):
-            if doc["_id"] is not None:
-                mes_idx = doc["_id"] - 1 # Ajuste índice (0 para Enero)
-                if 0 <= mes_idx < 12:
-                    ingresos[mes_idx] = doc["total"]
-    except Exception as e:
-        print(f"Error en pipeline facturas: {e}")
-
-    # PIPELINE 2: Gastos por Mes
-    pipeline_gastos = [
-        {"$match": {
-            "organizacion_id": ObjectId(organizacion_id)
-        }},
-        # Paso intermedio: Convertir string a fecha si es necesario
-        {"$addFields": {
-            "fecha_obj": {"$toDate": "$fecha"}
-        }},
-        {"$match": {
-            "$expr": {"$eq": [{"$year": "$fecha_obj"}, int(year)]}
-        }},
-        {"$group": {
-            "_id": {"$month": "$fecha_obj"},
-            "total": {"$sum": "$monto"}
-        }}
+        {"$project": {"fecha": 1, f"facturas.{ESTADO_PAGADO}.total": 1, "gastos.total": 1}},
+        {"$facet": facetas}
     ]
 
     try:
-        for doc in mongo.db.gastos.aggregate(pipeline_gastos):
-            if doc["_id"] is not None:
-                mes_idx = doc["_id"] - 1
-                if 0 <= mes_idx < 12:
-                    gastos[mes_idx] = doc["total"]
+        for faceta in mongo.db.rollups.aggregate(pipeline):
+            for y in years:
+                for doc in faceta.get(str(y), []):
+                    mes_idx = doc["_id"] - 1 # Ajuste índice (0 para Enero)
+                    resultado[y]["ingresos"][mes_idx] = doc["ingresos"]
+                    resultado[y]["gastos"][mes_idx] = doc["gastos"]
     except Exception as e:
-        print(f"Error en pipeline gastos: {e}")
+        print(f"Error en pipeline comparativa: {e}")
 
-    return {
-        "labels": ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"],
-        "ingresos": ingresos,
-        "gastos": gastos
-    }
+    return resultado
+
+@cached_report(fin='year')
+def get_comparativa_anual(organizacion_id, year=None):
+    """
+    Genera dos arrays (Ingresos y Gastos) mes a mes para el gráfico de barras.
+    Retorna datos listos para Chart.js.
+    """
+    if not year:
+        # Año en la zona horaria configurada (TIMEZONE), no la del servidor
+        year = get_now().year
+    return get_comparativa_anios(organizacion_id, [year])[int(year)]
 
+@cached_report()
 def get_gastos_por_categoria(organizacion_id):
     """
     Agrupa gastos por categoría para el gráfico de dona.
+    Suma los totales por categoría de los rollups diarios.
     """
     pipeline = [
-        {"$match": {"organizacion_id": ObjectId(organizacion_id)}},
+        {"$match": {"organizacion_id": ObjectId(organizacion_id), "gastos.categorias": {"$exists": True}}},
+        {"$project": {"categorias": {"$objectToArray": "$gastos.categorias"}}},
+        {"$unwind": "$categorias"},
         {"$group": {
-            "_id": "$categoria", # Agrupa por campo categoría
-            "total": {"$sum": "$monto"} # Suma los montos
+            "_id": "$categorias.k", # Agrupa por categoría
+            "total": {"$sum": "$categorias.v"} # Suma los montos
         }},
+        {"$match": {"total": {"$ne": 0}}},
         {"$sort": {"total": -1}} # Ordena de mayor gasto a menor
     ]
-    data = list(mongo.db.gastos.aggregate(pipeline))
+    data = list(mongo.db.rollups.aggregate(pipeline))
     
     # Aseguramos que retornamos listas serializables
     return {
@@ -151,136 +130,242 @@ def get_gastos_por_categoria(organizacion_id):
         "data": [float(d["total"]) for d in data]
     }
 
+@cached_report()
 def get_top_clientes(organizacion_id, limit=5):
     """
     Obtiene los clientes que más dinero han generado (Facturas Pagadas).
+    Lee el resumen de cada cliente (cliente_services) en lugar de agrupar las facturas.
     """
-    pipeline = [
-        {"$match": {
-            "organizacion_id": ObjectId(organizacion_id), 
-            "estado": "Pagado"
-        }},
-        # Paso intermedio: Normalizar nombre del cliente
-        {"$addFields": {
-            "nombre_completo": {
-                "$cond": {
-                    "if": {"$eq": [{"$type": "$cliente"}, "string"]},
-                    "then": "$cliente",
-                    "else": {"$concat": [
-                        {"$ifNull": ["$cliente.nombre", ""]}, 
-                        " ", 
-                        {"$cond": {
-                            "if": {"$eq": ["$cliente.apellido", "(Dato antiguo)"]},
-                            "then": "",
-                            "else": {"$ifNull": ["$cliente.apellido", ""]}
-                        }}
-                    ]}
-                }
-            },
-            "group_id": {"$ifNull": ["$cliente_id", "$cliente"]}
-        }},
-        {"$group": {
-            "_id": "$group_id", 
-            "nombre_cliente": {"$first": "$nombre_completo"}, 
-            "apellido_cliente": {"$first": ""}, # Ya concatenamos todo en nombre_cliente
-            "total_gastado": {"$sum": "$total"},
-            "count": {"$sum": 1} # Cuenta cuántas facturas ha pagado
-        }},
-        {"$sort": {"total_gastado": -1}}, # Orden Descendente
-        {"$limit": limit}
+    return [
+        {
+            "_id": c["_id"],
+            "nombre_cliente": f"{c.get('nombre') or ''} {c.get('apellido') or ''}".strip(),
+            "apellido_cliente": "",
+            "total_gastado": c["resumen"].get("pagado", 0),
+            "count": c["resumen"].get("pagadas", 0),
+        } for c in get_top_clientes_resumen(organizacion_id, limit)
     ]
-    return list(mongo.db.facturas.aggregate(pipeline))
 
 # ==========================================
-# 3. REPORTE DE CUADRE DIARIO
+# 3. REPORTE DE CUADRE DE CAJA
 # ==========================================
+# El cuadre acepta cualquier rango (un día, la semana, el mes) y, opcionalmente,
+# un cajero (el `vendedor` de las facturas y el `registrado_por` de los gastos).
+# - Los totales salen de UNA agregación: las facturas pagadas del rango se unen
+#   con los gastos ($unionWith, MongoDB 4.4+) y un $facet calcula en la misma
+#   pasada los totales por forma de pago, por cajero y por categoría de gasto.
+#   No hay una consulta por día.
+# - El detalle fila por fila no se trae con los totales: iter_cuadre_ingresos e
+#   iter_cuadre_gastos lo leen con cursores (la vista muestra las primeras
+#   CUADRE_DETALLE_LIMITE filas y la exportación recorre todo).
 
-def get_cuadre_diario(organizacion_id, fecha=None):
-    """
-    Obtiene el detalle transaccional de un día específico.
-    No usa aggregate complejo, sino consultas find() directas para obtener el detalle fila por fila.
-    """
-    if not fecha:
-        fecha = datetime.now()
-    elif isinstance(fecha, str):
+CUADRE_DETALLE_LIMITE = 200
+CUADRE_BATCH_SIZE = 500
+FORMA_PAGO_DEFECTO = 'efectivo'
+
+
+def _fecha_cuadre(valor):
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, str):
         try:
-            fecha = datetime.strptime(fecha, "%Y-%m-%d")
+            return datetime.strptime(valor, "%Y-%m-%d")
         except ValueError:
-            fecha = datetime.now()
+            pass
+    return datetime.now()
+
+
+def _rango_cuadre(desde, hasta):
+    """Del inicio de `desde` (00:00:00) al final de `hasta` (23:59:59.999999)."""
+    inicio = _fecha_cuadre(desde).replace(hour=0, minute=0, second=0, microsecond=0)
+    fin = _fecha_cuadre(hasta if hasta else desde).replace(hour=23, minute=59, second=59, microsecond=999999)
+    if fin < inicio:
+        inicio, fin = fin.replace(hour=0, minute=0, second=0, microsecond=0), inicio.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return inicio, fin
 
-    # Definir rango exacto del día (00:00:00 a 23:59:59)
-    start_date = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_date = fecha.replace(hour=23, minute=59, second=59, microsecond=999999)
 
-    # 1. Obtener Facturas Pagadas (Ingresos)
-    cursor_ingresos = mongo.db.facturas.find({
+def _filtro_ingresos_cuadre(organizacion_id, inicio, fin, vendedor=None):
+    filtro = {
         "organizacion_id": ObjectId(organizacion_id),
-        "estado": "Pagado",
-        "fecha_emision": {"$gte": start_date, "$lte": end_date}
-    }).sort("fecha_emision", 1)
-
-    ingresos_detalles = []
-    total_ingresos = 0.0
-    total_efectivo = 0.0
-    total_bancos = 0.0
-
-    for f in cursor_ingresos:
-        # Manejo defensivo por si el cliente es un string antiguo o dict
-        nombre_cliente = "Cliente General"
-        if isinstance(f.get("cliente"), dict):
-            nombre_cliente = f"{f['cliente'].get('nombre', '')} {f['cliente'].get('apellido', '')}"
-        elif isinstance(f.get("cliente"), str):
-            nombre_cliente = f.get("cliente")
-
-        forma_pago = f.get('forma_pago', 'efectivo') or 'efectivo' # Default a efectivo para seguridad
-        
-        ingresos_detalles.append({
+        "estado": ESTADO_PAGADO,
+        "fecha_emision": {"$gte": inicio, "$lte": fin}
+    }
+    if vendedor:
+        filtro["vendedor"] = vendedor
+    return filtro
+
+
+def _filtro_gastos_cuadre(organizacion_id, inicio, fin, vendedor=None):
+    filtro = {
+        "organizacion_id": ObjectId(organizacion_id),
+        "fecha": {"$gte": inicio, "$lte": fin}
+    }
+    if vendedor:
+        filtro["registrado_por"] = vendedor
+    return filtro
+
+
+def _pipeline_cuadre(organizacion_id, inicio, fin, vendedor=None):
+    es_ingreso = {"$eq": ["$tipo", "ingreso"]}
+    return [
+        {"$match": _filtro_ingresos_cuadre(organizacion_id, inicio, fin, vendedor)},
+        {"$project": {
+            "_id": 0,
+            "tipo": {"$literal": "ingreso"},
+            "monto": {"$ifNull": ["$total", 0]},
+            "forma_pago": {"$ifNull": ["$forma_pago", FORMA_PAGO_DEFECTO]},
+            "cajero": {"$ifNull": ["$vendedor", "-"]}
+        }},
+        {"$unionWith": {
+            "coll": "gastos",
+            "pipeline": [
+                {"$match": _filtro_gastos_cuadre(organizacion_id, inicio, fin, vendedor)},
+                {"$project": {
+                    "_id": 0,
+                    "tipo": {"$literal": "gasto"},
+                    "monto": {"$ifNull": ["$monto", 0]},
+                    "categoria": {"$ifNull": ["$categoria", "-"]},
+                    "cajero": {"$ifNull": ["$registrado_por", "-"]}
+                }}
+            ]
+        }},
+        {"$facet": {
+            "por_forma_pago": [
+                {"$match": {"tipo": "ingreso"}},
+                {"$group": {"_id": "$forma_pago", "total": {"$sum": "$monto"}, "cantidad": {"$sum": 1}}},
+                {"$sort": {"total": -1}}
+            ],
+            "por_cajero": [
+                {"$group": {
+                    "_id": "$cajero",
+                    "ingresos": {"$sum": {"$cond": [es_ingreso, "$monto", 0]}},
+                    "efectivo": {"$sum": {"$cond": [
+                        {"$and": [es_ingreso, {"$eq": ["$forma_pago", FORMA_PAGO_DEFECTO]}]}, "$monto", 0
+                    ]}},
+                    "gastos": {"$sum": {"$cond": [es_ingreso, 0, "$monto"]}},
+                    "cant_ventas": {"$sum": {"$cond": [es_ingreso, 1, 0]}},
+                    "cant_gastos": {"$sum": {"$cond": [es_ingreso, 0, 1]}}
+                }},
+                {"$sort": {"ingresos": -1}}
+            ],
+            "por_categoria": [
+                {"$match": {"tipo": "gasto"}},
+                {"$group": {"_id": "$categoria", "total": {"$sum": "$monto"}, "cantidad": {"$sum": 1}}},
+                {"$sort": {"total": -1}}
+            ]
+        }}
+    ]
+
+
+@cached_report(fin='hasta')
+def get_cuadre(organizacion_id, desde=None, hasta=None, vendedor=None):
+    """
+    Totales del cuadre de caja entre `desde` y `hasta` ('YYYY-MM-DD' o datetime,
+    por defecto hoy), opcionalmente de un solo cajero. Una sola agregación.
+    """
+    inicio, fin = _rango_cuadre(desde, hasta)
+    resultado = next(mongo.db.facturas.aggregate(
+        _pipeline_cuadre(organizacion_id, inicio, fin, vendedor), allowDiskUse=True
+    ), {})
+
+    por_forma_pago = [
+        {"forma_pago": r["_id"] or FORMA_PAGO_DEFECTO, "total": r["total"], "cantidad": r["cantidad"]}
+        for r in resultado.get("por_forma_pago", [])
+    ]
+    por_cajero = [
+        {
+            "cajero": r["_id"],
+            "ingresos": r["ingresos"],
+            "efectivo": r["efectivo"],
+            "bancos": r["ingresos"] - r["efectivo"],
+            "gastos": r["gastos"],
+            "balance": r["ingresos"] - r["gastos"],
+            "cant_ventas": r["cant_ventas"],
+            "cant_gastos": r["cant_gastos"]
+        }
+        for r in resultado.get("por_cajero", [])
+    ]
+    por_categoria = [
+        {"categoria": r["_id"], "total": r["total"], "cantidad": r["cantidad"]}
+        for r in resultado.get("por_categoria", [])
+    ]
+
+    total_ingresos = sum(f["total"] for f in por_forma_pago)
+    total_efectivo = sum(f["total"] for f in por_forma_pago if f["forma_pago"] == FORMA_PAGO_DEFECTO)
+    total_gastos = sum(c["total"] for c in por_categoria)
+
+    return {
+        "desde": inicio,
+        "hasta": fin,
+        "vendedor": vendedor,
+        "varios_dias": inicio.date() != fin.date(),
+        "resumen": {
+            "total_ingresos": total_ingresos,
+            "total_efectivo": total_efectivo,
+            "total_bancos": total_ingresos - total_efectivo,
+            "total_gastos": total_gastos,
+            "balance_neto": total_ingresos - total_gastos,
+            "cant_ventas": sum(f["cantidad"] for f in por_forma_pago),
+            "cant_gastos": sum(c["cantidad"] for c in por_categoria)
+        },
+        "por_forma_pago": por_forma_pago,
+        "por_cajero": por_cajero,
+        "por_categoria": por_categoria
+    }
+
+
+def _nombre_cliente_cuadre(cliente):
+    # Manejo defensivo por si el cliente es un string antiguo o dict
+    if isinstance(cliente, dict):
+        return f"{cliente.get('nombre', '')} {cliente.get('apellido', '')}".strip()
+    if isinstance(cliente, str):
+        return cliente
+    return "Cliente General"
+
+
+def iter_cuadre_ingresos(organizacion_id, desde=None, hasta=None, vendedor=None, limite=None, batch_size=CUADRE_BATCH_SIZE):
+    """Facturas pagadas del cuadre, fila por fila y en orden cronológico."""
+    inicio, fin = _rango_cuadre(desde, hasta)
+    cursor = mongo.db.facturas.find(
+        _filtro_ingresos_cuadre(organizacion_id, inicio, fin, vendedor),
+        {"fecha_emision": 1, "invoice_num": 1, "cliente": 1, "vendedor": 1, "forma_pago": 1, "total": 1},
+        batch_size=batch_size
+    ).sort("fecha_emision", 1)
+    if limite:
+        cursor = cursor.limit(limite)
+    for f in cursor:
+        yield {
+            "fecha": f["fecha_emision"],
             "hora": f["fecha_emision"].strftime("%H:%M"),
             "numero": f.get("invoice_num", "-"),
-            "cliente": nombre_cliente,
+            "cliente": _nombre_cliente_cuadre(f.get("cliente")),
             "vendedor": f.get("vendedor", "-"),
-            "forma_pago": forma_pago,
+            "forma_pago": f.get("forma_pago") or FORMA_PAGO_DEFECTO,
             "total": f.get("total", 0.0)
-        })
-        
-        # Segregación para el cuadre
-        if forma_pago == 'efectivo':
-            total_efectivo += f.get("total", 0.0)
-        else:
-            total_bancos += f.get("total", 0.0)
-            
-        total_ingresos += f.get("total", 0.0)
-
-    # 2. Obtener Gastos (Egresos)
-    cursor_gastos = mongo.db.gastos.find({
-        "organizacion_id": ObjectId(organizacion_id),
-        "fecha": {"$gte": start_date, "$lte": end_date}
-    }).sort("fecha", 1)
+        }
 
-    gastos_detalles = []
-    total_gastos = 0.0
 
-    for g in cursor_gastos:
-        gastos_detalles.append({
+def iter_cuadre_gastos(organizacion_id, desde=None, hasta=None, vendedor=None, limite=None, batch_size=CUADRE_BATCH_SIZE):
+    """Gastos del cuadre, fila por fila y en orden cronológico."""
+    inicio, fin = _rango_cuadre(desde, hasta)
+    cursor = mongo.db.gastos.find(
+        _filtro_gastos_cuadre(organizacion_id, inicio, fin, vendedor),
+        {"fecha": 1, "descripcion": 1, "categoria": 1, "registrado_por": 1, "monto": 1},
+        batch_size=batch_size
+    ).sort("fecha", 1)
+    if limite:
+        cursor = cursor.limit(limite)
+    for g in cursor:
+        yield {
+            "fecha": g["fecha"],
             "hora": g["fecha"].strftime("%H:%M"),
             "descripcion": g.get("descripcion", "-"),
             "categoria": g.get("categoria", "-"),
             "registrado_por": g.get("registrado_por", "-"),
             "monto": g.get("monto", 0.0)
-        })
-        total_gastos += g.get("monto", 0.0)
+        }
 
-    return {
-        "fecha": fecha,
-        "resumen": {
-            "total_ingresos": total_ingresos,
-            "total_efectivo": total_efectivo,
-            "total_bancos": total_bancos,
-            "total_gastos": total_gastos,
-            "balance_neto": total_ingresos - total_gastos,
-            "cant_ventas": len(ingresos_detalles),
-            "cant_gastos": len(gastos_detalles)
-        },
-        "detalles_ingresos": ingresos_detalles,
-        "detalles_gastos": gastos_detalles
-    }
\ No newline at end of file
+
+def get_cajeros(organizacion_id):
+    """Nombres de los usuarios de la organización (filtro de cajero del cuadre)."""
+    return sorted(n for n in mongo.db.usuarios.distinct('nombre', {'organizacion_id': ObjectId(organizacion_id)}) if n)
@@ -0,0 +1,286 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import UpdateOne, ReplaceOne
+from app.database import mongo
+from app.services.cache_services import bump_data_version
+
+# ==========================================
+# ROLLUPS DIARIOS (organización, día)
+# ==========================================
+# Un documento pequeño por organización y día con los totales ya sumados:
+#
+#   {
+#     '_id': '<org>:2025-03-14', 'organizacion_id': ObjectId, 'dia': '2025-03-14',
+#     'fecha': datetime(2025, 3, 14),
+#     'facturas': {'Pagado': {'total': 1500.0, 'cantidad': 3}, 'Pendiente': {...}},
+#     'cobros': {'efectivo': {'total': 900.0, 'cantidad': 2}, ...},   # solo facturas pagadas
+#     'gastos': {'total': 400.0, 'cantidad': 2, 'categorias': {'Alquiler': 400.0}}
+#   }
+#
+# Los servicios de factura y gasto aplican aquí, con $inc, la diferencia entre
+# el documento anterior y el nuevo. El dashboard y los reportes por rango leen
+# a lo sumo un documento por día en lugar de agregar toda la historia.
+# `flask veloce rebuild-rollups` los recalcula desde cero.
+
+ESTADO_PAGADO = 'Pagado'
+SIN_CATEGORIA = 'Sin Categoría'
+
+# Campos de la factura / gasto que afectan los rollups
+FACTURA_ROLLUP_PROJECTION = {'organizacion_id': 1, 'fecha_emision': 1, 'total': 1, 'estado': 1, 'forma_pago': 1}
+GASTO_ROLLUP_PROJECTION = {'organizacion_id': 1, 'fecha': 1, 'monto': 1, 'categoria': 1}
+
+
+def _clave(valor, defecto):
+    """Nombre de campo válido para MongoDB (sin '.' ni '$' inicial)."""
+    texto = str(valor).strip() if valor not in (None, '') else defecto
+    return texto.replace('.', '_').lstrip('$') or defecto
+
+
+def _como_fecha(valor):
+    """Acepta datetime o el string ISO de datos antiguos; None si no se puede."""
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, str):
+        try:
+            return datetime.fromisoformat(valor)
+        except ValueError:
+            return None
+    return None
+
+
+def _inicio_dia(fecha):
+    return datetime(fecha.year, fecha.month, fecha.day)
+
+
+def _rollup_id(organizacion_id, dia):
+    return f"{organizacion_id}:{dia.strftime('%Y-%m-%d')}"
+
+
+def _aporte_factura(doc, signo):
+    """(organizacion_id, día, incrementos) que la factura suma (signo=1) o resta (signo=-1)."""
+    fecha = _como_fecha(doc.get('fecha_emision')) if doc else None
+    if fecha is None or not doc.get('organizacion_id'):
+        return None
+    total = float(doc.get('total') or 0) * signo
+    estado = _clave(doc.get('estado'), 'pendiente')
+    incrementos = {
+        f'facturas.{estado}.total': total,
+        f'facturas.{estado}.cantidad': signo,
+    }
+    if doc.get('estado') == ESTADO_PAGADO:
+        forma_pago = _clave(doc.get('forma_pago'), 'efectivo')
+        incrementos[f'cobros.{forma_pago}.total'] = total
+        incrementos[f'cobros.{forma_pago}.cantidad'] = signo
+    return ObjectId(str(doc['organizacion_id'])), _inicio_dia(fecha), incrementos
+
+
+def _aporte_gasto(doc, signo):
+    fecha = _como_fecha(doc.get('fecha')) if doc else None
+    if fecha is None or not doc.get('organizacion_id'):
+        return None
+    monto = float(doc.get('monto') or 0) * signo
+    categoria = _clave(doc.get('categoria'), SIN_CATEGORIA)
+    return ObjectId(str(doc['organizacion_id'])), _inicio_dia(fecha), {
+        'gastos.total': monto,
+        'gastos.cantidad': signo,
+        f'gastos.categorias.{categoria}': monto,
+    }
+
+
+def _aplicar(aportes):
+    """Combina los aportes por (organización, día) y los escribe en un solo bulk_write."""
+    # Se suma partiendo del entero 0 para conservar el tipo de cada aporte: los
+    # `cantidad` (int) siguen siendo enteros en MongoDB y los montos, float
+    por_dia = defaultdict(dict)
+    for aporte in aportes:
+        if aporte is None:
+            continue
+        organizacion_id, dia, incrementos = aporte
+        sumas = por_dia[(organizacion_id, dia)]
+        for campo, valor in incrementos.items():
+            sumas[campo] = sumas.get(campo, 0) + valor
+
+    operaciones = []
+    for (organizacion_id, dia), incrementos in por_dia.items():
+        # Una modificación que no cambia nada (ej. mismo total y estado) se anula
+        incrementos = {campo: valor for campo, valor in incrementos.items() if valor != 0}
+        if not incrementos:
+            continue
+        operaciones.append(UpdateOne(
+            {'_id': _rollup_id(organizacion_id, dia)},
+            {
+                '$inc': incrementos,
+                '$setOnInsert': {'organizacion_id': organizacion_id, 'dia': dia.strftime('%Y-%m-%d'), 'fecha': dia}
+            },
+            upsert=True
+        ))
+    if not operaciones:
+        return
+    try:
+        mongo.db.rollups.bulk_write(operaciones, ordered=False)
+    except Exception as e:
+        # El dato principal ya se guardó; rebuild-rollups corrige cualquier desfase
+        print(f"Error al actualizar los rollups: {e}")
+
+
+def aplicar_factura(anterior=None, nuevo=None):
+    """Refleja en los rollups la creación (solo nuevo), modificación o eliminación (solo anterior) de una factura."""
+    _aplicar([
+        _aporte_factura(anterior, -1) if anterior else None,
+        _aporte_factura(nuevo, 1) if nuevo else None,
+    ])
+
+
+def aplicar_gasto(anterior=None, nuevo=None):
+    """Igual que aplicar_factura, para gastos."""
+    _aplicar([
+        _aporte_gasto(anterior, -1) if anterior else None,
+        _aporte_gasto(nuevo, 1) if nuevo else None,
+    ])
+
+
+# ==========================================
+# LECTURA
+# ==========================================
+
+def iter_rollups(organizacion_id, desde=None, hasta=None, batch_size=None):
+    """Cursor de rollups de la organización con fecha en [desde, hasta), ordenados por día."""
+    query = {'organizacion_id': ObjectId(organizacion_id)}
+    rango = {}
+    if desde:
+        rango['$gte'] = _inicio_dia(desde)
+    if hasta:
+        rango['$lt'] = hasta
+    if rango:
+        query['fecha'] = rango
+    cursor = mongo.db.rollups.find(query).sort('fecha', 1)
+    return cursor.batch_size(batch_size) if batch_size else cursor
+
+
+def get_rollups(organizacion_id, desde=None, hasta=None):
+    """Igual que iter_rollups, como lista."""
+    return list(iter_rollups(organizacion_id, desde, hasta))
+
+
+def valor_rollup(rollup, *ruta):
+    """Lee un valor anidado del rollup ('facturas', 'Pagado', 'total'); 0 si no existe."""
+    valor = rollup
+    for parte in ruta:
+        if not isinstance(valor, dict):
+            return 0
+        valor = valor.get(parte)
+    return valor or 0
+
+
+# ==========================================
+# RECONSTRUCCIÓN (backfill)
+# ==========================================
+
+def _fecha_convertida(campo):
+    # Datos antiguos guardaron la fecha como string
+    return {'$convert': {'input': f'${campo}', 'to': 'date', 'onError': None, 'onNull': None}}
+
+
+def _calcular_rollups_organizacion(organizacion_id):
+    org = ObjectId(organizacion_id)
+    rollups = {}
+
+    def rollup(dia_str):
+        if dia_str not in rollups:
+            dia = datetime.strptime(dia_str, '%Y-%m-%d')
+            rollups[dia_str] = {
+                '_id': _rollup_id(org, dia), 'organizacion_id': org, 'dia': dia_str, 'fecha': dia,
+                'facturas': {}, 'cobros': {}, 'gastos': {'total': 0.0, 'cantidad': 0, 'categorias': {}}
+            }
+        return rollups[dia_str]
+
+    pipeline_facturas = [
+        {'$match': {'organizacion_id': org}},
+        {'$addFields': {'fecha_obj': _fecha_convertida('fecha_emision')}},
+        {'$match': {'fecha_obj': {'$ne': None}}},
+        {'$group': {
+            '_id': {
+                'dia': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$fecha_obj'}},
+                'estado': '$estado',
+                'forma_pago': '$forma_pago'
+            },
+            'total': {'$sum': '$total'},
+            'cantidad': {'$sum': 1}
+        }}
+    ]
+    for fila in mongo.db.facturas.aggregate(pipeline_facturas, allowDiskUse=True):
+        doc = rollup(fila['_id']['dia'])
+        estado = _clave(fila['_id'].get('estado'), 'pendiente')
+        acumulado = doc['facturas'].setdefault(estado, {'total': 0.0, 'cantidad': 0})
+        acumulado['total'] += fila['total']
+        acumulado['cantidad'] += fila['cantidad']
+        if fila['_id'].get('estado') == ESTADO_PAGADO:
+            forma_pago = _clave(fila['_id'].get('forma_pago'), 'efectivo')
+            cobro = doc['cobros'].setdefault(forma_pago, {'total': 0.0, 'cantidad': 0})
+            cobro['total'] += fila['total']
+            cobro['cantidad'] += fila['cantidad']
+
+    pipeline_gastos = [
+        {'$match': {'organizacion_id': org}},
+        {'$addFields': {'fecha_obj': _fecha_convertida('fecha')}},
+        {'$match': {'fecha_obj': {'$ne': None}}},
+        {'$group': {
+            '_id': {
+                'dia': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$fecha_obj'}},
+                'categoria': '$categoria'
+            },
+            'total': {'$sum': '$monto'},
+            'cantidad': {'$sum': 1}
+        }}
+    ]
+    for fila in mongo.db.gastos.aggregate(pipeline_gastos, allowDiskUse=True):
+        gastos = rollup(fila['_id']['dia'])['gastos']
+        categoria = _clave(fila['_id'].get('categoria'), SIN_CATEGORIA)
+        gastos['total'] += fila['total']
+        gastos['cantidad'] += fila['cantidad']
+        gastos['categorias'][categoria] = gastos['categorias'].get(categoria, 0) + fila['total']
+
+    return org, list(rollups.values())
+
+
+def reconstruir_rollups_organizacion(organizacion_id):
+    """
+    Recalcula todos los rollups de una organización desde facturas y gastos.
+    Las escrituras que ocurran mientras corre pueden quedar fuera: conviene
+    ejecutarlo con poca actividad. Retorna la cantidad de días generados.
+    """
+    org, documentos = _calcular_rollups_organizacion(organizacion_id)
+    if documentos:
+        mongo.db.rollups.bulk_write(
+            [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in documentos],
+            ordered=False
+        )
+    # Días que ya no tienen movimientos
+    mongo.db.rollups.delete_many({
+        'organizacion_id': org,
+        '_id': {'$nin': [doc['_id'] for doc in documentos]}
+    })
+    bump_data_version(org)
+    return len(documentos)
+
+
+def reconstruir_rollups(organizacion_ids=None, workers=4):
+    """
+    Reconstruye los rollups de varias organizaciones en paralelo (todas si no se
+    indican). Retorna {organizacion_id: días generados}.
+    """
+    if not organizacion_ids:
+        organizacion_ids = set(mongo.db.facturas.distinct('organizacion_id'))
+        organizacion_ids.update(mongo.db.gastos.distinct('organizacion_id'))
+    organizacion_ids = [str(org) for org in organizacion_ids if org]
+    app = current_app._get_current_object()
+
+    def trabajador(organizacion_id):
+        with app.app_context():
+            return reconstruir_rollups_organizacion(organizacion_id)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(zip(organizacion_ids, executor.map(trabajador, organizacion_ids)))
@@ -0,0 +1,338 @@
+import math
+import re
+import time
+from collections import defaultdict
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import ReplaceOne, UpdateOne
+from app.database import mongo
+from app.utils.search_util import generar_search_keys, generar_trigramas, tokenizar, trigramas_consulta
+
+# ==========================================
+# BÚSQUEDA POR CLAVES NORMALIZADAS
+# ==========================================
+# Cada documento buscable guarda en 'search_keys' sus palabras en minúsculas y
+# sin acentos. Las búsquedas usan prefijos anclados ('^jos') sobre ese arreglo,
+# que MongoDB resuelve con el índice (organizacion_id, search_keys) en lugar de
+# recorrer la colección con $regex sin anclar y con 'i'.
+
+SEARCH_FIELDS = {
+    'clientes': ['nombre', 'apellido', 'correo', 'identificacion'],
+    'productos': ['nombre', 'codigo'],
+    'facturas': ['invoice_num', 'cliente.nombre', 'cliente.apellido', 'vendedor', 'estado'],
+    'gastos': ['descripcion', 'proveedor'],
+}
+
+
+def _valor(doc, ruta):
+    valor = doc
+    for parte in ruta.split('.'):
+        if isinstance(valor, dict):
+            valor = valor.get(parte)
+        elif isinstance(valor, str) and parte == 'nombre':
+            # Datos antiguos: cliente/vendedor guardado como string
+            return valor
+        else:
+            return None
+    if isinstance(valor, dict):
+        # vendedor puede venir como dict {'nombre': ...}
+        return valor.get('nombre')
+    return valor
+
+
+def build_search_keys(coleccion, doc):
+    """Claves de búsqueda del documento según SEARCH_FIELDS."""
+    return generar_search_keys(*[_valor(doc, campo) for campo in SEARCH_FIELDS[coleccion]])
+
+
+def search_filter(termino):
+    """
+    Fragmento de query para buscar `termino`: cada palabra debe ser prefijo de
+    alguna clave. Retorna None si el término no tiene palabras buscables.
+    """
+    tokens = tokenizar(termino)
+    if not tokens:
+        return None
+    condiciones = [{'search_keys': {'$regex': f'^{re.escape(token)}'}} for token in tokens]
+    return condiciones[0] if len(condiciones) == 1 else {'$and': condiciones}
+
+
+def apply_search(query, termino):
+    """Agrega el filtro de búsqueda a `query` (sin pisar un '$and' existente)."""
+    filtro = search_filter(termino)
+    if filtro:
+        query.setdefault('$and', []).append(filtro)
+    return query
+
+
+def refresh_search_keys(coleccion, doc_id):
+    """Recalcula 'search_keys' de un documento después de una actualización parcial."""
+    campos = {campo.split('.')[0]: 1 for campo in SEARCH_FIELDS[coleccion]}
+    doc = mongo.db[coleccion].find_one({'_id': ObjectId(doc_id)}, campos)
+    if doc:
+        mongo.db[coleccion].update_one(
+            {'_id': doc['_id']},
+            {'$set': {'search_keys': build_search_keys(coleccion, doc)}}
+        )
+
+
+def backfill_search_keys(coleccion, batch_size=1000, solo_faltantes=True):
+    """
+    Calcula 'search_keys' para los documentos existentes en lotes de bulk_write.
+    Retorna la cantidad de documentos actualizados.
+    """
+    campos = {campo.split('.')[0]: 1 for campo in SEARCH_FIELDS[coleccion]}
+    query = {'search_keys': {'$exists': False}} if solo_faltantes else {}
+    cursor = mongo.db[coleccion].find(query, campos, batch_size=batch_size)
+
+    actualizados = 0
+    operaciones = []
+    for doc in cursor:
+        operaciones.append(UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'search_keys': build_search_keys(coleccion, doc)}}
+        ))
+        if len(operaciones) >= batch_size:
+            actualizados += mongo.db[coleccion].bulk_write(operaciones, ordered=False).modified_count
+            operaciones = []
+    if operaciones:
+        actualizados += mongo.db[coleccion].bulk_write(operaciones, ordered=False).modified_count
+    return actualizados
+
+
+def benchmark_busqueda(coleccion, organizacion_id, termino, repeticiones=20, limit=10):
+    """
+    Compara la latencia (ms) de la búsqueda indexada contra el $regex sin anclar
+    anterior sobre los mismos campos. Retorna un dict con promedios y resultados.
+    """
+    base = {'organizacion_id': ObjectId(organizacion_id)}
+    regex = {'$or': [{campo: {'$regex': re.escape(termino), '$options': 'i'}} for campo in SEARCH_FIELDS[coleccion]]}
+    consultas = {
+        'regex': {**base, **regex},
+        'search_keys': apply_search(dict(base), termino),
+    }
+
+    resultado = {}
+    for nombre, query in consultas.items():
+        tiempos = []
+        encontrados = 0
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            encontrados = len(list(mongo.db[coleccion].find(query, {'_id': 1}).limit(limit)))
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        resultado[nombre] = {
+            'promedio_ms': sum(tiempos) / len(tiempos),
+            'max_ms': max(tiempos),
+            'resultados': encontrados,
+        }
+    return resultado
+
+
+# ==========================================
+# BÚSQUEDA DIFUSA POR TRIGRAMAS
+# ==========================================
+# Para tolerar errores de tipeo ('Rodrigez' -> 'Rodríguez') cada documento
+# buscable tiene una entrada en '<coleccion>_ngrams' con el mismo _id:
+#   {_id, organizacion_id, ngrams: [' ro', 'rod', ...]}
+# La búsqueda toma los trigramas del término, trae con $in (índice multikey
+# organizacion_id + ngrams) las entradas que comparten alguno de los más raros
+# y las puntúa por la cantidad de trigramas en común. Las entradas se mantienen en cada alta,
+# edición, baja e importación; `flask veloce rebuild-ngrams` las regenera.
+#
+# Para elegir los trigramas raros sin contar en cada tecla, '<coleccion>_ngrams_frecuencias'
+# guarda cuántas entradas de la organización tienen cada trigrama:
+#   {_id: '<org>:<trigrama>', organizacion_id, cantidad}
+# guardar_ngrams / eliminar_ngrams la ajustan con $inc y rebuild-ngrams la
+# recalcula. Solo orienta la selección: si se desfasa, la búsqueda trae más
+# candidatos pero no pierde resultados.
+
+# Campo -> cómo se convierte en palabras:
+#   'palabras': cada palabra por separado
+#   'compacto': todo el valor sin separadores (teléfonos, cédulas, RNC)
+#   'correo':   solo la parte antes de '@' (el dominio lo comparten todos)
+NGRAM_FIELDS = {
+    'clientes': {
+        'nombre': 'palabras',
+        'apellido': 'palabras',
+        'correo': 'correo',
+        'telefono': 'compacto',
+        'identificacion': 'compacto',
+    },
+}
+
+
+def build_ngrams(coleccion, doc):
+    """Trigramas del documento según NGRAM_FIELDS."""
+    palabras = []
+    for campo, modo in NGRAM_FIELDS[coleccion].items():
+        valor = doc.get(campo)
+        if not valor:
+            continue
+        if modo == 'correo':
+            valor = str(valor).split('@')[0]
+        tokens = tokenizar(valor)
+        if modo == 'compacto' and tokens:
+            tokens = [''.join(tokens)]
+        palabras.extend(tokens)
+    return generar_trigramas(palabras)
+
+
+def _frecuencias(coleccion):
+    return mongo.db[f'{coleccion}_ngrams_frecuencias']
+
+
+def _ajustar_frecuencias(coleccion, deltas):
+    """Aplica {(organizacion_id, trigrama): diferencia} con un solo bulk_write."""
+    operaciones = [
+        UpdateOne(
+            {'_id': f'{organizacion_id}:{trigrama}'},
+            {'$inc': {'cantidad': diferencia}, '$setOnInsert': {'organizacion_id': organizacion_id}},
+            upsert=True
+        ) for (organizacion_id, trigrama), diferencia in deltas.items() if diferencia
+    ]
+    if operaciones:
+        _frecuencias(coleccion).bulk_write(operaciones, ordered=False)
+
+
+def guardar_ngrams(coleccion, docs):
+    """Crea o reemplaza las entradas de n-gramas de `docs` (con _id y organizacion_id)."""
+    nuevos = {doc['_id']: (doc['organizacion_id'], build_ngrams(coleccion, doc)) for doc in docs}
+    if not nuevos:
+        return
+    anteriores = mongo.db[f'{coleccion}_ngrams'].find(
+        {'_id': {'$in': list(nuevos)}}, {'organizacion_id': 1, 'ngrams': 1}
+    )
+    deltas = defaultdict(int)
+    for anterior in anteriores:
+        for trigrama in anterior.get('ngrams') or []:
+            deltas[(anterior['organizacion_id'], trigrama)] -= 1
+    operaciones = []
+    for _id, (organizacion_id, ngrams) in nuevos.items():
+        for trigrama in ngrams:
+            deltas[(organizacion_id, trigrama)] += 1
+        operaciones.append(ReplaceOne(
+            {'_id': _id}, {'organizacion_id': organizacion_id, 'ngrams': ngrams}, upsert=True
+        ))
+    mongo.db[f'{coleccion}_ngrams'].bulk_write(operaciones, ordered=False)
+    _ajustar_frecuencias(coleccion, deltas)
+
+
+def refresh_ngrams(coleccion, doc_id):
+    """Recalcula la entrada de n-gramas de un documento (o la elimina si ya no existe)."""
+    campos = {campo: 1 for campo in NGRAM_FIELDS[coleccion]}
+    doc = mongo.db[coleccion].find_one({'_id': ObjectId(doc_id)}, {**campos, 'organizacion_id': 1})
+    if doc:
+        guardar_ngrams(coleccion, [doc])
+    else:
+        eliminar_ngrams(coleccion, doc_id)
+
+
+def eliminar_ngrams(coleccion, doc_id):
+    eliminado = mongo.db[f'{coleccion}_ngrams'].find_one_and_delete({'_id': ObjectId(doc_id)})
+    if eliminado:
+        _ajustar_frecuencias(coleccion, {
+            (eliminado['organizacion_id'], trigrama): -1 for trigrama in eliminado.get('ngrams') or []
+        })
+
+
+def _trigramas_selectivos(coleccion, organizacion_id, trigramas, minimo, tope):
+    """
+    (trigramas para el $in, coincidencias exigidas). Un documento que comparte
+    al menos `minimo` de los n trigramas contiene por fuerza alguno de
+    cualesquiera n - minimo + 1 de ellos: filtrar por los más raros no pierde
+    resultados. Si aun así los candidatos estimados pasan de `tope` (término
+    formado solo por trigramas comunes) se exige una coincidencia más hasta
+    quedar por debajo; (None, n) significa que deben estar todos ($all).
+    Las frecuencias se leen con una sola consulta por _id.
+    """
+    frecuencias = {
+        doc['_id'].partition(':')[2]: max(doc.get('cantidad', 0), 0)
+        for doc in _frecuencias(coleccion).find(
+            {'_id': {'$in': [f'{organizacion_id}:{trigrama}' for trigrama in trigramas]}}, {'cantidad': 1}
+        )
+    }
+    ordenados = sorted(trigramas, key=lambda trigrama: frecuencias.get(trigrama, 0))
+    for exigido in range(minimo, len(trigramas) + 1):
+        filtro = ordenados[:len(trigramas) - exigido + 1]
+        if sum(frecuencias.get(trigrama, 0) for trigrama in filtro) <= tope:
+            return filtro, exigido
+    return None, len(trigramas)
+
+
+def buscar_ngrams(coleccion, organizacion_id, termino, limit=10):
+    """
+    [(doc_id, puntaje)] de los documentos más parecidos a `termino`, de mayor a
+    menor puntaje (fracción de los trigramas del término que tiene el
+    documento). Se descartan los que no llegan a FUZZY_SEARCH_MIN_SCORE.
+    Los candidatos salen de los trigramas más raros del término y todos se
+    puntúan antes de cortar en `limit`. Cuando pasarían de
+    FUZZY_SEARCH_CANDIDATES se exige un puntaje mayor en lugar de truncarlos.
+    """
+    trigramas = trigramas_consulta(termino)
+    if not trigramas:
+        return []
+    org_id = ObjectId(organizacion_id)
+    minimo = max(math.ceil(len(trigramas) * current_app.config.get('FUZZY_SEARCH_MIN_SCORE', 0.34)), 1)
+    filtro, exigido = _trigramas_selectivos(
+        coleccion, org_id, trigramas, minimo, current_app.config.get('FUZZY_SEARCH_CANDIDATES', 5000)
+    )
+    pipeline = [
+        {'$match': {'organizacion_id': org_id, 'ngrams': {'$in': filtro} if filtro else {'$all': trigramas}}},
+        {'$project': {'comunes': {'$size': {'$setIntersection': ['$ngrams', trigramas]}}}},
+        {'$match': {'comunes': {'$gte': exigido}}},
+        {'$sort': {'comunes': -1, '_id': -1}},
+        {'$limit': limit},
+    ]
+    return [
+        (doc['_id'], doc['comunes'] / len(trigramas))
+        for doc in mongo.db[f'{coleccion}_ngrams'].aggregate(pipeline)
+    ]
+
+
+def rebuild_ngrams(coleccion, organizacion_id=None, batch_size=1000):
+    """
+    Regenera las entradas de n-gramas desde la colección (toda o una
+    organización) y elimina las huérfanas. Retorna la cantidad de documentos.
+    """
+    filtro = {'organizacion_id': ObjectId(organizacion_id)} if organizacion_id else {}
+    campos = {campo: 1 for campo in NGRAM_FIELDS[coleccion]}
+    cursor = mongo.db[coleccion].find(filtro, {**campos, 'organizacion_id': 1}, batch_size=batch_size)
+
+    procesados = 0
+    lote = []
+    vigentes = set()
+    for doc in cursor:
+        lote.append(doc)
+        vigentes.add(doc['_id'])
+        if len(lote) >= batch_size:
+            guardar_ngrams(coleccion, lote)
+            procesados += len(lote)
+            lote = []
+    if lote:
+        guardar_ngrams(coleccion, lote)
+        procesados += len(lote)
+
+    huerfanos = [
+        doc['_id'] for doc in mongo.db[f'{coleccion}_ngrams'].find(filtro, {'_id': 1}, batch_size=batch_size)
+        if doc['_id'] not in vigentes
+    ]
+    for inicio in range(0, len(huerfanos), batch_size):
+        mongo.db[f'{coleccion}_ngrams'].delete_many({'_id': {'$in': huerfanos[inicio:inicio + batch_size]}})
+    recalcular_frecuencias(coleccion, organizacion_id)
+    return procesados
+
+
+def recalcular_frecuencias(coleccion, organizacion_id=None):
+    """Recalcula '<coleccion>_ngrams_frecuencias' desde las entradas (en el servidor, con $merge)."""
+    filtro = {'organizacion_id': ObjectId(organizacion_id)} if organizacion_id else {}
+    _frecuencias(coleccion).delete_many(filtro)
+    mongo.db[f'{coleccion}_ngrams'].aggregate([
+        {'$match': filtro},
+        {'$unwind': '$ngrams'},
+        {'$group': {
+            '_id': {'$concat': [{'$toString': '$organizacion_id'}, ':', '$ngrams']},
+            'organizacion_id': {'$first': '$organizacion_id'},
+            'cantidad': {'$sum': 1},
+        }},
+        {'$merge': {'into': f'{coleccion}_ngrams_frecuencias', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ], allowDiskUse=True)
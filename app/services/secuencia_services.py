@@ -0,0 +1,94 @@
+import threading
+from flask import current_app
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.database import mongo
+
+# ==========================================
+# SECUENCIAS ATÓMICAS POR ORGANIZACIÓN
+# ==========================================
+# Colección `secuencias`: un documento por (organización, nombre) con el último
+# valor entregado. El incremento se hace con find_one_and_update($inc), por lo que
+# dos cajeros que facturan en el mismo segundo nunca reciben el mismo número.
+#
+# Opcionalmente cada proceso puede reservar un bloque de N números de una sola vez
+# (config INVOICE_SEQUENCE_BLOCK) para no serializar la creación masiva sobre el
+# mismo documento. Con bloques > 1 los números siguen siendo únicos, pero un
+# proceso que termina sin agotar su bloque deja huecos en la numeración.
+
+_bloques = {}
+_bloques_lock = threading.Lock()
+
+
+def _clave(organizacion_id, nombre):
+    return f"{organizacion_id}:{nombre}"
+
+
+def reservar_bloque(organizacion_id, nombre='factura', cantidad=1):
+    """
+    Reserva `cantidad` números consecutivos de forma atómica.
+    Retorna (primero, ultimo) del bloque reservado.
+    """
+    for _ in range(2):
+        try:
+            doc = mongo.db.secuencias.find_one_and_update(
+                {'_id': _clave(organizacion_id, nombre)},
+                {'$inc': {'valor': int(cantidad)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            ultimo = doc['valor']
+            return ultimo - int(cantidad) + 1, ultimo
+        except DuplicateKeyError:
+            # Dos upserts simultáneos sobre un contador nuevo: el segundo reintenta
+            continue
+    raise RuntimeError(f"No se pudo reservar la secuencia {nombre} para {organizacion_id}")
+
+
+def existe_secuencia(organizacion_id, nombre):
+    return mongo.db.secuencias.count_documents({'_id': _clave(organizacion_id, nombre)}, limit=1) > 0
+
+
+def sembrar_secuencia(organizacion_id, nombre, valor):
+    """
+    Garantiza que la secuencia vaya al menos por `valor` (p. ej. al migrar
+    códigos que se generaban sin contador). Con $max nunca retrocede.
+    """
+    for _ in range(2):
+        try:
+            mongo.db.secuencias.update_one(
+                {'_id': _clave(organizacion_id, nombre)},
+                {'$max': {'valor': int(valor)}},
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            continue
+
+
+def siguiente_numero(organizacion_id, nombre='factura', bloque=None):
+    """
+    Retorna el siguiente número de la secuencia.
+    Si `bloque` > 1 se toma de un bloque reservado en memoria por este proceso.
+    """
+    if bloque is None:
+        bloque = current_app.config.get('INVOICE_SEQUENCE_BLOCK', 1)
+    bloque = max(int(bloque or 1), 1)
+
+    if bloque == 1:
+        return reservar_bloque(organizacion_id, nombre, 1)[0]
+
+    clave = _clave(organizacion_id, nombre)
+    with _bloques_lock:
+        actual = _bloques.get(clave)
+        if not actual or actual[0] > actual[1]:
+            actual = list(reservar_bloque(organizacion_id, nombre, bloque))
+            _bloques[clave] = actual
+        numero = actual[0]
+        actual[0] += 1
+        return numero
+
+
+def formatear_numero_factura(numero):
+    """Rellena con ceros a la izquierda hasta 6 dígitos."""
+    return str(numero).zfill(6)
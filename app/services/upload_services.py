@@ -0,0 +1,95 @@
+import os
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from flask import current_app
+from app.database import mongo
+from app.services.identity_services import invalidar_organizacion, invalidar_usuario
+from app.services.job_services import encolar, ErrorPermanente
+from app.services.pdf_services import invalidar_pdf_organizacion
+from app.utils.transport_util import CloudinaryUploadTransport, FakeUploadTransport
+
+# ==========================================
+# SUBIDA DE IMÁGENES EN SEGUNDO PLANO
+# ==========================================
+# La ruta lee el archivo y encola un trabajo 'subir_imagen' con el contenido;
+# el worker lo sube al proveedor (UPLOAD_TRANSPORT) y guarda la URL en el
+# documento destino. Solo se aceptan los destinos de _DESTINOS.
+
+
+def _despues_foto_usuario(documento_id):
+    invalidar_usuario(documento_id)
+
+
+def _despues_logo(documento_id):
+    invalidar_organizacion(documento_id)
+    invalidar_pdf_organizacion(documento_id)
+
+
+# (colección, campo) -> invalidaciones a ejecutar después de guardar la URL
+_DESTINOS = {
+    ('usuarios', 'foto'): _despues_foto_usuario,
+    ('organizaciones', 'logo'): _despues_logo,
+    ('gastos', 'comprobante'): None,
+}
+
+
+def get_upload_transport():
+    """
+    Transporte de imágenes de la app (UPLOAD_TRANSPORT): 'cloudinary' o 'fake'
+    (sin red, escribe en static/fake_uploads y retorna su URL local).
+    """
+    transporte = current_app.extensions.get('upload_transport')
+    if transporte is None:
+        if current_app.config.get('UPLOAD_TRANSPORT', 'cloudinary') == 'fake':
+            transporte = FakeUploadTransport(
+                os.path.join(current_app.static_folder, 'fake_uploads'),
+                f"{current_app.static_url_path}/fake_uploads"
+            )
+        else:
+            transporte = CloudinaryUploadTransport()
+        current_app.extensions['upload_transport'] = transporte
+    return transporte
+
+
+def encolar_subida(archivo, folder, coleccion, documento_id, campo, public_id=None):
+    """
+    Encola la subida de `archivo` (FileStorage) y retorna el id del trabajo.
+    Lanza ValueError si el archivo supera UPLOAD_MAX_BYTES.
+    """
+    if (coleccion, campo) not in _DESTINOS:
+        raise ValueError(f'Destino de subida no permitido: {coleccion}.{campo}')
+    contenido = archivo.read()
+    maximo = current_app.config.get('UPLOAD_MAX_BYTES', 8 * 1024 * 1024)
+    if len(contenido) > maximo:
+        raise ValueError(f'El archivo supera el máximo de {maximo // (1024 * 1024)} MB')
+    return encolar('subir_imagen', {
+        'contenido': Binary(contenido),
+        'nombre': archivo.filename,
+        'folder': folder,
+        'public_id': public_id,
+        'coleccion': coleccion,
+        'documento_id': str(documento_id),
+        'campo': campo,
+    })
+
+
+def tarea_subir_imagen(payload):
+    """Trabajo 'subir_imagen': sube el archivo y guarda la URL en el destino."""
+    destino = (payload['coleccion'], payload['campo'])
+    if destino not in _DESTINOS:
+        raise ErrorPermanente(f'Destino de subida no permitido: {destino[0]}.{destino[1]}')
+    if payload.get('contenido') is None:
+        raise ErrorPermanente('El trabajo no tiene contenido para subir')
+
+    url = get_upload_transport().subir(
+        bytes(payload['contenido']), payload['folder'],
+        public_id=payload.get('public_id'), nombre=payload.get('nombre')
+    )
+    mongo.db[payload['coleccion']].update_one(
+        {'_id': ObjectId(payload['documento_id'])},
+        {'$set': {payload['campo']: url}}
+    )
+    despues = _DESTINOS[destino]
+    if despues:
+        despues(payload['documento_id'])
+    return {'url': url}
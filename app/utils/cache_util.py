@@ -0,0 +1,74 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Valor centinela para distinguir "no está en caché" de un resultado None
+MISS = object()
+
+
+class LRUCache:
+    """
+    Caché en memoria del proceso: LRU acotado por cantidad de entradas, con TTL
+    por entrada (ttl=None = sin vencimiento, solo sale por LRU). Thread-safe.
+    Los valores se guardan por referencia: quien los lee no debe modificarlos.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entrada = self._datos.get(key)
+            if entrada is None:
+                return MISS
+            valor, expira = entrada
+            if expira is not None and expira < time.monotonic():
+                del self._datos[key]
+                return MISS
+            self._datos.move_to_end(key)
+            return valor
+
+    def set(self, key, value, ttl=None):
+        expira = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._datos[key] = (value, expira)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class RedisCache:
+    """
+    Caché compartida entre procesos sobre cualquier servidor compatible con el
+    protocolo de Redis (Redis, Valkey, KeyDB...). Requiere el paquete `redis`.
+    """
+
+    def __init__(self, url, prefix='veloce:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        datos = self.client.get(self.prefix + key)
+        return MISS if datos is None else pickle.loads(datos)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
@@ -0,0 +1,142 @@
+import threading
+from bisect import bisect_left, insort
+from app.utils.search_util import generar_search_keys, normalizar_texto, tokenizar
+
+# ==========================================
+# ÍNDICE EN MEMORIA DEL CATÁLOGO
+# ==========================================
+# Estructura por organización para el typeahead del POS y el escaneo de códigos:
+#   - `_palabras`: vocabulario ordenado de claves (las mismas search_keys que
+#     usa MongoDB). Es un trie aplanado: las palabras que empiezan por un
+#     prefijo ocupan un rango contiguo que se ubica con bisect en O(log n),
+#     con mucha menos memoria que un trie de nodos.
+#   - `_posting`: clave -> ids de los productos que la contienen.
+#   - `_por_codigo`: código exacto (y en minúsculas) -> id, para escaneos.
+# Se actualiza por producto (aplicar / quitar) sin reconstruirlo completo.
+
+# Campos que se guardan por producto (lo que necesitan el typeahead y la factura)
+CAMPOS_CATALOGO = ('nombre', 'precio', 'codigo', 'descripcion', 'tipo', 'stock')
+
+_FIN_PREFIJO = '\uffff'
+
+
+class CatalogoIndex:
+    """Índice de productos activos de una organización. Thread-safe."""
+
+    def __init__(self, productos=()):
+        self._productos = {}
+        self._claves = {}
+        self._nombres = {}
+        self._posting = {}
+        self._palabras = []
+        self._por_codigo = {}
+        self._lock = threading.RLock()
+        for producto in productos:
+            self._agregar(producto)
+        self._palabras.sort()
+
+    def __len__(self):
+        return len(self._productos)
+
+    # --- Escritura ---
+
+    def _agregar(self, producto, ordenado=False):
+        producto_id = str(producto['_id'])
+        registro = {'id': producto_id, **{c: producto.get(c) for c in CAMPOS_CATALOGO}}
+        claves = generar_search_keys(registro['nombre'], registro['codigo'])
+        self._productos[producto_id] = registro
+        self._claves[producto_id] = claves
+        self._nombres[producto_id] = normalizar_texto(registro['nombre'])
+        for clave in claves:
+            ids = self._posting.get(clave)
+            if ids is None:
+                self._posting[clave] = ids = set()
+                if ordenado:
+                    insort(self._palabras, clave)
+                else:
+                    self._palabras.append(clave)
+            ids.add(producto_id)
+        if registro['codigo']:
+            codigo = str(registro['codigo'])
+            self._por_codigo[codigo] = producto_id
+            self._por_codigo.setdefault(codigo.lower(), producto_id)
+
+    def _retirar(self, producto_id):
+        registro = self._productos.pop(producto_id, None)
+        if registro is None:
+            return
+        self._nombres.pop(producto_id, None)
+        for clave in self._claves.pop(producto_id, ()):
+            ids = self._posting.get(clave)
+            if ids is None:
+                continue
+            ids.discard(producto_id)
+            if not ids:
+                del self._posting[clave]
+                posicion = bisect_left(self._palabras, clave)
+                if posicion < len(self._palabras) and self._palabras[posicion] == clave:
+                    del self._palabras[posicion]
+        if registro['codigo']:
+            codigo = str(registro['codigo'])
+            for llave in (codigo, codigo.lower()):
+                if self._por_codigo.get(llave) == producto_id:
+                    del self._por_codigo[llave]
+
+    def aplicar(self, producto_id, producto):
+        """Reemplaza un producto (documento de MongoDB) o lo quita si es None o inactivo."""
+        producto_id = str(producto_id)
+        with self._lock:
+            self._retirar(producto_id)
+            if producto is not None and producto.get('activo', True):
+                self._agregar(producto, ordenado=True)
+
+    # --- Lectura ---
+
+    def _rango(self, prefijo):
+        inicio = bisect_left(self._palabras, prefijo)
+        return inicio, bisect_left(self._palabras, prefijo + _FIN_PREFIJO, inicio)
+
+    def buscar(self, termino, limite=10):
+        """
+        Productos cuyo nombre o código tiene palabras que empiezan por cada
+        palabra de `termino` (misma semántica que search_filter). El código
+        exacto va primero y luego los nombres que empiezan por el término.
+        El recorrido se detiene al juntar `limite` resultados.
+        """
+        tokens = tokenizar(termino)
+        if not tokens:
+            return []
+        termino = termino.strip()
+        with self._lock:
+            exacto = self._por_codigo.get(termino) or self._por_codigo.get(termino.lower())
+            encontrados = [exacto] if exacto else []
+            vistos = set(encontrados)
+
+            # Se recorre el prefijo con menos palabras en el vocabulario y se
+            # filtra por los demás
+            rangos = sorted(((self._rango(t), t) for t in set(tokens)), key=lambda r: r[0][1] - r[0][0])
+            (inicio, fin), resto = rangos[0][0], [t for _, t in rangos[1:]]
+            for posicion in range(inicio, fin):
+                for pid in self._posting[self._palabras[posicion]]:
+                    if pid in vistos:
+                        continue
+                    vistos.add(pid)
+                    if all(any(c.startswith(t) for c in self._claves[pid]) for t in resto):
+                        encontrados.append(pid)
+                        if len(encontrados) >= limite:
+                            break
+                if len(encontrados) >= limite:
+                    break
+
+            normalizado = normalizar_texto(termino)
+            encontrados.sort(key=lambda pid: (pid != exacto, not self._nombres[pid].startswith(normalizado), self._nombres[pid]))
+            return [dict(self._productos[pid]) for pid in encontrados[:limite]]
+
+    def por_codigo(self, codigo):
+        """Producto con ese código exacto (o en minúsculas), o None."""
+        if not codigo:
+            return None
+        codigo = str(codigo).strip()
+        with self._lock:
+            producto_id = self._por_codigo.get(codigo) or self._por_codigo.get(codigo.lower())
+            return dict(self._productos[producto_id]) if producto_id else None
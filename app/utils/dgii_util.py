@@ -0,0 +1,83 @@
+import re
+from datetime import datetime
+
+# ==========================================
+# VALIDACIÓN Y FORMATO PARA ARCHIVOS DGII
+# ==========================================
+
+TIPO_ID_RNC = '1'
+TIPO_ID_CEDULA = '2'
+
+# NCF tradicional (B + tipo + 8 dígitos) y e-CF (E + tipo + 10 dígitos)
+_NCF_RE = re.compile(r'^(B(01|02|03|04|11|12|13|14|15|16|17)\d{8}|E(31|32|33|34|41|43|44|45|46|47)\d{10})$')
+_NO_DIGITO = re.compile(r'\D')
+
+_PESOS_RNC = (7, 9, 8, 6, 5, 4, 3, 2)
+
+
+def limpiar_identificacion(valor):
+    """Solo los dígitos: '001-1234567-8' -> '00112345678'."""
+    return _NO_DIGITO.sub('', str(valor or ''))
+
+
+def rnc_valido(rnc):
+    """RNC de 9 dígitos con dígito verificador (módulo 11)."""
+    if len(rnc) != 9 or not rnc.isdigit():
+        return False
+    suma = sum(int(d) * p for d, p in zip(rnc[:8], _PESOS_RNC))
+    resto = suma % 11
+    verificador = 2 if resto == 0 else 1 if resto == 1 else 11 - resto
+    return verificador == int(rnc[8])
+
+
+def cedula_valida(cedula):
+    """Cédula de 11 dígitos con dígito verificador (Luhn con pesos 1,2)."""
+    if len(cedula) != 11 or not cedula.isdigit():
+        return False
+    suma = 0
+    for i, d in enumerate(cedula[:10]):
+        producto = int(d) * (1 if i % 2 == 0 else 2)
+        suma += producto // 10 + producto % 10
+    return (10 - suma % 10) % 10 == int(cedula[10])
+
+
+def validar_identificacion(valor):
+    """
+    Retorna (tipo_id, identificacion_limpia) para un RNC o cédula válido,
+    o (None, mensaje_error) si no lo es.
+    """
+    limpio = limpiar_identificacion(valor)
+    if not limpio:
+        return None, 'RNC/Cédula vacío'
+    if len(limpio) == 9:
+        return (TIPO_ID_RNC, limpio) if rnc_valido(limpio) else (None, f'RNC inválido: {valor}')
+    if len(limpio) == 11:
+        return (TIPO_ID_CEDULA, limpio) if cedula_valida(limpio) else (None, f'Cédula inválida: {valor}')
+    return None, f'RNC/Cédula con longitud incorrecta: {valor}'
+
+
+def ncf_valido(ncf):
+    return bool(ncf) and bool(_NCF_RE.match(str(ncf).strip().upper()))
+
+
+def tipo_ncf(ncf):
+    """'B01', 'B02', 'E31'... de un NCF válido."""
+    return str(ncf).strip().upper()[:3]
+
+
+def monto_dgii(valor):
+    """Monto con 2 decimales y punto, sin separador de miles."""
+    try:
+        return f'{float(valor or 0):.2f}'
+    except (TypeError, ValueError):
+        return '0.00'
+
+
+def fecha_dgii(valor):
+    """AAAAMMDD."""
+    return valor.strftime('%Y%m%d') if isinstance(valor, datetime) else ''
+
+
+def linea_dgii(campos):
+    """Registro del archivo TXT: campos separados por '|'."""
+    return '|'.join('' if c is None else str(c).replace('|', ' ') for c in campos)
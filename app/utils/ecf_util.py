@@ -0,0 +1,161 @@
+import io
+import os
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import XMLGenerator
+
+# ==========================================
+# SERIALIZADOR e-CF (XML)
+# ==========================================
+# Escribe el XML del comprobante elemento por elemento sobre un archivo
+# (XMLGenerator), sin construir el árbol en memoria. Recibe un dict plano
+# (ver ecf_services.datos_ecf) para poder ejecutarse en otro proceso sin Flask
+# ni MongoDB. La estructura sigue app/static/image/ecf.xml; la firma
+# (FechaHoraFirma / Signature) la agrega el proceso de firmado, no este módulo.
+
+# Elementos que agrega la firma y no se comparan con la muestra
+ELEMENTOS_FIRMA = ('FechaHoraFirma', 'Signature')
+
+
+def _monto(valor):
+    return f'{float(valor or 0):.2f}'
+
+
+def _cantidad(valor):
+    valor = float(valor or 0)
+    return str(int(valor)) if valor.is_integer() else f'{valor:.2f}'
+
+
+class _Escritor:
+    def __init__(self, salida):
+        self.xml = XMLGenerator(salida, encoding='utf-8', short_empty_elements=True)
+
+    def abrir(self, nombre):
+        self.xml.startElement(nombre, {})
+
+    def cerrar(self, nombre):
+        self.xml.endElement(nombre)
+
+    def campo(self, nombre, valor):
+        # Los campos vacíos se omiten (el esquema los trata como opcionales)
+        if valor is None or valor == '':
+            return
+        self.xml.startElement(nombre, {})
+        self.xml.characters(str(valor))
+        self.xml.endElement(nombre)
+
+
+def escribir_ecf(datos, salida):
+    """Escribe el e-CF de `datos` en `salida` (archivo binario abierto)."""
+    w = _Escritor(salida)
+    w.xml.startDocument()
+    w.abrir('ECF')
+    w.abrir('Encabezado')
+    w.campo('Version', '1.0')
+
+    w.abrir('IdDoc')
+    w.campo('TipoeCF', datos['tipo'])
+    w.campo('eNCF', datos['encf'])
+    w.campo('FechaVencimientoSecuencia', datos['vencimiento_secuencia'])
+    w.campo('IndicadorMontoGravado', datos['indicador_monto_gravado'])
+    w.campo('TipoIngresos', datos.get('tipo_ingresos', '01'))
+    w.campo('TipoPago', datos['tipo_pago'])
+    if datos.get('formas_pago'):
+        w.abrir('TablaFormasPago')
+        for forma, monto in datos['formas_pago']:
+            w.abrir('FormaDePago')
+            w.campo('FormaPago', forma)
+            w.campo('MontoPago', _monto(monto))
+            w.cerrar('FormaDePago')
+        w.cerrar('TablaFormasPago')
+    w.cerrar('IdDoc')
+
+    emisor = datos['emisor']
+    w.abrir('Emisor')
+    w.campo('RNCEmisor', emisor['rnc'])
+    w.campo('RazonSocialEmisor', emisor['razon_social'])
+    w.campo('DireccionEmisor', emisor.get('direccion'))
+    if emisor.get('telefono'):
+        w.abrir('TablaTelefonoEmisor')
+        w.campo('TelefonoEmisor', emisor['telefono'])
+        w.cerrar('TablaTelefonoEmisor')
+    w.campo('CorreoEmisor', emisor.get('correo'))
+    w.campo('FechaEmision', datos['fecha_emision'])
+    w.cerrar('Emisor')
+
+    comprador = datos.get('comprador') or {}
+    if comprador.get('rnc') or comprador.get('razon_social'):
+        w.abrir('Comprador')
+        w.campo('RNCComprador', comprador.get('rnc'))
+        w.campo('RazonSocialComprador', comprador.get('razon_social'))
+        w.cerrar('Comprador')
+
+    totales = datos['totales']
+    w.abrir('Totales')
+    w.campo('MontoGravadoTotal', _monto(totales['gravado']))
+    w.campo('MontoGravadoI1', _monto(totales['gravado']))
+    w.campo('ITBIS1', '18')
+    w.campo('TotalITBIS', _monto(totales['itbis']))
+    w.campo('TotalITBIS1', _monto(totales['itbis']))
+    w.campo('MontoTotal', _monto(totales['total']))
+    w.cerrar('Totales')
+    w.cerrar('Encabezado')
+
+    w.abrir('DetallesItems')
+    for numero, item in enumerate(datos['items'], start=1):
+        w.abrir('Item')
+        w.campo('NumeroLinea', numero)
+        w.campo('IndicadorFacturacion', '1') # ITBIS 18%
+        w.campo('NombreItem', item['nombre'][:80])
+        w.campo('IndicadorBienoServicio', item.get('bien_o_servicio', '1'))
+        w.campo('DescripcionItem', item.get('descripcion'))
+        w.campo('CantidadItem', _cantidad(item['cantidad']))
+        w.campo('PrecioUnitarioItem', _monto(item['precio_unitario']))
+        w.campo('MontoItem', _monto(item['monto']))
+        w.cerrar('Item')
+    w.cerrar('DetallesItems')
+    w.cerrar('ECF')
+    w.xml.endDocument()
+
+
+def escribir_ecf_archivo(trabajo):
+    """
+    Punto de entrada para el pool de procesos: trabajo = (datos, directorio).
+    Escribe <RNCEmisor><eNCF>.xml y retorna la ruta.
+    """
+    datos, directorio = trabajo
+    ruta = os.path.join(directorio, f"{datos['emisor']['rnc']}{datos['encf']}.xml")
+    with open(ruta, 'wb') as archivo:
+        escribir_ecf(datos, archivo)
+    return ruta
+
+
+def ecf_bytes(datos):
+    salida = io.BytesIO()
+    escribir_ecf(datos, salida)
+    return salida.getvalue()
+
+
+def estructura_xml(fuente, ignorar=ELEMENTOS_FIRMA):
+    """
+    Lista de rutas de elementos ('ECF/Encabezado/IdDoc/TipoeCF', ...) en orden
+    de aparición, sin los subárboles de `ignorar`. Sirve para comparar un e-CF
+    generado con la muestra sin depender de los valores.
+    """
+    rutas = []
+    pila = []
+    saltando = 0
+    for evento, elemento in iterparse(fuente, events=('start', 'end')):
+        nombre = elemento.tag.split('}')[-1]
+        if evento == 'start':
+            if saltando or nombre in ignorar:
+                saltando += 1
+                continue
+            pila.append(nombre)
+            rutas.append('/'.join(pila))
+        else:
+            if saltando:
+                saltando -= 1
+                continue
+            pila.pop()
+            elemento.clear()
+    return rutas
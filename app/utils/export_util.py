@@ -0,0 +1,89 @@
+import csv
+import io
+import os
+import tempfile
+from flask import Response, stream_with_context
+
+# ==========================================
+# EXPORTACIÓN CSV / XLSX EN STREAMING
+# ==========================================
+# `filas` es un iterable (normalmente un generador sobre un cursor de MongoDB):
+# nunca se materializa la lista completa, así que la memoria no depende del
+# tamaño del rango exportado.
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Tamaño de los trozos enviados al cliente
+_CHUNK = 64 * 1024
+
+
+def csv_stream(columnas, filas):
+    """Genera el CSV por trozos. Incluye BOM para que Excel detecte UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columnas)
+    for fila in filas:
+        writer.writerow(fila)
+        if buffer.tell() >= _CHUNK:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def xlsx_stream(columnas, filas, hoja='Reporte'):
+    """
+    Escribe el XLSX con xlsxwriter en modo constant_memory (cada fila se vuelca
+    a disco al escribir la siguiente) sobre un archivo temporal y luego lo envía
+    por trozos. Lanza RuntimeError si xlsxwriter no está instalado.
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise RuntimeError("xlsxwriter no está instalado; no se puede exportar a Excel")
+
+    descriptor, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descriptor)
+    try:
+        workbook = xlsxwriter.Workbook(ruta, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(hoja[:31])
+        negrita = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 0, columnas, negrita)
+        for numero, fila in enumerate(filas, start=1):
+            worksheet.write_row(numero, 0, fila)
+        workbook.close()
+
+        with open(ruta, 'rb') as archivo:
+            while True:
+                trozo = archivo.read(_CHUNK)
+                if not trozo:
+                    break
+                yield trozo
+    finally:
+        os.remove(ruta)
+
+
+def export_response(nombre_archivo, columnas, filas, formato):
+    """Response en streaming con el reporte en el formato pedido ('csv' o 'xlsx')."""
+    if formato == 'xlsx':
+        # Falla aquí (antes de enviar headers) si falta la dependencia
+        generador = xlsx_stream(columnas, filas, hoja=nombre_archivo)
+        primero = next(generador)
+        cuerpo = _encadenar(primero, generador)
+    else:
+        formato = 'csv'
+        cuerpo = csv_stream(columnas, filas)
+
+    response = Response(stream_with_context(cuerpo), mimetype=FORMATOS[formato])
+    response.headers['Content-Disposition'] = f'attachment; filename={nombre_archivo}.{formato}'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def _encadenar(primero, resto):
+    yield primero
+    yield from resto
@@ -0,0 +1,139 @@
+import csv
+import io
+import math
+import os
+import re
+import unicodedata
+
+# ==========================================
+# LECTURA DE ARCHIVOS DE IMPORTACIÓN (CSV / XLSX)
+# ==========================================
+# Los archivos se leen fila por fila: un CSV se decodifica por trozos y un XLSX
+# se abre con openpyxl en modo read_only, así que la memoria no depende de la
+# cantidad de filas. Cada fila sale como dict con las columnas normalizadas
+# según los alias del importador (p. ej. 'E-mail' -> 'correo').
+
+FORMATOS_IMPORTACION = ('csv', 'xlsx')
+
+CORREO_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def normalizar_columna(nombre):
+    """'Teléfono ' -> 'telefono', 'E-mail' -> 'e_mail'."""
+    texto = unicodedata.normalize('NFKD', str(nombre or '')).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+
+
+def formato_archivo(nombre_archivo):
+    """'csv' o 'xlsx' según la extensión; None si no es un formato soportado."""
+    extension = os.path.splitext(nombre_archivo or '')[1].lower().lstrip('.')
+    return extension if extension in FORMATOS_IMPORTACION else None
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        # Excel guarda teléfonos y cédulas como números
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _filas_csv(binario):
+    # El delimitador (',', ';' o tabulador) se detecta con el inicio del archivo
+    muestra = binario.read(4096).decode('utf-8-sig', errors='ignore')
+    binario.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    texto = io.TextIOWrapper(binario, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        yield from csv.reader(texto, dialecto)
+    finally:
+        texto.detach()
+
+
+def _filas_xlsx(binario):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("openpyxl no está instalado; no se pueden importar archivos de Excel")
+    libro = load_workbook(binario, read_only=True, data_only=True)
+    try:
+        for fila in libro.worksheets[0].iter_rows(values_only=True):
+            yield fila
+    finally:
+        libro.close()
+
+
+def leer_filas(binario, formato, alias):
+    """
+    Genera (numero_fila, dict) desde `binario` (archivo binario con seek).
+    La primera fila es el encabezado; `alias` mapea columnas normalizadas a
+    campos ({'email': 'correo', ...}). Las columnas desconocidas se ignoran y
+    las filas vacías se saltan. `numero_fila` es el de la hoja (encabezado = 1).
+    Lanza ValueError si falta el encabezado y RuntimeError si falta openpyxl.
+    """
+    filas = _filas_xlsx(binario) if formato == 'xlsx' else _filas_csv(binario)
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ValueError('El archivo está vacío o no tiene encabezado')
+    campos = [alias.get(normalizar_columna(c)) for c in encabezado]
+    if not any(campos):
+        raise ValueError('Ninguna columna del encabezado es reconocida')
+
+    for numero, fila in enumerate(filas, start=2):
+        registro = {campo: _texto(valor) for campo, valor in zip(campos, fila) if campo}
+        if any(registro.values()):
+            yield numero, registro
+
+
+def a_numero(texto):
+    """'RD$ 1,250.50' -> 1250.5; None si no es un número finito."""
+    try:
+        numero = float(re.sub(r'[^0-9.\-]', '', str(texto)))
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def lotes(iterable, tamano):
+    """Agrupa `iterable` en listas de hasta `tamano` elementos."""
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def contar_filas(binario, formato):
+    """
+    Filas de datos aproximadas (sin encabezado) para mostrar el progreso. En CSV
+    cuenta saltos de línea por trozos; en XLSX usa la dimensión de la hoja.
+    Retorna None si no se puede estimar. Deja el archivo al inicio.
+    """
+    try:
+        if formato == 'xlsx':
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                return None
+            libro = load_workbook(binario, read_only=True)
+            try:
+                maximo = libro.worksheets[0].max_row
+            finally:
+                libro.close()
+            return max(maximo - 1, 0) if maximo else None
+        lineas, ultimo = 0, b''
+        for trozo in iter(lambda: binario.read(1024 * 1024), b''):
+            lineas += trozo.count(b'\n')
+            ultimo = trozo
+        if ultimo and not ultimo.endswith(b'\n'):
+            lineas += 1
+        return max(lineas - 1, 0)
+    finally:
+        binario.seek(0)
@@ -0,0 +1,165 @@
+import base64
+import hashlib
+from datetime import datetime
+from math import ceil
+from bson import json_util
+from bson.objectid import ObjectId
+from flask import request, url_for
+from app.utils.cache_util import LRUCache, MISS
+
+# ==========================================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# ==========================================
+# En lugar de .skip((page-1)*per_page), cada página se pide "después de"
+# o "antes de" la última fila vista, usando el par (campo_orden, _id).
+# El cursor es opaco para el cliente: base64 de [valor, _id] en JSON extendido.
+
+COUNT_CACHE_TTL = 60  # segundos
+COUNT_CACHE_MAX_ENTRIES = 1000
+_count_cache = LRUCache(max_entries=COUNT_CACHE_MAX_ENTRIES)
+
+
+def encode_cursor(doc, sort_field):
+    """Genera el cursor opaco para la fila `doc`."""
+    payload = json_util.dumps([doc.get(sort_field), doc['_id']])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Retorna (valor, _id) o None si el cursor es inválido."""
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        valor, _id = json_util.loads(base64.urlsafe_b64decode(token + padding).decode('utf-8'))
+        return valor, _id
+    except Exception:
+        return None
+
+
+def _keyset_condition(sort_field, valor, _id, operador):
+    """Condición para filas posteriores ('$lt') o anteriores ('$gt') a (valor, _id) en orden descendente."""
+    if sort_field == '_id':
+        return {'_id': {operador: _id}}
+    condicion = {'$or': [
+        {sort_field: {operador: valor}},
+        {sort_field: valor, '_id': {operador: _id}},
+    ]}
+    # Documentos antiguos sin fecha (o con la fecha como string) ordenan después de
+    # todas las fechas en orden descendente; los incluimos al avanzar.
+    if operador == '$lt' and isinstance(valor, datetime):
+        condicion['$or'].append({sort_field: {'$not': {'$type': 'date'}}})
+    return condicion
+
+
+def _version_coleccion(collection, query):
+    """Versión de la colección para la organización del query ('' si no filtra por organización)."""
+    organizacion_id = query.get('organizacion_id') if isinstance(query, dict) else None
+    if not isinstance(organizacion_id, (ObjectId, str)) or not organizacion_id:
+        return ''
+    # Import diferido: cache_services depende de la base de datos y de flask_login
+    from app.services.cache_services import get_collection_versions
+    return get_collection_versions(organizacion_id, (collection.name,))
+
+
+def cached_count(collection, query, ttl=COUNT_CACHE_TTL):
+    """
+    count_documents con caché en memoria por (colección, query, versión de datos)
+    durante `ttl` segundos. Evita un conteo completo en cada cambio de página vía
+    HTMX; la versión de la colección en la clave hace que una escritura descarte
+    el total anterior (y que los fragmentos cacheados no guarden un total viejo).
+    """
+    version = _version_coleccion(collection, query)
+    clave = hashlib.sha1(
+        f"{collection.full_name}:{version}:{json_util.dumps(query, sort_keys=True)}".encode('utf-8')
+    ).hexdigest()
+    total = _count_cache.get(clave)
+    if total is MISS:
+        total = collection.count_documents(query)
+        _count_cache.set(clave, total, ttl)
+    return total
+
+
+def paginate_keyset(collection, query, sort_field, per_page=10, after=None, before=None, page=1, projection=None):
+    """
+    Pagina `collection` ordenando por (sort_field, _id) descendente.
+
+    - after: cursor de la última fila de la página anterior (avanzar).
+    - before: cursor de la primera fila de la página actual (retroceder).
+    - page: solo se usa como número visible; si llega sin cursor y es > 1
+      (enlaces antiguos) se recurre a skip para no romper la navegación.
+
+    Retorna (documentos, pagination). Pide per_page + 1 filas para saber si hay más.
+    """
+    page = max(int(page or 1), 1)
+    campos = [sort_field] if sort_field == '_id' else [sort_field, '_id']
+    sort_desc = [(campo, -1) for campo in campos]
+    sort_asc = [(campo, 1) for campo in campos]
+
+    cursor_after = decode_cursor(after)
+    cursor_before = decode_cursor(before) if not cursor_after else None
+
+    filtro = query
+    sort = sort_desc
+    if cursor_after:
+        filtro = {'$and': [query, _keyset_condition(sort_field, *cursor_after, '$lt')]}
+    elif cursor_before:
+        filtro = {'$and': [query, _keyset_condition(sort_field, *cursor_before, '$gt')]}
+        sort = sort_asc
+
+    cursor = collection.find(filtro, projection).sort(sort)
+    if not (cursor_after or cursor_before) and page > 1:
+        cursor = cursor.skip((page - 1) * per_page)
+    docs = list(cursor.limit(per_page + 1))
+
+    hay_mas = len(docs) > per_page
+    docs = docs[:per_page]
+    if cursor_before:
+        docs.reverse()
+        has_prev, has_next = hay_mas, True
+    elif cursor_after:
+        has_prev, has_next = True, hay_mas
+    else:
+        has_prev, has_next = page > 1, hay_mas
+
+    if cursor_before and not has_prev:
+        page = 1
+
+    total = cached_count(collection, query)
+    pages = ceil(total / per_page) if per_page else 0
+
+    pagination = {
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': max(pages, page),
+        'has_prev': has_prev,
+        'has_next': has_next,
+        'prev_num': page - 1 if has_prev else None,
+        'next_num': page + 1 if has_next else None,
+        'prev_cursor': encode_cursor(docs[0], sort_field) if docs and has_prev else None,
+        'next_cursor': encode_cursor(docs[-1], sort_field) if docs and has_next else None,
+    }
+    return docs, pagination
+
+
+def cursor_url(pagination, direccion):
+    """
+    Construye la URL de la página siguiente ('next') o anterior ('prev') para la
+    vista actual, conservando los filtros del query string. Si la paginación
+    no trae cursores (listados con skip) solo se cambia el número de página.
+    Se registra como global de Jinja en create_app.
+    """
+    args = request.args.to_dict()
+    for clave in ('after', 'before', 'page'):
+        args.pop(clave, None)
+    if direccion == 'next':
+        args['after'] = pagination.get('next_cursor')
+        args['page'] = pagination.get('next_num') or pagination.get('page', 1) + 1
+    else:
+        prev_num = pagination.get('prev_num') or pagination.get('page', 1) - 1
+        if prev_num > 1:
+            args['before'] = pagination.get('prev_cursor')
+            args['page'] = prev_num
+    args = {k: v for k, v in args.items() if v not in (None, '')}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
@@ -0,0 +1,64 @@
+import re
+import unicodedata
+
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos: 'José Núñez' -> 'jose nunez'."""
+    if texto is None:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    """Separa el texto normalizado en palabras alfanuméricas."""
+    return [t for t in _NO_ALFANUMERICO.split(normalizar_texto(texto)) if t]
+
+
+def generar_search_keys(*valores):
+    """
+    Genera la lista de claves de búsqueda para un documento a partir de sus
+    campos de texto. Además de cada palabra se agrega el valor compacto (sin
+    separadores) para que códigos como 'PROD-00012' o '001-1234567-8' se
+    encuentren escribiéndolos de corrido.
+    """
+    claves = set()
+    for valor in valores:
+        tokens = tokenizar(valor)
+        claves.update(tokens)
+        compacto = ''.join(tokens)
+        if len(tokens) > 1 and len(compacto) <= 40:
+            claves.add(compacto)
+    return sorted(claves)
+
+
+def _trigramas_palabra(palabra, abierta=False):
+    # ' jose ' -> ' jo', 'jos', 'ose', 'se '. Sin el espacio final (abierta) la
+    # palabra puede seguir: ' jos' también es prefijo de 'josefina'.
+    relleno = f' {palabra}' if abierta else f' {palabra} '
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def generar_trigramas(palabras):
+    """Trigramas (con un espacio de relleno a cada lado) de palabras ya normalizadas."""
+    trigramas = set()
+    for palabra in palabras:
+        trigramas |= _trigramas_palabra(palabra)
+    return sorted(trigramas)
+
+
+def trigramas_consulta(termino):
+    """
+    Trigramas de un término de búsqueda. La última palabra se trata como
+    incompleta (el usuario sigue escribiendo) y un término solo de dígitos
+    ('809-555-1234') se compacta como los teléfonos y cédulas guardados.
+    """
+    tokens = tokenizar(termino)
+    if len(tokens) > 1 and all(t.isdigit() for t in tokens):
+        tokens = [''.join(tokens)]
+    trigramas = set()
+    for indice, token in enumerate(tokens):
+        trigramas |= _trigramas_palabra(token, abierta=indice == len(tokens) - 1)
+    return sorted(trigramas)
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+
+# ==========================================
+# TRANSPORTES DE CORREO Y DE IMÁGENES
+# ==========================================
+# Cada proveedor externo tiene un transporte real y uno falso con la misma
+# interfaz. Los falsos no hacen llamadas de red: guardan lo enviado en memoria y
+# en disco (directorio local), para probar el flujo completo sin credenciales.
+# Los errores se propagan como excepciones: la cola de trabajos decide si
+# reintenta.
+
+
+class RateLimiter:
+    """
+    Límite de operaciones por segundo compartido entre hilos (token bucket con
+    ráfaga de `por_segundo`, mínimo 1). por_segundo <= 0 desactiva el límite.
+    """
+
+    def __init__(self, por_segundo):
+        self.por_segundo = float(por_segundo or 0)
+        self._rafaga = max(self.por_segundo, 1.0)
+        self._tokens = self._rafaga
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if self.por_segundo <= 0:
+            return
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self._rafaga, self._tokens + (ahora - self._ultimo) * self.por_segundo)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.por_segundo
+            time.sleep(espera)
+
+
+class BrevoEmailTransport:
+    """
+    Correo transaccional por Brevo (sib_api_v3_sdk, importado al usarse).
+    Un solo ApiClient por transporte: las conexiones HTTP se reutilizan entre
+    envíos (pool de `pool_size` conexiones, compartido entre hilos).
+    """
+
+    def __init__(self, api_key, remitente, pool_size=4, por_segundo=0):
+        self.api_key = api_key
+        self.remitente = remitente
+        self.pool_size = pool_size
+        self.limite = RateLimiter(por_segundo)
+        self._api = None
+        self._lock = threading.Lock()
+
+    def _api_instance(self):
+        with self._lock:
+            if self._api is None:
+                try:
+                    import sib_api_v3_sdk
+                except ImportError:
+                    raise RuntimeError("sib_api_v3_sdk no está instalado; no se puede enviar correo por Brevo")
+                configuration = sib_api_v3_sdk.Configuration()
+                configuration.api_key['api-key'] = self.api_key
+                configuration.connection_pool_maxsize = self.pool_size
+                self._api = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+            return self._api
+
+    def enviar(self, para, asunto, html):
+        import sib_api_v3_sdk
+        api_instance = self._api_instance()
+        self.limite.esperar()
+        respuesta = api_instance.send_transac_email(sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": para}],
+            sender=self.remitente,
+            subject=asunto,
+            html_content=html
+        ))
+        return respuesta.message_id
+
+
+class CloudinaryUploadTransport:
+    """Subida de imágenes a Cloudinary (configurado en create_app)."""
+
+    def subir(self, contenido, folder, public_id=None, nombre=None):
+        import cloudinary.uploader
+        opciones = {'folder': folder}
+        if public_id:
+            opciones['public_id'] = public_id
+        resultado = cloudinary.uploader.upload(contenido, **opciones)
+        return resultado.get('secure_url')
+
+
+class FakeEmailTransport:
+    """Guarda cada correo en `enviados` y como JSON en <directorio>/correos/."""
+
+    def __init__(self, directorio, por_segundo=0):
+        self.directorio = os.path.join(directorio, 'correos')
+        self.enviados = []
+        self.limite = RateLimiter(por_segundo)
+        self._lock = threading.Lock()
+
+    def enviar(self, para, asunto, html):
+        self.limite.esperar()
+        os.makedirs(self.directorio, exist_ok=True)
+        with self._lock:
+            message_id = f'fake-{time.time_ns()}'
+            mensaje = {'id': message_id, 'para': para, 'asunto': asunto, 'html': html}
+            self.enviados.append(mensaje)
+        with open(os.path.join(self.directorio, f'{message_id}.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(mensaje, archivo, ensure_ascii=False, indent=2)
+        return message_id
+
+
+class FakeUploadTransport:
+    """
+    Escribe la imagen en <directorio>/<folder>/<public_id> y retorna
+    `url_base` + la ruta relativa (p. ej. servido desde static/).
+    """
+
+    def __init__(self, directorio, url_base):
+        self.directorio = directorio
+        self.url_base = url_base.rstrip('/')
+        self.subidos = []
+
+    def subir(self, contenido, folder, public_id=None, nombre=None):
+        extension = os.path.splitext(nombre or '')[1]
+        archivo_id = public_id or f'{time.time_ns()}'
+        relativa = '/'.join(p.strip('/') for p in (folder, f'{archivo_id}{extension}') if p)
+        ruta = os.path.join(self.directorio, *relativa.split('/'))
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as archivo:
+            archivo.write(contenido)
+        url = f'{self.url_base}/{relativa}'
+        self.subidos.append(url)
+        return url
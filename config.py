@@ -1,4 +1,5 @@
 import os
+import tempfile
 from  dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +14,66 @@ class Config:
     RESEND_API_KEY = os.getenv('RESEND_API_KEY')
     BREVO_API_KEY = os.getenv('BREVO_API_KEY')
     TIMEZONE = 'America/Santo_Domingo'
+    # Aplica los índices declarados al iniciar la app (también: `flask veloce ensure-indexes`)
+    MONGO_ENSURE_INDEXES = os.getenv('MONGO_ENSURE_INDEXES', '0') == '1'
+    # Números de factura reservados por proceso en cada acceso a `secuencias` (1 = sin huecos)
+    INVOICE_SEQUENCE_BLOCK = int(os.getenv('INVOICE_SEQUENCE_BLOCK', '1'))
+    # Dashboard: hilos compartidos y tiempo máximo (ms) que se espera a cada widget
+    DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', '8'))
+    DASHBOARD_WIDGET_TIMEOUT_MS = int(os.getenv('DASHBOARD_WIDGET_TIMEOUT_MS', '2000'))
+    # Caché de reportes: 'memory' (por proceso), 'redis' (compartida, REPORT_CACHE_URL) o 'none'
+    REPORT_CACHE_BACKEND = os.getenv('REPORT_CACHE_BACKEND', 'memory')
+    REPORT_CACHE_URL = os.getenv('REPORT_CACHE_URL', 'redis://localhost:6379/0')
+    REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', '300'))
+    REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '1024'))
+    # Caché de parciales HTMX (tablas de listados) en el mismo backend, invalidada por versión de colección
+    FRAGMENT_CACHE = os.getenv('FRAGMENT_CACHE', '1') == '1'
+    FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '600'))
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', '512'))
+    # Bytecode compilado de las plantillas Jinja compartido entre workers y reinicios ('' = desactivado)
+    JINJA_BYTECODE_CACHE_DIR = os.getenv('JINJA_BYTECODE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'veloce-jinja'))
+    # Caché de usuarios/organizaciones por proceso (vida máxima de una entrada; la invalidación va por versiones_datos)
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', '60'))
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv('IDENTITY_CACHE_MAX_ENTRIES', '2048'))
+    # Segundos entre verificaciones de la versión de identidad (demora máxima para ver un cambio hecho en otro proceso)
+    IDENTITY_VERSION_CHECK_SECONDS = float(os.getenv('IDENTITY_VERSION_CHECK_SECONDS', '5'))
+    # e-CF: procesos que escriben los XML (0 = uno por CPU) y vencimiento de la secuencia autorizada (dd-mm-aaaa)
+    ECF_PROCESOS = int(os.getenv('ECF_PROCESOS', '0'))
+    ECF_VENCIMIENTO_SECUENCIA = os.getenv('ECF_VENCIMIENTO_SECUENCIA', '')
+    # Cola de trabajos (job_services): reintentos con backoff exponencial, bloqueo por trabajo y espera del worker
+    JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '5'))
+    JOBS_BACKOFF_SECONDS = int(os.getenv('JOBS_BACKOFF_SECONDS', '30'))
+    JOBS_BACKOFF_MAX_SECONDS = int(os.getenv('JOBS_BACKOFF_MAX_SECONDS', '3600'))
+    JOBS_LEASE_SECONDS = int(os.getenv('JOBS_LEASE_SECONDS', '300'))
+    JOBS_POLL_SECONDS = float(os.getenv('JOBS_POLL_SECONDS', '2'))
+    # Ejecuta los trabajos dentro del request (desarrollo sin worker)
+    JOBS_EAGER = os.getenv('JOBS_EAGER', '0') == '1'
+    # Transportes: 'brevo' / 'cloudinary' o 'fake' (sin red, ver utils/transport_util.py)
+    EMAIL_TRANSPORT = os.getenv('EMAIL_TRANSPORT', 'brevo')
+    UPLOAD_TRANSPORT = os.getenv('UPLOAD_TRANSPORT', 'cloudinary')
+    FAKE_TRANSPORT_DIR = os.getenv('FAKE_TRANSPORT_DIR', '')
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(8 * 1024 * 1024)))
+    # Correo: conexiones reutilizadas con el proveedor y límite de envíos por segundo (0 = sin límite)
+    EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '4'))
+    EMAIL_RATE_PER_SECOND = float(os.getenv('EMAIL_RATE_PER_SECOND', '10'))
+    # Cobranza: hilos de envío y minutos tras los que un envío a medias se puede reintentar
+    COBRANZA_WORKERS = int(os.getenv('COBRANZA_WORKERS', '4'))
+    COBRANZA_RECLAMO_MINUTOS = int(os.getenv('COBRANZA_RECLAMO_MINUTOS', '30'))
+    # Importación CSV/XLSX: filas por lote (una consulta y una escritura masiva por lote) y tamaño máximo del archivo
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+    IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(12 * 1024 * 1024)))
+    # Catálogo en memoria para typeahead y escaneo (catalogo_services): organizaciones en el LRU,
+    # segundos entre verificaciones de versión y cambios recientes guardados para actualizar sin recargar
+    CATALOGO_INDEX = os.getenv('CATALOGO_INDEX', '1') == '1'
+    CATALOGO_CACHE_MAX_ORGS = int(os.getenv('CATALOGO_CACHE_MAX_ORGS', '64'))
+    CATALOGO_VERSION_CHECK_SECONDS = float(os.getenv('CATALOGO_VERSION_CHECK_SECONDS', '2'))
+    CATALOGO_CAMBIOS_MAX = int(os.getenv('CATALOGO_CAMBIOS_MAX', '200'))
+    # Búsqueda difusa de clientes por trigramas (search_services): fracción mínima de trigramas en común,
+    # candidatos estimados a partir de los cuales se exige más coincidencia y resultados extra que se traen para reordenar
+    FUZZY_SEARCH = os.getenv('FUZZY_SEARCH', '1') == '1'
+    FUZZY_SEARCH_MIN_SCORE = float(os.getenv('FUZZY_SEARCH_MIN_SCORE', '0.34'))
+    FUZZY_SEARCH_CANDIDATES = int(os.getenv('FUZZY_SEARCH_CANDIDATES', '5000'))
+    FUZZY_SEARCH_OVERFETCH = int(os.getenv('FUZZY_SEARCH_OVERFETCH', '4'))
     
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.services import secuencia_services
+
+ORG = '665f1c2e8b3e4a0012345678'
+
+
+class FakeSecuencias:
+    """
+    Colección `secuencias` en memoria. Cada operación se aplica bajo un lock,
+    igual que MongoDB aplica atómicamente una escritura sobre un documento.
+    Con `upserts_duplicados` > 0, los primeros upserts sobre un _id nuevo
+    crean el documento y lanzan DuplicateKeyError (otro upsert ganó la carrera).
+    """
+
+    def __init__(self, upserts_duplicados=0):
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.upserts_duplicados = upserts_duplicados
+
+    def _upsert(self, _id):
+        if _id not in self.docs:
+            self.docs[_id] = {'_id': _id, 'valor': 0}
+            if self.upserts_duplicados > 0:
+                self.upserts_duplicados -= 1
+                raise DuplicateKeyError('E11000 duplicate key error')
+
+    def find_one_and_update(self, filtro, cambios, upsert=False, return_document=None):
+        with self.lock:
+            if upsert:
+                self._upsert(filtro['_id'])
+            doc = self.docs.get(filtro['_id'])
+            if doc is None:
+                return None
+            doc['valor'] += cambios['$inc']['valor']
+            return dict(doc)
+
+    def update_one(self, filtro, cambios, upsert=False):
+        with self.lock:
+            if upsert:
+                self._upsert(filtro['_id'])
+            doc = self.docs[filtro['_id']]
+            doc['valor'] = max(doc['valor'], cambios['$max']['valor'])
+
+    def count_documents(self, filtro, limit=0):
+        with self.lock:
+            return int(filtro['_id'] in self.docs)
+
+
+@pytest.fixture
+def secuencias(monkeypatch):
+    coleccion = FakeSecuencias()
+    monkeypatch.setattr(secuencia_services, 'mongo', SimpleNamespace(db=SimpleNamespace(secuencias=coleccion)))
+    monkeypatch.setattr(secuencia_services, '_bloques', {})
+    return coleccion
+
+
+def _en_paralelo(funcion, veces, hilos=16):
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        return list(executor.map(lambda _: funcion(), range(veces)))
+
+
+@pytest.mark.parametrize('bloque', [1, 7, 25])
+def test_siguiente_numero_concurrente_sin_duplicados_ni_huecos(secuencias, bloque):
+    # Múltiplo del bloque: todos los bloques reservados se consumen completos
+    veces = bloque * 40
+    numeros = _en_paralelo(lambda: secuencia_services.siguiente_numero(ORG, 'factura', bloque=bloque), veces)
+
+    assert len(set(numeros)) == veces
+    assert sorted(numeros) == list(range(1, veces + 1))
+    assert secuencias.docs[f'{ORG}:factura']['valor'] == veces
+
+
+def test_reservar_bloque_concurrente_sin_solapes_ni_huecos(secuencias):
+    bloques = _en_paralelo(lambda: secuencia_services.reservar_bloque(ORG, 'sku', 5), 200)
+
+    numeros = [n for primero, ultimo in bloques for n in range(primero, ultimo + 1)]
+    assert all(ultimo - primero + 1 == 5 for primero, ultimo in bloques)
+    assert sorted(numeros) == list(range(1, 1001))
+
+
+def test_secuencias_independientes_por_nombre(secuencias):
+    facturas = _en_paralelo(lambda: secuencia_services.siguiente_numero(ORG, 'factura', bloque=1), 50)
+    skus = _en_paralelo(lambda: secuencia_services.siguiente_numero(ORG, 'sku', bloque=1), 50)
+
+    assert sorted(facturas) == sorted(skus) == list(range(1, 51))
+
+
+def test_reintenta_upsert_duplicado_de_contador_nuevo(secuencias):
+    secuencias.upserts_duplicados = 1
+    numeros = _en_paralelo(lambda: secuencia_services.siguiente_numero(ORG, 'factura', bloque=1), 100)
+
+    assert sorted(numeros) == list(range(1, 101))
+
+
+def test_sembrar_secuencia_continua_sin_retroceder(secuencias):
+    secuencia_services.sembrar_secuencia(ORG, 'sku', 120)
+    secuencia_services.sembrar_secuencia(ORG, 'sku', 80)
+    numeros = _en_paralelo(lambda: secuencia_services.siguiente_numero(ORG, 'sku', bloque=4), 40)
+
+    assert sorted(numeros) == list(range(121, 161))
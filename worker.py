@@ -0,0 +1,16 @@
+import os
+import signal
+import threading
+from app import create_app
+from app.services.job_services import run_worker
+from config import config
+
+# Worker de la cola de trabajos (correos, subidas de imágenes): python worker.py
+app = create_app(config[os.getenv('VELOCE_CONFIG', 'dev')])
+
+if __name__ == '__main__':
+    detener = threading.Event()
+    # SIGTERM/SIGINT: termina el trabajo en curso y sale
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+    run_worker(app, detener=detener)